@@ -1,131 +1,754 @@
 # endpoints.py
 # Definición de rutas de la API para manejo de archivos, sugerencias IA y datos de gráficos
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from app.models import schemas
-from typing import List
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
 import logging
+import os
+import time
 import uuid
 from datetime import datetime
-from app.core.data_utils import read_file_to_df, get_dataframe_summary, aggregate_for_chart
-from app.core.ai import build_prompt, get_suggestions_from_llm
+from app.core.data_utils import (
+    aggregate_chart_frame, aggregate_many_for_chart, chart_cache_key, chart_group_key, spool_upload_to_path, list_upload_sheets,
+    upload_digest
+)
+from app.core.ai import (
+    compile_prompt, get_suggestions_from_llm, stream_suggestions_from_llm, prompt_signature, llm_requests_in_flight
+)
+from app.core.executors import run_in_stage, uses_processes
+from app.core.tasks import parse_and_summarize, parse_and_persist, read_and_summarize, aggregate_stored, aggregate_many_stored
+from app.core.dataset_store import DatasetStore
+from app.core.spill_store import ArrowSpillStore
+from app.core.suggestion_cache import SuggestionCache, summary_fingerprint
+from app.core.local_suggestions import SUGGEST_ENGINES, suggest_locally
+from app.core.cache import LRUCache
+from app.core.metrics import registry, observe_stage, time_stage, PROMPT_TOKENS
+from app.core import profiling
+from app.core.chart_formats import (
+    RECORDS, COLUMNAR_JSON, ARROW_STREAM, negotiate, to_records, to_columnar_json, to_columnar_json_batch, to_arrow_stream
+)
+from app.config import (
+    DATASET_STORE_MAX_MB, DATASET_STORE_TTL_SECONDS, DATASET_SPILL_DIR, DATASET_SPILL_TTL_SECONDS,
+    SUGGESTION_CACHE_MAX_ENTRIES, SUGGESTION_CACHE_DIR, SUGGESTION_CACHE_DISK_MAX_ENTRIES, SUGGESTION_CACHE_TTL_SECONDS,
+    SUGGESTION_CACHE_PRECISION, CHART_CACHE_MAX_ENTRIES,
+    PROFILING_ENABLED, SUGGEST_ENGINE, SUGGEST_RACE_DEADLINE_SECONDS, UPLOAD_DEDUP_MAX_ENTRIES
+)
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-# Almacenamiento temporal de DataFrames en memoria (por ID único)
-# En producción, usar Redis o base de datos
-_dataframe_cache = {}
+# Almacenamiento de DataFrames (por ID único): caché en memoria acotada por tamaño y TTL,
+# respaldada por archivos Arrow en disco para sobrevivir reinicios y compartirse entre workers
+dataset_store = DatasetStore(
+    max_bytes=int(DATASET_STORE_MAX_MB * 1024 * 1024),
+    ttl_seconds=DATASET_STORE_TTL_SECONDS,
+    spill=ArrowSpillStore(DATASET_SPILL_DIR, ttl_seconds=DATASET_SPILL_TTL_SECONDS) if DATASET_SPILL_DIR else None
+)
+
+# Sugerencias ya generadas para resúmenes equivalentes (mismo esquema y estadísticas casi idénticas)
+suggestion_cache = SuggestionCache(
+    SUGGESTION_CACHE_MAX_ENTRIES,
+    SUGGESTION_CACHE_DIR or None,
+    disk_max_entries=SUGGESTION_CACHE_DISK_MAX_ENTRIES,
+    ttl_seconds=SUGGESTION_CACHE_TTL_SECONDS,
+)
+_prompt_signature = prompt_signature()
+# Llamadas al LLM del modo "race" en curso, por huella del resumen
+_pending_llm: Dict[str, asyncio.Task] = {}
+
+# Subidas ya procesadas por (SHA-256 del contenido, extensión, hoja) → file_id original y resumen
+upload_index = LRUCache(UPLOAD_DEDUP_MAX_ENTRIES) if UPLOAD_DEDUP_MAX_ENTRIES > 0 else None
+
+# Resultados de /chart-data por (file_id, parámetros normalizados); se invalidan cuando el dataset sale del almacén
+chart_cache = LRUCache(CHART_CACHE_MAX_ENTRIES)
+dataset_store.add_removal_listener(
+    lambda file_id: chart_cache.discard_where(lambda key: key[0] == file_id)
+)
+
+# Métricas que se leen al consultar /metrics
+registry.register("dataset_store_datasets", "Datasets en la memoria del almacén", lambda: dataset_store.stats()["datasets"])
+registry.register("dataset_store_bytes", "Memoria usada por el almacén de datasets", lambda: dataset_store.stats()["total_bytes"])
+registry.register("dataset_store_max_bytes", "Presupuesto de memoria del almacén de datasets", lambda: dataset_store.max_bytes)
+registry.register("dataset_store_evictions_total", "Datasets expulsados de memoria por el presupuesto", lambda: dataset_store.stats()["evictions"], "counter")
+registry.register("dataset_store_expirations_total", "Datasets expirados por TTL", lambda: dataset_store.stats()["expirations"], "counter")
+
+
+def _cache_stats() -> Dict[str, Dict[str, Any]]:
+    suggestions = suggestion_cache.stats()
+    return {
+        "charts": chart_cache.stats(),
+        "suggestions": {**suggestions, "hits": suggestions["memory_hits"] + suggestions["disk_hits"]},
+        **({"uploads": upload_index.stats()} if upload_index is not None else {}),
+    }
+
+
+for _name, _key, _help, _type in (
+    ("cache_hits_total", "hits", "Aciertos por caché", "counter"),
+    ("cache_misses_total", "misses", "Fallos por caché", "counter"),
+    ("cache_hit_ratio", "hit_ratio", "Proporción de aciertos por caché", "gauge"),
+    ("cache_entries", "entries", "Entradas por caché", "gauge"),
+):
+    registry.register_labeled(
+        _name, _help, lambda key=_key: {(("cache", cache),): stats[key] for cache, stats in _cache_stats().items()}, _type
+    )
+registry.register("llm_requests_in_flight", "Llamadas al LLM en curso", llm_requests_in_flight)
+
+DATASET_NOT_FOUND_DETAIL = "⚠️ El archivo ya no está disponible en memoria. Esto puede ocurrir si el servidor se reinició. Por favor, sube el archivo de nuevo para generar nuevas sugerencias."
+# Headers de las respuestas SSE: sin caché y sin buffering en proxies (p. ej. nginx)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Origen de las sugerencias de /suggest (llm, local o cache) y aviso de que el LLM sigue en curso
+ENGINE_HEADER = "X-Suggestion-Engine"
+UPGRADE_HEADER = "X-Suggestion-Upgrade"
 
 router = APIRouter()
 
+
+def _dataset_not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail=DATASET_NOT_FOUND_DETAIL)
+
+
+def _chart_response(result: Dict[str, Any], media_type: str):
+    """
+    Serializa el DataFrame agregado en el formato negociado (registros JSON por defecto).
+    """
+    frame, columns = result["frame"], result["columns"]
+    with time_stage("serialize", rows=len(frame), columns=len(columns)):
+        if media_type == COLUMNAR_JSON:
+            return Response(to_columnar_json(frame, columns), media_type=COLUMNAR_JSON)
+        if media_type == ARROW_STREAM:
+            return Response(to_arrow_stream(frame, columns), media_type=ARROW_STREAM)
+        return {"data": to_records(frame), "columns": columns}
+
+
+def _dataset_shape(file_id: str):
+    # Filas y columnas del dataset para las etiquetas de tamaño de las métricas
+    stats = dataset_store.entry_stats(file_id) or {}
+    return stats.get("rows"), stats.get("columns")
+
+
+def _summary_rows(summary: Dict[str, Any]):
+    # El resumen no guarda el número de filas: se usa el mayor conteo de valores no nulos
+    counts = [stats.get("count") for stats in (summary.get("describe") or {}).values()]
+    counts = [count for count in counts if isinstance(count, (int, float))]
+    return int(max(counts)) if counts else None
+
+def _new_file_id(filename: str, sheet: Optional[str] = None) -> str:
+    name = f"{filename}_{sheet}" if sheet is not None else filename
+    return f"{name}_{uuid.uuid4().hex[:8]}_{int(datetime.now().timestamp())}"
+
+
+async def _upload_digest(file: UploadFile) -> Optional[str]:
+    # Huella del contenido para reconocer subidas repetidas (None si la deduplicación está desactivada)
+    if upload_index is None:
+        return None
+    with time_stage("hash"):
+        return await run_in_stage("io", upload_digest, file)
+
+
+def _upload_key(digest: str, filename: str, sheet: Optional[str]):
+    # La extensión decide cómo se parsea el contenido y cada hoja es un dataset distinto
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return (digest, extension, sheet)
+
+
+async def _reuse_upload(digest: Optional[str], filename: str, sheet: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Si ya se subió un archivo con el mismo contenido (y hoja) y su dataset sigue disponible,
+    registra un file_id alias que lo comparte y retorna el resumen guardado, sin parsear de nuevo.
+    """
+    if digest is None:
+        return None
+    key = _upload_key(digest, filename, sheet)
+    known = upload_index.get(key)
+    if known is None:
+        return None
+    if not dataset_store.touch(known["file_id"]):
+        # El dataset original fue expulsado o expiró: se vuelve a procesar
+        upload_index.pop(key)
+        return None
+    file_id = _new_file_id(filename, sheet)
+    await run_in_stage("io", dataset_store.add_alias, file_id, known["file_id"])
+    logger.info(f"Subida repetida: '{file_id}' es alias de '{known['file_id']}'")
+    return {
+        **known["summary"],
+        "file_id": file_id,
+        "filename": filename,
+        "sheet": sheet
+    }
+
+
+async def _parse_spooled(path: str, filename: str, sheet: Optional[str], file_id: str):
+    """
+    Parsea la copia en disco de la subida. En modo procesos el trabajador guarda él mismo el dataset
+    en el almacén persistente y el DataFrame no vuelve al servidor (se retorna None en su lugar).
+    """
+    if uses_processes("parse") and dataset_store.spill is not None:
+        return await run_in_stage("parse", parse_and_persist, path, filename, sheet, file_id)
+    return await run_in_stage("parse", parse_and_summarize, path, filename, sheet)
+
+
+async def _store_upload(df, summary: Dict[str, Any], timings: Dict[str, float], filename: str,
+                        sheet: Optional[str] = None, digest: Optional[str] = None,
+                        file_id: Optional[str] = None) -> Dict[str, Any]:
+    rows = len(df) if df is not None else _summary_rows(summary)
+    for stage, seconds in timings.items():
+        observe_stage(stage, seconds, rows=rows, columns=len(summary["columns"]))
+    
+    # Generar un ID único para este archivo (y hoja)
+    file_id = file_id or _new_file_id(filename, sheet)
+    
+    if df is not None:
+        # Guardar DataFrame en memoria (y en disco) usando el ID único como clave
+        await run_in_stage("io", dataset_store.put, file_id, df)
+        logger.info(f"DataFrame guardado en caché con ID: {file_id}")
+    else:
+        # Ya persistido por el proceso de parseo: aquí solo se registra el acceso
+        logger.info(f"Dataset persistido por el proceso de parseo con ID: {file_id}")
+    if digest is not None:
+        upload_index.put(_upload_key(digest, filename, sheet), {"file_id": file_id, "summary": summary})
+    
+    # Retornar el resumen junto con el ID único
+    return {
+        **summary,
+        "file_id": file_id,
+        "filename": filename,
+        "sheet": sheet
+    }
+
+async def _process_upload(file: UploadFile, sheet: Optional[str] = None) -> Dict[str, Any]:
+    digest = await _upload_digest(file)
+    reused = await _reuse_upload(digest, file.filename, sheet)
+    if reused is not None:
+        return reused
+    
+    # Parseo y resumen fuera del event loop (el servidor sigue atendiendo otras peticiones)
+    file_id = _new_file_id(file.filename, sheet)
+    if uses_processes("parse"):
+        # Los procesos no pueden recibir el UploadFile: se les pasa una copia en disco
+        path = await run_in_stage("io", spool_upload_to_path, file)
+        try:
+            df, summary, timings = await _parse_spooled(path, file.filename, sheet, file_id)
+        finally:
+            os.remove(path)
+    else:
+        df, summary, timings = await run_in_stage("parse", read_and_summarize, file, sheet)
+    
+    return await _store_upload(df, summary, timings, file.filename, sheet, digest, file_id)
+
 @router.post("/upload", response_model=schemas.DataFrameSummaryWithId)
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), sheet: Optional[str] = Form(None)):
     """
     Procesa realmente el archivo proporcionado y retorna un resumen de pandas.
     Guarda el DataFrame en memoria para uso posterior en /chart-data.
-    Genera un ID único para cada archivo subido.
+    Genera un ID único para cada archivo subido; si el mismo contenido ya se subió, el ID es un
+    alias del dataset existente y no se vuelve a parsear.
+    En archivos Excel se carga la hoja `sheet` (por defecto, la primera).
     """
     try:
-        df = read_file_to_df(file)
-        summary = get_dataframe_summary(df)
-        
-        # Generar un ID único para este archivo
-        file_id = f"{file.filename}_{uuid.uuid4().hex[:8]}_{int(datetime.now().timestamp())}"
-        
-        # Guardar DataFrame en memoria usando el ID único como clave
-        _dataframe_cache[file_id] = df
-        logger.info(f"DataFrame guardado en caché con ID: {file_id}")
-        
-        # Retornar el resumen junto con el ID único
-        return {
-            **summary,
-            "file_id": file_id,
-            "filename": file.filename
-        }
+        return await _process_upload(file, sheet)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error procesando archivo: {str(e)}")
 
-@router.post("/suggest", response_model=List[schemas.ChartSuggestion])
-async def get_ai_suggestions(summary: schemas.DataFrameSummary):
+@router.post("/sheets", response_model=schemas.WorkbookSheets)
+async def get_workbook_sheets(file: UploadFile = File(...)):
     """
-    Usa IA real (OpenAI) para generar sugerencias de visualización basadas en los datos reales.
+    Lista las hojas de un archivo Excel (con su tamaño declarado si se conoce) sin cargar sus datos,
+    para elegir cuáles subir con /upload o /upload/sheets.
     """
     try:
-        # Convertir el Pydantic model a dict para trabajar con él
-        summary_dict = summary.model_dump()
-        logger.info(f"Recibido resumen con {len(summary_dict.get('columns', []))} columnas")
-        
-        # Construir el prompt para la IA
-        prompt = build_prompt(summary_dict)
-        logger.debug("Prompt construido exitosamente")
-        
-        # Obtener sugerencias de la IA
-        suggestions = get_suggestions_from_llm(prompt)
-        logger.info(f"Se generaron {len(suggestions)} sugerencias de visualización")
-        
-        # Validar y convertir cada sugerencia al schema esperado
-        validated_suggestions = []
-        for sugg in suggestions:
-            # Asegurar que los parámetros estén en el formato correcto
-            params = sugg.get("parameters", {})
-            chart_params = schemas.ChartParameters(
-                x_axis=params.get("x_axis", ""),
-                y_axis=params.get("y_axis"),
-                hue=params.get("hue"),
-                agg_func=params.get("agg_func")
-            )
-            
-            chart_suggestion = schemas.ChartSuggestion(
-                title=sugg.get("title", "Gráfico sin título"),
-                chart_type=sugg.get("chart_type", "bar"),
-                parameters=chart_params,
-                insight=sugg.get("insight", "Sin insight disponible")
-            )
-            validated_suggestions.append(chart_suggestion)
-        
-        return validated_suggestions
-        
-    except ValueError as e:
+        sheets = await run_in_stage("io", list_upload_sheets, file)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error leyendo las hojas del archivo: {str(e)}")
+    return {"filename": file.filename, "sheets": sheets}
+
+@router.post("/upload/sheets", response_model=List[schemas.DataFrameSummaryWithId])
+async def upload_sheets(file: UploadFile = File(...), sheets: List[str] = Form(...)):
+    """
+    Carga varias hojas de un archivo Excel en paralelo; cada hoja se guarda como un dataset
+    independiente con su propio file_id (en el orden pedido). Las hojas de un archivo ya subido
+    reutilizan su dataset con un file_id alias.
+    """
+    sheets = list(dict.fromkeys(sheets))
+    try:
+        digest = await _upload_digest(file)
+        results = {sheet: await _reuse_upload(digest, file.filename, sheet) for sheet in sheets}
+        missing = [sheet for sheet in sheets if results[sheet] is None]
+        if missing:
+            # Una sola copia en disco que cada tarea de parseo abre por su cuenta
+            path = await run_in_stage("io", spool_upload_to_path, file)
+            file_ids = {sheet: _new_file_id(file.filename, sheet) for sheet in missing}
+            try:
+                parsed = await asyncio.gather(*(
+                    _parse_spooled(path, file.filename, sheet, file_ids[sheet]) for sheet in missing
+                ))
+            finally:
+                os.remove(path)
+            for sheet, (df, summary, timings) in zip(missing, parsed):
+                results[sheet] = await _store_upload(df, summary, timings, file.filename, sheet, digest, file_ids[sheet])
+        return [results[sheet] for sheet in sheets]
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error procesando archivo: {str(e)}")
+
+def _suggest_prompt(summary_dict: Dict[str, Any], size: Dict[str, Any]) -> str:
+    with time_stage("prompt", **size):
+        compiled = compile_prompt(summary_dict)
+    PROMPT_TOKENS.observe(compiled.estimated_tokens)
+    logger.info(
+        f"Prompt de ~{compiled.estimated_tokens} tokens (presupuesto {compiled.token_budget or 'sin límite'}): "
+        f"{len(compiled.detailed_columns)} columnas con detalle, {len(compiled.compact_columns)} solo nombre, "
+        f"{len(compiled.omitted_columns)} omitidas"
+    )
+    return compiled.text
+
+def _validate_suggestion(sugg: Dict[str, Any]) -> schemas.ChartSuggestion:
+    """
+    Convierte una sugerencia del LLM al schema esperado (con valores por defecto si faltan campos).
+    """
+    # Asegurar que los parámetros estén en el formato correcto
+    params = sugg.get("parameters", {})
+    chart_params = schemas.ChartParameters(
+        x_axis=params.get("x_axis", ""),
+        y_axis=params.get("y_axis"),
+        hue=params.get("hue"),
+        agg_func=params.get("agg_func")
+    )
+    return schemas.ChartSuggestion(
+        title=sugg.get("title", "Gráfico sin título"),
+        chart_type=sugg.get("chart_type", "bar"),
+        parameters=chart_params,
+        insight=sugg.get("insight", "Sin insight disponible")
+    )
+
+def _suggest_error(e: Exception) -> HTTPException:
+    if isinstance(e, ValueError):
         error_detail = str(e)
         logger.error(f"ValueError en /suggest: {error_detail}")
         # Si el error es sobre la API key, dar instrucciones más claras
         if "OPENAI_API_KEY" in error_detail:
             error_detail += "\n\nPor favor, crea un archivo .env en la carpeta backend/ con:\nOPENAI_API_KEY=sk-tu-clave-aqui"
-        raise HTTPException(status_code=400, detail=error_detail)
+        return HTTPException(status_code=400, detail=error_detail)
+    if isinstance(e, TimeoutError):
+        return HTTPException(status_code=504, detail=str(e))
+    logger.error(f"Error inesperado en /suggest: {str(e)}", exc_info=True)
+    return HTTPException(status_code=500, detail=f"Error generando sugerencias: {str(e)}")
+
+async def _llm_suggestions(summary_dict: Dict[str, Any], fingerprint: str, size: Dict[str, Any]) -> List[schemas.ChartSuggestion]:
+    """
+    Pide las sugerencias al LLM, las valida y las guarda en la caché.
+    """
+    # Construir el prompt para la IA
+    prompt = _suggest_prompt(summary_dict, size)
+    
+    # Obtener sugerencias de la IA (cliente asíncrono compartido, no bloquea el event loop)
+    with time_stage("llm", **size):
+        suggestions = await get_suggestions_from_llm(prompt)
+    logger.info(f"Se generaron {len(suggestions)} sugerencias de visualización")
+    
+    # Validar y convertir cada sugerencia al schema esperado
+    validated_suggestions = [_validate_suggestion(sugg) for sugg in suggestions]
+    
+    suggestion_cache.put(fingerprint, [sugg.model_dump() for sugg in validated_suggestions])
+    return validated_suggestions
+
+def _llm_task(summary_dict: Dict[str, Any], fingerprint: str, size: Dict[str, Any]) -> asyncio.Task:
+    """
+    Llamada al LLM como tarea independiente de la petición (modo "race"): si vence el plazo sigue
+    en segundo plano y su resultado queda en la caché. Peticiones equivalentes comparten la tarea.
+    """
+    task = _pending_llm.get(fingerprint)
+    if task is None:
+        task = asyncio.create_task(_llm_suggestions(summary_dict, fingerprint, size))
+        _pending_llm[fingerprint] = task
+        task.add_done_callback(lambda done: _finish_llm_task(fingerprint, done))
+    return task
+
+def _finish_llm_task(fingerprint: str, task: asyncio.Task) -> None:
+    _pending_llm.pop(fingerprint, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Sugerencias del LLM (huella {fingerprint[:12]}) fallidas: {task.exception()}")
+
+def _local_suggestions(summary_dict: Dict[str, Any]) -> List[schemas.ChartSuggestion]:
+    suggestions = suggest_locally(summary_dict)
+    if not suggestions:
+        raise ValueError("No hay columnas adecuadas para sugerir gráficos")
+    logger.info(f"Se generaron {len(suggestions)} sugerencias locales")
+    return [_validate_suggestion(sugg) for sugg in suggestions]
+
+def _suggest_engine(engine: Optional[str]) -> str:
+    engine = engine or SUGGEST_ENGINE
+    if engine not in SUGGEST_ENGINES:
+        raise HTTPException(status_code=400, detail=f"engine '{engine}' no válido. Opciones: {', '.join(SUGGEST_ENGINES)}")
+    return engine
+
+async def _suggestions_for(summary_dict: Dict[str, Any], response: Response, engine: str) -> List[Any]:
+    """
+    Sugerencias para el resumen con el motor indicado (ver /suggest); anota su origen en los headers.
+    """
+    logger.info(f"Recibido resumen con {len(summary_dict.get('columns', []))} columnas (motor {engine})")
+    
+    if engine == "local":
+        response.headers[ENGINE_HEADER] = "local"
+        return _local_suggestions(summary_dict)
+    
+    # Reutilizar sugerencias de un resumen equivalente (sin llamar al LLM)
+    fingerprint = summary_fingerprint(summary_dict, SUGGESTION_CACHE_PRECISION, salt=_prompt_signature)
+    cached = suggestion_cache.get(fingerprint)
+    if cached is not None:
+        logger.info(f"Sugerencias obtenidas de caché (huella {fingerprint[:12]})")
+        response.headers[ENGINE_HEADER] = "cache"
+        return cached
+    
+    size = {"rows": _summary_rows(summary_dict), "columns": len(summary_dict.get("columns", []))}
+    if engine == "llm":
+        response.headers[ENGINE_HEADER] = "llm"
+        return await _llm_suggestions(summary_dict, fingerprint, size)
+    
+    task = _llm_task(summary_dict, fingerprint, size)
+    try:
+        # shield: al vencer el plazo se deja de esperar, pero la llamada al LLM continúa
+        suggestions = await asyncio.wait_for(asyncio.shield(task), SUGGEST_RACE_DEADLINE_SECONDS)
+        response.headers[ENGINE_HEADER] = "llm"
+        return suggestions
+    except Exception as e:
+        if task.done():
+            logger.info(f"El LLM falló ({e}); se usan las sugerencias locales")
+        else:
+            logger.info(f"El LLM no respondió en {SUGGEST_RACE_DEADLINE_SECONDS:.1f}s; se usan las sugerencias locales")
+            response.headers[UPGRADE_HEADER] = "pending"
+    response.headers[ENGINE_HEADER] = "local"
+    return _local_suggestions(summary_dict)
+
+@router.post("/suggest", response_model=List[schemas.ChartSuggestion])
+async def get_ai_suggestions(summary: schemas.DataFrameSummary, response: Response, engine: Optional[str] = None):
+    """
+    Genera sugerencias de visualización basadas en los datos reales. `engine` (por defecto SUGGEST_ENGINE):
+    - "llm": IA real (OpenAI);
+    - "local": reglas deterministas sobre la clasificación de columnas, en milisegundos;
+    - "race": el LLM con plazo SUGGEST_RACE_DEADLINE_SECONDS; si no responde a tiempo o falla se
+      devuelven las locales, y el LLM sigue en segundo plano para mejorar la siguiente petición (caché).
+    El header X-Suggestion-Engine indica el origen (llm, local o cache).
+    """
+    engine = _suggest_engine(engine)
+    try:
+        # Convertir el Pydantic model a dict para trabajar con él
+        return await _suggestions_for(summary.model_dump(), response, engine)
+    except Exception as e:
+        raise _suggest_error(e)
+
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post(
+    "/suggest/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}}
+)
+async def stream_ai_suggestions(summary: schemas.DataFrameSummary):
+    """
+    Igual que /suggest, pero como Server-Sent Events: un evento "suggestion" por gráfico en cuanto
+    el LLM termina de escribirlo, y al final "done" con el total (o "error" si falla a mitad).
+    Los errores anteriores a la primera sugerencia responden con el mismo código HTTP que /suggest.
+    """
+    summary_dict = summary.model_dump()
+    fingerprint = summary_fingerprint(summary_dict, SUGGESTION_CACHE_PRECISION, salt=_prompt_signature)
+    cached = suggestion_cache.get(fingerprint)
+    if cached is not None:
+        logger.info(f"Sugerencias obtenidas de caché (huella {fingerprint[:12]})")
+        async def replay():
+            for sugg in cached:
+                yield _sse_event("suggestion", sugg)
+            yield _sse_event("done", {"count": len(cached), "cached": True})
+        return StreamingResponse(replay(), media_type="text/event-stream", headers=SSE_HEADERS)
+    
+    size = {"rows": _summary_rows(summary_dict), "columns": len(summary_dict.get("columns", []))}
+    start = time.perf_counter()
+    suggestions = stream_suggestions_from_llm(_suggest_prompt(summary_dict, size))
+    # Se espera la primera sugerencia antes de responder: así los errores de la llamada
+    # (API key, límites, plazo) llegan como códigos HTTP y no como eventos
+    try:
+        first = _validate_suggestion(await suggestions.__anext__())
+    except StopAsyncIteration:
+        raise _suggest_error(ValueError("La respuesta está vacía (sin sugerencias)"))
     except Exception as e:
-        logger.error(f"Error inesperado en /suggest: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error generando sugerencias: {str(e)}")
+        raise _suggest_error(e)
+    observe_stage("llm_first", time.perf_counter() - start, **size)
+    
+    async def events():
+        validated = [first]
+        yield _sse_event("suggestion", first.model_dump())
+        try:
+            async for sugg in suggestions:
+                chart_suggestion = _validate_suggestion(sugg)
+                validated.append(chart_suggestion)
+                yield _sse_event("suggestion", chart_suggestion.model_dump())
+        except Exception as e:
+            error = _suggest_error(e)
+            yield _sse_event("error", {"status": error.status_code, "detail": error.detail, "count": len(validated)})
+            return
+        finally:
+            await suggestions.aclose()
+        observe_stage("llm", time.perf_counter() - start, **size)
+        logger.info(f"Se generaron {len(validated)} sugerencias de visualización (streaming)")
+        suggestion_cache.put(fingerprint, [sugg.model_dump() for sugg in validated])
+        yield _sse_event("done", {"count": len(validated), "cached": False})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
-@router.post("/chart-data", response_model=schemas.ChartData)
-async def get_chart_data(request: schemas.ChartDataRequest):
+@router.post(
+    "/chart-data",
+    response_model=schemas.ChartData,
+    responses={200: {"content": {COLUMNAR_JSON: {}, ARROW_STREAM: {}}}}
+)
+async def get_chart_data(request: schemas.ChartDataRequest, accept: Optional[str] = Header(None)):
     """
     Procesa los datos reales del DataFrame guardado y devuelve datos agregados para la gráfica.
     Usa el file_id único para buscar el DataFrame correcto.
+    Según el header Accept responde en registros JSON (por defecto), JSON por columnas
+    o stream Arrow IPC.
     """
     try:
-        file_id = request.file_id
+        media_type = negotiate(accept)
+        # Un alias (subida repetida) comparte el dataset y las gráficas en caché con el original
+        file_id = dataset_store.resolve(request.file_id)
         params = request.parameters.model_dump()
         
-        # Obtener DataFrame del caché usando el ID único
-        if file_id not in _dataframe_cache:
-            logger.warning(f"File ID '{file_id}' no encontrado en caché. IDs disponibles: {list(_dataframe_cache.keys())}")
-            raise HTTPException(
-                status_code=404, 
-                detail="⚠️ El archivo ya no está disponible en memoria. Esto puede ocurrir si el servidor se reinició. Por favor, sube el archivo de nuevo para generar nuevas sugerencias."
-            )
-        
-        df = _dataframe_cache[file_id]
         logger.info(f"Procesando datos para gráfica con file_id: {file_id}, params: {params}")
         
-        # Agregar datos según los parámetros
-        data, columns = aggregate_for_chart(df, params)
+        # Las peticiones equivalentes (mismos parámetros tras normalizar) reutilizan el resultado
+        # (solo si el dataset sigue disponible: touch registra el acceso y comprueba que exista)
+        cache_key = chart_cache_key(file_id, params)
+        cached = chart_cache.get(cache_key)
+        if cached is not None and dataset_store.touch(file_id):
+            return _chart_response(cached, media_type)
         
-        return {
-            "data": data,
+        start = time.perf_counter()
+        if uses_processes("aggregate") and dataset_store.is_persisted(file_id):
+            # El proceso de agregación reabre el dataset desde disco; aquí solo se registra el acceso
+            dataset_store.touch(file_id)
+            try:
+                frame, columns = await run_in_stage("aggregate", aggregate_stored, file_id, params)
+            except LookupError:
+                raise _dataset_not_found()
+        else:
+            # Obtener DataFrame del almacén usando el ID único (None si fue expulsado o expiró)
+            df = await run_in_stage("io", dataset_store.get, file_id)
+            if df is None:
+                logger.warning(f"File ID '{file_id}' no encontrado en caché (nunca subido, expulsado o expirado)")
+                raise _dataset_not_found()
+            frame, columns = await run_in_stage("aggregate_local", aggregate_chart_frame, df, params)
+        rows, dataset_columns = _dataset_shape(file_id)
+        observe_stage("aggregate", time.perf_counter() - start, rows, dataset_columns)
+        
+        # Se guarda el DataFrame agregado: cada petición lo serializa en su formato
+        result = {
+            "frame": frame,
             "columns": columns
         }
+        chart_cache.put(cache_key, result)
+        return _chart_response(result, media_type)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error procesando datos de gráfica: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error procesando datos: {str(e)}")
+
+@router.post(
+    "/chart-data/batch",
+    response_model=schemas.ChartDataBatch,
+    responses={200: {"content": {COLUMNAR_JSON: {}}}}
+)
+async def get_chart_data_batch(request: schemas.ChartDataBatchRequest, accept: Optional[str] = Header(None)):
+    """
+    Datos de varias gráficas del mismo archivo en una sola petición (p. ej. todas las sugerencias).
+    Las gráficas que agrupan por las mismas columnas se calculan juntas con un solo groupby,
+    y los grupos independientes se procesan en paralelo. Un error en una gráfica se reporta
+    en su resultado sin afectar al resto.
+    Acepta registros JSON (por defecto) o JSON por columnas en cada resultado.
+    """
+    media_type = negotiate(accept, offered=(RECORDS, COLUMNAR_JSON))
+    params_list = [chart.model_dump() for chart in request.charts]
+    logger.info(f"Procesando lote de {len(params_list)} gráficas con file_id: {request.file_id}")
+    results = await _chart_batch(request.file_id, params_list)
+    
+    rows = sum(len(result["frame"]) for result in results if "error" not in result)
+    with time_stage("serialize", rows=rows):
+        if media_type == COLUMNAR_JSON:
+            return Response(to_columnar_json_batch(results), media_type=COLUMNAR_JSON)
+        return {"results": _batch_records(results)}
+
+def _batch_records(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        result if "error" in result else {"data": to_records(result["frame"]), "columns": result["columns"]}
+        for result in results
+    ]
+
+async def _chart_batch(file_id: str, params_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Calcula las gráficas de un dataset (usando la caché de /chart-data). Cada resultado es
+    {"frame", "columns"} o {"error"}, en el orden de `params_list`.
+    """
+    file_id = dataset_store.resolve(file_id)
+    if not dataset_store.touch(file_id):
+        raise _dataset_not_found()
+    
+    results: List[Dict[str, Any]] = [None] * len(params_list)
+    # Gráficas pendientes agrupadas por (x_axis, hue): cada grupo comparte su groupby
+    pending: Dict[Any, List[int]] = {}
+    for i, params in enumerate(params_list):
+        try:
+            cached = chart_cache.get(chart_cache_key(file_id, params))
+            group_key = chart_group_key(params)
+        except ValueError as e:
+            results[i] = {"error": str(e)}
+            continue
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.setdefault(group_key, []).append(i)
+    
+    if pending:
+        try:
+            if uses_processes("aggregate") and dataset_store.is_persisted(file_id):
+                # Cada proceso reabre el dataset desde disco (y lo conserva en su caché)
+                async def compute(group: List[int]):
+                    return await run_in_stage("aggregate", aggregate_many_stored, file_id, [params_list[i] for i in group])
+            else:
+                df = await run_in_stage("io", dataset_store.get, file_id)
+                if df is None:
+                    raise _dataset_not_found()
+                
+                async def compute(group: List[int]):
+                    return await run_in_stage("aggregate_local", aggregate_many_for_chart, df, [params_list[i] for i in group])
+            groups = list(pending.values())
+            start = time.perf_counter()
+            computed = await asyncio.gather(*(compute(group) for group in groups))
+            observe_stage("aggregate", time.perf_counter() - start, *_dataset_shape(file_id))
+        except LookupError:
+            raise _dataset_not_found()
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error procesando lote de gráficas: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error procesando datos: {str(e)}")
+        for group, group_results in zip(groups, computed):
+            for i, result in zip(group, group_results):
+                results[i] = result
+                if "error" not in result:
+                    chart_cache.put(chart_cache_key(file_id, params_list[i]), result)
+    return results
+
+@router.post("/analyze", response_model=schemas.AnalysisResult)
+async def analyze_file(response: Response, file: UploadFile = File(...), sheet: Optional[str] = Form(None),
+                       engine: Optional[str] = Form(None), include_summary: bool = Form(False)):
+    """
+    Pipeline completo en una sola petición: sube y resume el archivo (como /upload), pide las
+    sugerencias (como /suggest, con el mismo `engine` y headers) y calcula en paralelo los datos de
+    todas las gráficas sugeridas (como /chart-data/batch). El resumen se queda en el servidor: solo
+    se incluye en la respuesta con `include_summary`.
+    """
+    engine = _suggest_engine(engine)
+    try:
+        uploaded = await _process_upload(file, sheet)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error procesando archivo: {str(e)}")
+    # Mismo dict que recibiría /suggest (fechas como texto ISO), así ambos comparten la caché de sugerencias
+    summary = schemas.DataFrameSummary.model_validate(uploaded).model_dump(mode="json")
+    try:
+        suggestions = await _suggestions_for(summary, response, engine)
+    except Exception as e:
+        raise _suggest_error(e)
+    suggestions = [
+        sugg if isinstance(sugg, schemas.ChartSuggestion) else schemas.ChartSuggestion.model_validate(sugg)
+        for sugg in suggestions
+    ]
+    
+    # Los mismos parámetros que pide cada tarjeta del dashboard, para compartir la caché de gráficas
+    params_list = [{**sugg.parameters.model_dump(), "chart_type": sugg.chart_type} for sugg in suggestions]
+    results = await _chart_batch(uploaded["file_id"], params_list)
+    with time_stage("serialize", rows=sum(len(result["frame"]) for result in results if "error" not in result)):
+        charts = _batch_records(results)
+    return {
+        "file_id": uploaded["file_id"],
+        "filename": uploaded["filename"],
+        "sheet": uploaded.get("sheet"),
+        "summary": uploaded if include_summary else None,
+        "suggestions": suggestions,
+        "charts": charts,
+    }
+
+@router.get("/datasets", response_model=schemas.DatasetStoreStats)
+async def get_dataset_store_stats():
+    """
+    Estado del almacén de datasets: memoria usada, expulsiones y estadísticas de acceso por archivo.
+    """
+    return dataset_store.stats()
+
+@router.get("/datasets/{file_id}", response_model=schemas.DatasetEntryStats)
+async def get_dataset_stats(file_id: str):
+    """
+    Estadísticas de acceso de un dataset concreto.
+    """
+    stats = dataset_store.entry_stats(file_id)
+    if stats is None:
+        raise _dataset_not_found()
+    return stats
+
+@router.delete("/datasets/{file_id}", status_code=204)
+async def delete_dataset(file_id: str):
+    """
+    Libera explícitamente un dataset del servidor.
+    """
+    if not dataset_store.delete(file_id):
+        raise _dataset_not_found()
+    logger.info(f"Dataset '{file_id}' eliminado a petición del cliente")
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Contadores de aciertos/fallos de las cachés del servidor.
+    """
+    return {
+        "suggestions": suggestion_cache.stats(),
+        "charts": chart_cache.stats(),
+        **({"uploads": upload_index.stats()} if upload_index is not None else {})
+    }
+
+def _profiling_disabled() -> HTTPException:
+    return HTTPException(status_code=404, detail="El perfilado no está habilitado (PROFILING_ENABLED).")
+
+def _profile_file(request_id: str, extension: str) -> str:
+    if not PROFILING_ENABLED:
+        raise _profiling_disabled()
+    path = profiling.report_path(request_id, extension)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado. Puede haber sido eliminado por el límite de reportes.")
+    return path
+
+@router.get("/profiles", response_model=List[schemas.ProfileReportInfo])
+async def list_profiles():
+    """
+    Reportes de perfilado guardados, del más reciente al más antiguo.
+    """
+    if not PROFILING_ENABLED:
+        raise _profiling_disabled()
+    return await run_in_stage("io", profiling.list_reports)
+
+@router.get("/profiles/{request_id}")
+async def get_profile(request_id: str):
+    """
+    Reporte en texto de una petición perfilada (id del header X-Profile-Id de su respuesta).
+    """
+    return FileResponse(_profile_file(request_id, "txt"), media_type="text/plain; charset=utf-8")
+
+@router.get("/profiles/{request_id}/raw")
+async def get_profile_raw(request_id: str):
+    """
+    Estadísticas crudas de cProfile (abrir con pstats o snakeviz).
+    """
+    return FileResponse(_profile_file(request_id, "prof"), media_type="application/octet-stream",
+                        filename=f"{request_id}.prof")
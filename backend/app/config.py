@@ -11,5 +11,103 @@ data_folder = os.environ.get("DATA_FOLDER", "./data")
 
 # Claves de API para servicios externos (ejemplo OpenAI)
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
+# URL alternativa compatible con la API de OpenAI (proxy, servidor local de pruebas); vacío usa la oficial
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "")
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
+# Máximo de llamadas simultáneas al LLM por proceso (también tamaño del pool de conexiones)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+# Timeout de cada intento y plazo total (incluidos reintentos) de una sugerencia, en segundos
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "90"))
+# Reintentos ante 429/5xx/timeouts con backoff exponencial y jitter
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.environ.get("LLM_RETRY_BASE_DELAY_SECONDS", "0.5"))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.environ.get("LLM_RETRY_MAX_DELAY_SECONDS", "8"))
+
+# Presupuesto de tokens (estimados) del prompt de /suggest: en datasets anchos las columnas menos útiles
+# se resumen o se omiten para no superarlo (ver compile_prompt en app/core/ai.py); 0 lo desactiva
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "8000"))
+
+# Motor por defecto de /suggest: "llm", "local" (reglas, sin LLM) o "race" (el LLM con plazo y las
+# sugerencias locales si no responde a tiempo); ver app/core/local_suggestions.py
+SUGGEST_ENGINE = os.environ.get("SUGGEST_ENGINE", "llm")
+SUGGEST_RACE_DEADLINE_SECONDS = float(os.environ.get("SUGGEST_RACE_DEADLINE_SECONDS", "8"))
+
+# Almacén de DataFrames en memoria (ver app/core/dataset_store.py)
+# Presupuesto total de memoria en MB medido con DataFrame.memory_usage(deep=True)
+DATASET_STORE_MAX_MB = float(os.environ.get("DATASET_STORE_MAX_MB", "512"))
+# Tiempo de vida (segundos) sin accesos antes de expirar un dataset; 0 lo desactiva
+DATASET_STORE_TTL_SECONDS = float(os.environ.get("DATASET_STORE_TTL_SECONDS", "3600"))
+# Directorio donde se persisten los datasets en formato Arrow IPC (compartido entre workers);
+# vacío desactiva la persistencia y los datasets solo viven en la memoria de cada worker
+DATASET_SPILL_DIR = os.environ.get("DATASET_SPILL_DIR", os.path.join(data_folder, "datasets"))
+# Tiempo de vida (segundos) de los archivos persistidos sin accesos; 0 lo desactiva
+DATASET_SPILL_TTL_SECONDS = float(os.environ.get("DATASET_SPILL_TTL_SECONDS", "86400"))
+
+# Caché de sugerencias por huella del resumen (ver app/core/suggestion_cache.py)
+SUGGESTION_CACHE_MAX_ENTRIES = int(os.environ.get("SUGGESTION_CACHE_MAX_ENTRIES", "256"))
+# Directorio del nivel en disco; vacío lo desactiva y solo se usa la memoria
+SUGGESTION_CACHE_DIR = os.environ.get("SUGGESTION_CACHE_DIR", os.path.join(data_folder, "suggestions"))
+# Máximo de entradas en disco (al escribir se eliminan las más antiguas); 0 lo desactiva
+SUGGESTION_CACHE_DISK_MAX_ENTRIES = int(os.environ.get("SUGGESTION_CACHE_DISK_MAX_ENTRIES", "4096"))
+# Tiempo de vida (segundos) de cada entrada en disco desde que se escribió; 0 lo desactiva
+SUGGESTION_CACHE_TTL_SECONDS = float(os.environ.get("SUGGESTION_CACHE_TTL_SECONDS", "604800"))
+# Cifras significativas al comparar estadísticas (resúmenes casi idénticos comparten entrada)
+SUGGESTION_CACHE_PRECISION = int(os.environ.get("SUGGESTION_CACHE_PRECISION", "3"))
+
+# Subidas recordadas por SHA-256 de su contenido (y hoja): volver a subir el mismo archivo reutiliza el
+# dataset y su resumen con un file_id alias, sin parsearlo de nuevo; 0 desactiva la deduplicación
+UPLOAD_DEDUP_MAX_ENTRIES = int(os.environ.get("UPLOAD_DEDUP_MAX_ENTRIES", "256"))
+
+# Caché de resultados de /chart-data por (file_id, parámetros normalizados)
+CHART_CACHE_MAX_ENTRIES = int(os.environ.get("CHART_CACHE_MAX_ENTRIES", "1024"))
+
+# Puntos máximos por gráfica si la petición no indica max_points: series ordenadas (reducidas con
+# LTTB) y scatter plots (muestreo estratificado por rejilla)
+CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", "1000"))
+SCATTER_MAX_POINTS = int(os.environ.get("SCATTER_MAX_POINTS", "500"))
+# Categorías máximas en el eje X si la petición no indica limit (el resto se agrupa en "Otros");
+# 0 desactiva el límite
+CHART_CATEGORY_LIMIT = int(os.environ.get("CHART_CATEGORY_LIMIT", "50"))
+
+# Compactación de tipos al subir un archivo (ver app/core/ingest.py)
+DTYPE_COMPACTION = os.environ.get("DTYPE_COMPACTION", "true").lower() == "true"
+# Textos con como mucho esta proporción de valores distintos se guardan como category
+CATEGORY_MAX_RATIO = float(os.environ.get("CATEGORY_MAX_RATIO", "0.5"))
+# Guardar el resto de textos como string[pyarrow] en lugar de object
+ARROW_STRINGS = os.environ.get("ARROW_STRINGS", "false").lower() == "true"
+
+# Incluir los cuartiles (25%/50%/75%) en el resumen de /upload; ordenar cada columna es lo más
+# costoso del perfil y el prompt no los usa
+SUMMARY_PERCENTILES = os.environ.get("SUMMARY_PERCENTILES", "true").lower() == "true"
+# Resumen exacto o aproximado con sketches (HyperLogLog, t-digest, Misra-Gries): "exact", "approx"
+# o "auto" (aproximado a partir de SUMMARY_APPROX_MIN_ROWS filas)
+SUMMARY_MODE = os.environ.get("SUMMARY_MODE", "auto")
+SUMMARY_APPROX_MIN_ROWS = int(os.environ.get("SUMMARY_APPROX_MIN_ROWS", "2000000"))
+# Filas por bloque al actualizar los sketches (acota la memoria adicional del resumen)
+SKETCH_CHUNK_ROWS = int(os.environ.get("SKETCH_CHUNK_ROWS", "262144"))
+
+# Perfilado bajo demanda (ver app/core/profiling.py): con PROFILING_ENABLED=true, una petición con el
+# header "X-Profile: 1" o el parámetro "?profile=1" se ejecuta bajo cProfile y su reporte se guarda
+# en PROFILING_DIR (se conservan los PROFILING_MAX_REPORTS más recientes)
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_DIR = os.environ.get("PROFILING_DIR", os.path.join(data_folder, "profiles"))
+PROFILING_MAX_REPORTS = int(os.environ.get("PROFILING_MAX_REPORTS", "50"))
+# Funciones listadas en cada sección del reporte
+PROFILING_TOP_FUNCTIONS = int(os.environ.get("PROFILING_TOP_FUNCTIONS", "40"))
+
+# Ejecutores para sacar el trabajo bloqueante del event loop (ver app/core/executors.py)
+# "process" ejecuta parseo y agregaciones en pools de procesos; "thread" los ejecuta en hilos
+CPU_EXECUTOR = os.environ.get("CPU_EXECUTOR", "process")
+# Trabajadores por etapa: un archivo grande en "parse" no ocupa los que atienden gráficas en "aggregate"
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", "2"))
+AGGREGATE_WORKERS = int(os.environ.get("AGGREGATE_WORKERS", str(max(2, os.cpu_count() or 1))))
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "8"))
+# Caché de datasets de los procesos de agregación (se leen del almacén persistente): presupuesto
+# total en MB, repartido a partes iguales entre los AGGREGATE_WORKERS procesos, y tiempo de vida
+# (segundos) sin accesos de cada dataset en esa caché
+WORKER_DATASET_CACHE_MB = float(os.environ.get("WORKER_DATASET_CACHE_MB", "512"))
+WORKER_DATASET_CACHE_TTL_SECONDS = float(os.environ.get("WORKER_DATASET_CACHE_TTL_SECONDS", "600"))
 
 # Ajusta/expande según se requiera
@@ -1,63 +1,109 @@
+import asyncio
+import hashlib
 import json
-import os
 import logging
-from typing import Dict, Any, List
-from openai import OpenAI
-from app.config import OPENAI_API_KEY
+import math
+import random
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+from app.config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, LLM_MODEL, LLM_MAX_CONCURRENCY, LLM_TIMEOUT_SECONDS,
+    LLM_CONNECT_TIMEOUT_SECONDS, LLM_DEADLINE_SECONDS, LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_DELAY_SECONDS, LLM_RETRY_MAX_DELAY_SECONDS, PROMPT_TOKEN_BUDGET
+)
+from app.core.columns import classify_columns, column_usefulness
 
 logger = logging.getLogger(__name__)
 
 
-def _extract_statistical_facts(columns: list, dtypes: dict, describe: dict) -> str:
+# Bytes UTF-8 por token, aproximado para texto en español con emojis: permite presupuestar el
+# prompt sin depender de un tokenizador
+BYTES_PER_TOKEN = 3.5
+# Columnas que siempre entran con detalle, aunque el presupuesto sea muy bajo
+MIN_DETAILED_COLUMNS = 5
+# Tokens que se reservan para las líneas que no dependen de cada columna (totales, resúmenes)
+_RESERVED_TOKENS = 200
+# Parte del presupuesto restante que puede usarse para nombrar columnas sin detalle
+_NAMES_SHARE = 0.35
+# Penalización por cada columna previa del mismo tipo al ordenar por utilidad
+_SAME_TYPE_DECAY = 0.1
+
+_FACTS_HEADER = "📊 DATOS ESTADÍSTICOS REALES DEL DATASET:\n" + "=" * 60
+_FACTS_FOOTER = (
+    "\n" + "=" * 60 + "\n"
+    "⚠️ IMPORTANTE: USA SOLO ESTOS NÚMEROS REALES EN TUS INSIGHTS\n"
+    "❌ NO INVENTES porcentajes ni estadísticas que no estén aquí"
+)
+
+
+def estimate_tokens(text: str) -> int:
     """
-    Extrae HECHOS estadísticos verificables del dataset para que la IA los use.
-    SOLO incluye números REALES de los datos, no suposiciones.
+    Tokens aproximados de un texto (por su tamaño en UTF-8).
+    """
+    return math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN)
+
+
+def _column_facts(col: str, dtype: str, col_stats: dict, errors: dict) -> List[str]:
+    """
+    Líneas de hechos estadísticos de una columna; vacío si no hay cifras que aportar.
     """
     facts = []
-    facts.append("📊 DATOS ESTADÍSTICOS REALES DEL DATASET:")
-    facts.append("=" * 60)
-    
-    for col in columns:
-        col_stats = describe.get(col, {})
-        dtype = dtypes.get(col, "unknown")
-        
-        if "int" in dtype or "float" in dtype:
-            mean = col_stats.get("mean")
-            std = col_stats.get("std")
-            min_val = col_stats.get("min")
-            max_val = col_stats.get("max")
-            count = col_stats.get("count")
-            
-            if mean is not None:
-                facts.append(f"\n'{col}' (Numérica):")
-                facts.append(f"  - Promedio: {mean:.2f}")
-                if std:
-                    facts.append(f"  - Desviación: {std:.2f}")
-                if min_val is not None and max_val is not None:
-                    facts.append(f"  - Rango: {min_val:.2f} a {max_val:.2f}")
-                if count:
-                    facts.append(f"  - Valores válidos: {int(count)}")
+    if "int" in dtype or "float" in dtype:
+        mean = col_stats.get("mean")
+        std = col_stats.get("std")
+        min_val = col_stats.get("min")
+        max_val = col_stats.get("max")
+        count = col_stats.get("count")
         
-        elif "object" in dtype or "string" in dtype:
-            unique_count = col_stats.get("unique")
-            top_value = col_stats.get("top")
-            top_freq = col_stats.get("freq")
-            count = col_stats.get("count")
-            
-            if unique_count:
-                facts.append(f"\n'{col}' (Categórica):")
-                facts.append(f"  - Categorías únicas: {int(unique_count)}")
-                if top_value and top_freq and count:
-                    percentage = (top_freq / count) * 100
-                    facts.append(f"  - Más frecuente: '{top_value}' ({int(top_freq)} veces, {percentage:.1f}%)")
-    
-    facts.append("\n" + "=" * 60)
-    facts.append("⚠️ IMPORTANTE: USA SOLO ESTOS NÚMEROS REALES EN TUS INSIGHTS")
-    facts.append("❌ NO INVENTES porcentajes ni estadísticas que no estén aquí")
+        if mean is not None:
+            facts.append(f"\n'{col}' (Numérica):")
+            facts.append(f"  - Promedio: {mean:.2f}")
+            if std:
+                facts.append(f"  - Desviación: {std:.2f}")
+            if min_val is not None and max_val is not None:
+                facts.append(f"  - Rango: {min_val:.2f} a {max_val:.2f}")
+            if count:
+                facts.append(f"  - Valores válidos: {int(count)}")
     
+    elif "object" in dtype or "string" in dtype:
+        unique_count = col_stats.get("unique")
+        top_value = col_stats.get("top")
+        top_freq = col_stats.get("freq")
+        count = col_stats.get("count")
+        
+        if unique_count:
+            unique_mark = "≈" if "unique_relative_error" in errors else ""
+            freq_mark = "≥" if errors.get("freq_max_error") else ""
+            facts.append(f"\n'{col}' (Categórica):")
+            facts.append(f"  - Categorías únicas: {unique_mark}{int(unique_count)}")
+            if top_value and top_freq and count:
+                percentage = (top_freq / count) * 100
+                facts.append(f"  - Más frecuente: '{top_value}' ({freq_mark}{int(top_freq)} veces, {freq_mark}{percentage:.1f}%)")
+    return facts
+
+
+def _extract_statistical_facts(columns: list, dtypes: dict, describe: dict, approximate: dict = None) -> str:
+    """
+    Extrae HECHOS estadísticos verificables del dataset para que la IA los use.
+    SOLO incluye números REALES de los datos, no suposiciones.
+    Con un resumen aproximado, las cifras estimadas se marcan con ≈ (o ≥ si son cotas inferiores).
+    """
+    approximate = approximate or {}
+    facts = [_FACTS_HEADER]
+    for col in columns:
+        facts.extend(_column_facts(col, dtypes.get(col, "unknown"), describe.get(col, {}), approximate.get(col, {})))
+    facts.append(_FACTS_FOOTER)
     return "\n".join(facts)
 
 
+def _pie_insight(col: str, unique_count) -> Optional[str]:
+    if isinstance(unique_count, (int, float)) and 2 <= unique_count <= 7:
+        return f"🎯 IDEAL para pie/donut: '{col}' tiene {int(unique_count)} categorías (rango perfecto 2-7)"
+    return None
+
+
 def _generate_intelligent_insights(columns: list, dtypes: dict, describe: dict, analysis: dict) -> str:
     """Genera sugerencias inteligentes de análisis basadas en el dataset."""
     insights = []
@@ -72,10 +118,9 @@ def _generate_intelligent_insights(columns: list, dtypes: dict, describe: dict,
         insights.append(f"✅ OPORTUNIDAD: Compara métricas numéricas entre categorías usando bar charts con agregaciones")
     
     for col in categorical_cols:
-        col_stats = describe.get(col, {})
-        unique_count = col_stats.get("unique", 0)
-        if isinstance(unique_count, (int, float)) and 2 <= unique_count <= 7:
-            insights.append(f"🎯 IDEAL para pie/donut: '{col}' tiene {int(unique_count)} categorías (rango perfecto 2-7)")
+        pie = _pie_insight(col, describe.get(col, {}).get("unique", 0))
+        if pie:
+            insights.append(pie)
     
     temporal_cols = analysis.get('temporal_columns', [])
     if temporal_cols and numeric_cols:
@@ -88,93 +133,36 @@ def _generate_intelligent_insights(columns: list, dtypes: dict, describe: dict,
     return "\n".join(insights) if insights else "ℹ️ Analiza las relaciones entre columnas para encontrar insights"
 
 
-def _classify_columns(columns: list, dtypes: dict, describe: dict) -> tuple:
-    """Clasifica columnas y genera análisis detallado."""
-    classification = []
-    numeric_cols = []
-    categorical_cols = []
-    temporal_cols = []
-    high_cardinality_cols = []
-    
-    for col in columns:
-        dtype = dtypes.get(col, "unknown")
-        col_stats = describe.get(col, {})
-        unique_count = col_stats.get("unique", "N/A")
-        total_count = col_stats.get("count", "N/A")
-        
-        cardinality_ratio = None
-        if isinstance(unique_count, (int, float)) and isinstance(total_count, (int, float)) and total_count > 0:
-            cardinality_ratio = unique_count / total_count
-        
-        if "int" in dtype or "float" in dtype:
-            col_type = "NUMÉRICA"
-            numeric_cols.append(col)
-            mean_val = col_stats.get("mean", "N/A")
-            suggestion = f"✅ Útil para: agregaciones (mean/sum/max/min), correlaciones, scatter plots"
-            
-        elif "object" in dtype or "string" in dtype:
-            categorical_cols.append(col)
-            if cardinality_ratio and cardinality_ratio > 0.8:
-                col_type = "IDENTIFICADOR ÚNICO"
-                high_cardinality_cols.append(col)
-                suggestion = f"❌ EVITAR: {unique_count} valores únicos (probablemente ID) → NO usar en gráficos"
-            elif isinstance(unique_count, (int, float)) and unique_count > 15:
-                col_type = "CATEGÓRICA (alta cardinalidad)"
-                high_cardinality_cols.append(col)
-                suggestion = f"⚠️ {unique_count} categorías → Solo si es crítico (limitar top 10)"
-            else:
-                col_type = "CATEGÓRICA"
-                suggestion = f"✅ {unique_count} categorías → Ideal para x_axis en bar/pie/donut"
-                
-        elif "datetime" in dtype:
-            col_type = "TEMPORAL"
-            temporal_cols.append(col)
-            suggestion = "✅ Ideal para x_axis en line/area charts (series de tiempo)"
-        else:
-            col_type = "OTRO"
-            suggestion = "⚠️ Analizar caso por caso"
-        
-        classification.append(f"  - {col}: {col_type} → {suggestion}")
-    
-    analysis = {
-        "numeric_columns": numeric_cols,
-        "categorical_columns": [c for c in categorical_cols if c not in high_cardinality_cols],
-        "temporal_columns": temporal_cols,
-        "high_cardinality_columns": high_cardinality_cols,
-        "total_rows": describe.get(columns[0], {}).get("count", "unknown") if columns else 0
-    }
-    
-    return "\n".join(classification), analysis
+@dataclass
+class CompiledPrompt:
+    """
+    Prompt listo para el LLM y cómo se repartió el presupuesto entre las columnas.
+    """
+    text: str
+    estimated_tokens: int
+    token_budget: int
+    detailed_columns: List[str]  # con clasificación y estadísticas
+    compact_columns: List[str]   # solo nombre y tipo
+    omitted_columns: List[str]   # fuera del prompt (solo se cuentan)
 
 
-def build_prompt(summary: Dict[str, Any]) -> str:
-    """Construye el prompt completo para la IA con todas las reglas y ejemplos."""
-    columns = summary.get("columns", [])
-    dtypes = summary.get("dtypes", {})
-    describe = summary.get("describe", {})
-    
-    logger.info(f"Construyendo prompt para {len(columns)} columnas")
-    
-    column_classification, analysis = _classify_columns(columns, dtypes, describe)
-    auto_insights = _generate_intelligent_insights(columns, dtypes, describe, analysis)
-    statistical_facts = _extract_statistical_facts(columns, dtypes, describe)
-    
-    prompt = f"""Eres un analista senior de datos con 15 años de experiencia en Business Intelligence y Data Science.
+# Texto fijo del prompt: se arma una vez al importar el módulo; por petición solo se insertan los datos
+_PROMPT_INTRO = """Eres un analista senior de datos con 15 años de experiencia en Business Intelligence y Data Science.
 
 🚨🚨🚨 REGLAS CRÍTICAS - LEE PRIMERO 🚨🚨🚨
 
 1. **ESTRUCTURA JSON OBLIGATORIA:**
    - Cada gráfico DEBE tener exactamente esta estructura:
-   {{
+   {
      "title": "Título Específico del Gráfico",
-     "chart_type": "bar",  // SOLO: bar, pie, donut, scatter, line, area
-     "parameters": {{
+     "chart_type": "bar",  // SOLO: bar, pie, donut, scatter, line, area, box
+     "parameters": {
        "x_axis": "nombre_columna_exacto",      // Columna del eje X
        "y_axis": "nombre_columna_exacto",      // Columna del eje Y (o null para count)
        "agg_func": "mean"                       // SOLO: mean, sum, count, max, min (NUNCA std, var, median)
-     }},
+     },
      "insight": "Descripción del propósito del gráfico (NO conclusiones)"
-   }}
+   }
 
 2. **ERROR CRÍTICO A EVITAR:**
    ❌ PROHIBIDO: "y_axis": "mean"  // ← ERROR: "mean" NO es una columna
@@ -183,7 +171,9 @@ def build_prompt(summary: Dict[str, Any]) -> str:
    ✅ CORRECTO: "y_axis": "Salario", "agg_func": "sum"
 
 3. **NOMBRES DE COLUMNAS EXACTOS:**
-   Las columnas disponibles son: {', '.join(columns)}
+   Las columnas disponibles son: """
+
+_PROMPT_RULES = """
    ⚠️ Usa estos nombres EXACTAMENTE como aparecen (respeta mayúsculas/minúsculas)
 
 4. **FUNCIONES DE AGREGACIÓN:**
@@ -199,23 +189,11 @@ def build_prompt(summary: Dict[str, Any]) -> str:
 
 📊 DATASET A ANALIZAR:
 
-Total de filas: {analysis['total_rows']}
-Columnas disponibles: {len(columns)}
-
-{column_classification}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-{statistical_facts}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-
-💡 SUGERENCIAS DE ANÁLISIS:
-{auto_insights}
+"""
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+_PROMPT_SEPARATOR = "\n\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
 
-📋 GUÍA COMPLETA POR TIPO DE GRÁFICO:
+_PROMPT_GUIDE = """📋 GUÍA COMPLETA POR TIPO DE GRÁFICO:
 
 **1. BAR / COLUMN (Comparaciones)**
    ✅ Cuándo usar: Comparar valores agregados entre categorías
@@ -224,16 +202,16 @@ Columnas disponibles: {len(columns)}
       - y_axis: Columna numérica (ej: "payment_value", "order_id")
       - agg_func: "mean", "sum", "count", "max", "min"
    ✅ Ejemplo:
-   {{
+   {
      "title": "Valor Total de Pagos por Tipo",
      "chart_type": "bar",
-     "parameters": {{
+     "parameters": {
        "x_axis": "payment_type",
        "y_axis": "payment_value",
        "agg_func": "sum"
-     }},
+     },
      "insight": "Compara el volumen de ingresos por método de pago para identificar preferencias de los clientes y optimizar opciones de pago disponibles."
-   }}
+   }
 
 **2. PIE / DONUT (Proporciones)**
    ✅ Cuándo usar: Mostrar distribución porcentual de categorías (2-7 categorías ideal)
@@ -242,14 +220,14 @@ Columnas disponibles: {len(columns)}
       - y_axis: null (contará automáticamente)
       - agg_func: null
    ✅ Ejemplo:
-   {{
+   {
      "title": "Distribución de Órdenes por Estado",
      "chart_type": "donut",
-     "parameters": {{
+     "parameters": {
        "x_axis": "order_status"
-     }},
+     },
      "insight": "Visualiza la composición porcentual de estados de órdenes para identificar cuellos de botella en el proceso de cumplimiento y evaluar eficiencia operativa."
-   }}
+   }
 
 **3. SCATTER (Correlaciones)**
    ✅ Cuándo usar: Analizar relación entre 2 variables numéricas
@@ -258,15 +236,15 @@ Columnas disponibles: {len(columns)}
       - y_axis: Columna numérica continua
       - agg_func: null (no se agrega)
    ✅ Ejemplo:
-   {{
+   {
      "title": "Relación entre Código Postal y Valor de Pago",
      "chart_type": "scatter",
-     "parameters": {{
+     "parameters": {
        "x_axis": "customer_zip_code_prefix",
        "y_axis": "payment_value"
-     }},
+     },
      "insight": "Examina si existe relación entre ubicación geográfica y monto de compra para identificar regiones de alto valor y dirigir estrategias de marketing regional."
-   }}
+   }
 
 **4. LINE / AREA (Tendencias Temporales)**
    ✅ Cuándo usar: SOLO si hay columnas de fecha/tiempo
@@ -275,16 +253,16 @@ Columnas disponibles: {len(columns)}
       - y_axis: Métrica numérica
       - agg_func: "mean", "sum", "count"
    ✅ Ejemplo:
-   {{
+   {
      "title": "Evolución de Pagos en el Tiempo",
      "chart_type": "line",
-     "parameters": {{
+     "parameters": {
        "x_axis": "order_purchase_timestamp",
        "y_axis": "payment_value",
        "agg_func": "sum"
-     }},
+     },
      "insight": "Observa tendencias temporales de ingresos para identificar estacionalidad, picos de demanda y planificar inventario o promociones."
-   }}
+   }
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
@@ -302,12 +280,14 @@ Genera EXACTAMENTE 5 visualizaciones siguiendo estas preguntas:
 
 ✅ VALIDACIONES ANTES DE RESPONDER:
 
-[ ] ¿Usé SOLO columnas de esta lista?: {', '.join(columns)}
+[ ] ¿Usé SOLO columnas de la lista de la regla 3?
 [ ] ¿Usé SOLO agg_func permitidas?: mean, sum, count, max, min
 [ ] ¿Cada y_axis es una COLUMNA REAL (no "mean" o "sum")?
 [ ] ¿Los 5 gráficos usan columnas X DIFERENTES?
 [ ] ¿Los 5 gráficos son tipos DIFERENTES?
-[ ] ¿Evité columnas con muchos valores únicos?: {', '.join(analysis['high_cardinality_columns'][:3]) if analysis['high_cardinality_columns'] else 'N/A'}
+[ ] ¿Evité columnas con muchos valores únicos?: """
+
+_PROMPT_FORMAT = """
 [ ] ¿Mis insights describen el PROPÓSITO (no conclusiones)?
 
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -317,81 +297,191 @@ Genera EXACTAMENTE 5 visualizaciones siguiendo estas preguntas:
 Responde SOLO con el array JSON (sin markdown, sin ```json, sin explicaciones):
 
 [
-  {{
+  {
     "title": "Título específico del primer gráfico",
     "chart_type": "bar",
-    "parameters": {{
+    "parameters": {
       "x_axis": "nombre_columna_exacto",
       "y_axis": "nombre_columna_exacto",
       "agg_func": "mean"
-    }},
+    },
     "insight": "Descripción del propósito y utilidad del gráfico para toma de decisiones."
-  }},
-  {{
+  },
+  {
     "title": "Título específico del segundo gráfico",
     "chart_type": "donut",
-    "parameters": {{
+    "parameters": {
       "x_axis": "nombre_columna_exacto"
-    }},
+    },
     "insight": "Descripción del propósito y utilidad del gráfico para toma de decisiones."
-  }},
-  {{
+  },
+  {
     "title": "Título específico del tercer gráfico",
     "chart_type": "scatter",
-    "parameters": {{
+    "parameters": {
       "x_axis": "nombre_columna_exacto",
       "y_axis": "nombre_columna_exacto"
-    }},
+    },
     "insight": "Descripción del propósito y utilidad del gráfico para toma de decisiones."
-  }},
-  {{
+  },
+  {
     "title": "Título específico del cuarto gráfico",
     "chart_type": "bar",
-    "parameters": {{
+    "parameters": {
       "x_axis": "nombre_columna_exacto",
       "y_axis": "nombre_columna_exacto",
       "agg_func": "sum"
-    }},
+    },
     "insight": "Descripción del propósito y utilidad del gráfico para toma de decisiones."
-  }},
-  {{
+  },
+  {
     "title": "Título específico del quinto gráfico",
     "chart_type": "line",
-    "parameters": {{
+    "parameters": {
       "x_axis": "nombre_columna_exacto",
       "y_axis": "nombre_columna_exacto",
       "agg_func": "count"
-    }},
+    },
     "insight": "Descripción del propósito y utilidad del gráfico para toma de decisiones."
-  }}
+  }
 ]
 
 🚨 RECUERDA: 
 - NO pongas "mean" o "sum" como nombre de columna en y_axis
-- SOLO usa columnas de esta lista: {', '.join(columns)}
+- SOLO usa columnas de la lista de la regla 3
 - RESPONDE SOLO CON EL JSON (sin texto adicional)
 """
-    
-    return prompt
 
+_STATIC_TOKENS = estimate_tokens(
+    _PROMPT_INTRO + _PROMPT_RULES + _PROMPT_GUIDE + _PROMPT_FORMAT + 3 * _PROMPT_SEPARATOR + _FACTS_HEADER + _FACTS_FOOTER
+)
 
-def get_suggestions_from_llm(prompt: str) -> List[Dict[str, Any]]:
-    """Llama a la API de OpenAI y devuelve las sugerencias de visualización."""
-    if not OPENAI_API_KEY:
-        raise ValueError("OPENAI_API_KEY no está configurada. Por favor, configúrala en tu archivo .env")
+
+def _group_by_type(columns: List[str], classification: dict) -> Dict[str, List[str]]:
+    groups: Dict[str, List[str]] = {}
+    for col in columns:
+        groups.setdefault(classification[col][0], []).append(col)
+    return groups
+
+
+def compile_prompt(summary: Dict[str, Any], token_budget: int = PROMPT_TOKEN_BUDGET) -> CompiledPrompt:
+    """
+    Construye el prompt dentro de un presupuesto de tokens estimados (0 = sin límite).
+    Las columnas se ordenan por utilidad (tipo, cardinalidad, nulos); las mejores entran con
+    clasificación y estadísticas, las siguientes solo con nombre y tipo, y el resto se omite
+    indicando cuántas son. Cada nombre de columna aparece una sola vez en la lista de la regla 3.
+    """
+    columns = summary.get("columns", [])
+    dtypes = summary.get("dtypes", {})
+    describe = summary.get("describe", {})
+    approximate = summary.get("approximate") or {}
     
-    content = ""
-    try:
-        logger.info("Llamando a la API de OpenAI...")
-        
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """Eres un analista de datos senior con 15 años de experiencia en BI y Data Science.
+    classification, analysis = classify_columns(columns, dtypes, describe, approximate)
+    counts = [stats.get("count") for stats in describe.values() if isinstance(stats, dict)]
+    total_rows = max((c for c in counts if isinstance(c, (int, float))), default=None)
+    scores = [column_usefulness(classification[col][0], describe.get(col, {}), total_rows) for col in columns]
+    # Cada columna adicional del mismo tipo vale algo menos, así las primeras mezclan tipos
+    # (ejes categóricos, métricas numéricas, fechas) en lugar de ser todas de uno solo
+    by_type: Dict[str, List[int]] = {}
+    for index in sorted(range(len(columns)), key=lambda i: -scores[i]):
+        by_type.setdefault(classification[columns[index]][0], []).append(index)
+    adjusted = {
+        index: scores[index] / (1 + _SAME_TYPE_DECAY * position)
+        for group in by_type.values() for position, index in enumerate(group)
+    }
+    ranked = sorted(range(len(columns)), key=lambda i: -adjusted[i])
+    
+    # Costo de cada columna con detalle y solo con su nombre (en la regla 3 y en el grupo de su tipo)
+    detail_costs, name_costs = {}, {}
+    for index in ranked:
+        col = columns[index]
+        col_stats = describe.get(col, {})
+        pie = _pie_insight(col, col_stats.get("unique")) if classification[col][0] == "CATEGÓRICA" else None
+        detail_text = "\n".join([
+            classification[col][1],
+            *_column_facts(col, dtypes.get(col, "unknown"), col_stats, approximate.get(col, {})),
+            pie or "",
+        ])
+        name_costs[index] = estimate_tokens(f"{col}, ")
+        detail_costs[index] = name_costs[index] + estimate_tokens(detail_text)
+    
+    remaining = token_budget - _STATIC_TOKENS - _RESERVED_TOKENS if token_budget > 0 else math.inf
+    if sum(detail_costs.values()) <= remaining:
+        listed = list(ranked)
+    else:
+        # Primero se decide qué columnas se nombran (hasta _NAMES_SHARE del presupuesto) y luego,
+        # por utilidad, cuáles de ellas llevan detalle con lo que queda
+        listed, names_total = [], 0
+        for index in ranked:
+            if names_total + 2 * name_costs[index] > remaining * _NAMES_SHARE:
+                break
+            listed.append(index)
+            names_total += 2 * name_costs[index]
+        remaining -= names_total
+    detailed, compact = set(), set()
+    for rank, index in enumerate(listed):
+        upgrade = detail_costs[index] - 2 * name_costs[index]
+        if not compact and (upgrade <= remaining or rank < MIN_DETAILED_COLUMNS):
+            detailed.add(index)
+            remaining -= upgrade
+        else:
+            compact.add(index)
+    
+    detailed_cols = [col for i, col in enumerate(columns) if i in detailed]
+    compact_cols = [col for i, col in enumerate(columns) if i in compact]
+    omitted_cols = [col for i, col in enumerate(columns) if i not in detailed and i not in compact]
+    
+    lines = [classification[col][1] for col in detailed_cols]
+    if compact_cols:
+        lines.append("\n  Otras columnas (menos útiles, sin estadísticas):")
+        lines.extend(f"    - {col_type}: {', '.join(group)}" for col_type, group in _group_by_type(compact_cols, classification).items())
+    if omitted_cols:
+        omitted_groups = ", ".join(f"{len(group)} {col_type}" for col_type, group in _group_by_type(omitted_cols, classification).items())
+        lines.append(f"\n  ⚠️ {len(omitted_cols)} columnas omitidas por tamaño ({omitted_groups}) → NO usarlas")
+    
+    columns_label = str(len(columns))
+    if compact_cols or omitted_cols:
+        columns_label += f" ({len(detailed_cols)} con detalle, {len(compact_cols)} solo nombre, {len(omitted_cols)} omitidas)"
+    # Sugerencias según las columnas con detalle (las más útiles)
+    detailed_set = set(detailed_cols)
+    detailed_analysis = {
+        key: [col for col in value if col in detailed_set] if isinstance(value, list) else value
+        for key, value in analysis.items()
+    }
+    high_cardinality = detailed_analysis["high_cardinality_columns"]
+    
+    text = "".join([
+        _PROMPT_INTRO, ", ".join(columns[i] for i in sorted(detailed | compact)), _PROMPT_RULES,
+        f"Total de filas: {analysis['total_rows']}\nColumnas disponibles: {columns_label}\n\n",
+        "\n".join(lines),
+        _PROMPT_SEPARATOR,
+        _extract_statistical_facts(detailed_cols, dtypes, describe, approximate),
+        _PROMPT_SEPARATOR,
+        "💡 SUGERENCIAS DE ANÁLISIS:\n",
+        _generate_intelligent_insights(detailed_cols, dtypes, describe, detailed_analysis),
+        _PROMPT_SEPARATOR,
+        _PROMPT_GUIDE,
+        ", ".join(high_cardinality[:3]) if high_cardinality else "N/A",
+        _PROMPT_FORMAT,
+    ])
+    return CompiledPrompt(
+        text=text,
+        estimated_tokens=estimate_tokens(text),
+        token_budget=token_budget,
+        detailed_columns=detailed_cols,
+        compact_columns=compact_cols,
+        omitted_columns=omitted_cols,
+    )
+
+
+def build_prompt(summary: Dict[str, Any]) -> str:
+    """Construye el prompt completo para la IA con todas las reglas y ejemplos."""
+    logger.info(f"Construyendo prompt para {len(summary.get('columns', []))} columnas")
+    return compile_prompt(summary).text
+
+
+# Instrucciones de sistema fijas (se envían en cada llamada)
+SYSTEM_PROMPT = """Eres un analista de datos senior con 15 años de experiencia en BI y Data Science.
 
 REGLAS CRÍTICAS:
 🚨 NUNCA uses "mean", "sum", "count" como nombre de columna en y_axis
@@ -416,57 +506,342 @@ ESTRUCTURA INCORRECTA (PROHIBIDA):
 
 Siempre respondes con JSON válido sin markdown.
 Tus sugerencias son inteligentes, variadas y orientadas al valor de negocio."""
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            max_tokens=2500
+
+# Cliente asíncrono compartido por todo el proceso (reutiliza el pool de conexiones HTTP)
+_client: Optional[AsyncOpenAI] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_in_flight = 0
+
+
+def _get_client() -> Tuple[AsyncOpenAI, asyncio.Semaphore]:
+    """
+    Crea (una vez por event loop) el cliente de OpenAI y el semáforo que limita las llamadas simultáneas.
+    """
+    global _client, _client_loop, _semaphore
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL or None,
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+            # Los reintentos se gestionan aquí (con jitter y dentro del plazo total)
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY)
+            ),
         )
+        _client_loop = loop
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _client, _semaphore
+
+
+async def close_llm_client() -> None:
+    """
+    Cierra el cliente compartido (al apagar la aplicación).
+    """
+    global _client, _client_loop, _semaphore
+    if _client is not None:
+        await _client.close()
+    _client, _client_loop, _semaphore = None, None, None
+
+
+def llm_requests_in_flight() -> int:
+    """
+    Número de llamadas al LLM en curso en este proceso.
+    """
+    return _in_flight
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (APITimeoutError, APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Espera antes del siguiente intento: respeta Retry-After si el servidor lo envía;
+    si no, backoff exponencial con jitter completo.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_RETRY_MAX_DELAY_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY_SECONDS, LLM_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+async def _request_with_retries(client: AsyncOpenAI, prompt: str, deadline: float, stream: bool = False):
+    """
+    Llama a chat.completions hasta `deadline` (hora del event loop), con reintentos con jitter en
+    429/5xx/timeouts. Con stream=True retorna el stream en cuanto llega la respuesta: solo se
+    reintenta al abrirlo, no a mitad de la respuesta.
+    """
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while True:
+        remaining = deadline - loop.time()
+        try:
+            return await asyncio.wait_for(
+                client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.7,
+                    max_tokens=2500,
+                    stream=stream
+                ),
+                timeout=max(remaining, 0.001)
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"La API de OpenAI no respondió en {LLM_DEADLINE_SECONDS:.0f} segundos")
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= LLM_MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+            if loop.time() + delay >= deadline:
+                raise
+            attempt += 1
+            logger.warning(f"Llamada a OpenAI falló ({e}); reintento {attempt}/{LLM_MAX_RETRIES} en {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def _create_completion(prompt: str):
+    """
+    Llama a chat.completions con un plazo total y reintentos con jitter en 429/5xx/timeouts.
+    """
+    global _in_flight
+    client, semaphore = _get_client()
+    deadline = asyncio.get_running_loop().time() + LLM_DEADLINE_SECONDS
+    async with semaphore:
+        _in_flight += 1
+        try:
+            return await _request_with_retries(client, prompt, deadline)
+        finally:
+            _in_flight -= 1
+
+
+class SuggestionStreamParser:
+    """
+    Parser incremental del array JSON de sugerencias: recibe la respuesta por fragmentos y
+    retorna cada objeto del array en cuanto se cierra. Lo anterior al "[" (p. ej. ```json) se ignora.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._buffer: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        completed = []
+        for char in text:
+            if self._finished:
+                break
+            if not self._started:
+                self._started = char == "["
+                continue
+            if self._depth == 0:
+                # Entre objetos del array: solo interesan el inicio de uno nuevo y el cierre del array
+                if char == "{":
+                    self._depth = 1
+                    self._buffer = [char]
+                elif char == "]":
+                    self._finished = True
+                continue
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    suggestion = self._decode("".join(self._buffer))
+                    if suggestion is not None:
+                        completed.append(suggestion)
+        return completed
+
+    def _decode(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            suggestion = json.loads(text)
+        except json.JSONDecodeError as e:
+            # Las sugerencias anteriores ya se enviaron: se descarta solo este objeto
+            logger.warning(f"Sugerencia con JSON inválido descartada ({e}): {text[:200]}")
+            return None
+        self.count += 1
+        return suggestion
+
+    def close(self) -> None:
+        """
+        Valida el final de la respuesta: error si no trajo ninguna sugerencia.
+        """
+        if self.count == 0:
+            raise ValueError("La respuesta está vacía (sin sugerencias)" if self._started else "La respuesta no es una lista JSON")
+        if not self._finished:
+            logger.warning(f"Respuesta de la IA truncada: se recibieron {self.count} sugerencias completas")
+
+
+def _parse_suggestions(content: str) -> List[Dict[str, Any]]:
+    """
+    Limpia el markdown que pueda traer la respuesta y la convierte en la lista de sugerencias.
+    """
+    content = content.strip()
+    if not content:
+        raise ValueError("La respuesta de la IA está vacía")
+    
+    # Limpiar markdown si existe
+    if content.startswith("```json"):
+        content = content[7:]
+    if content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    content = content.strip()
+    
+    try:
+        suggestions = json.loads(content)
+    except json.JSONDecodeError as e:
+        error_msg = f"Error parseando JSON: {str(e)}\n\nContenido recibido:\n{content[:500]}"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+    
+    if not isinstance(suggestions, list):
+        raise ValueError(f"La respuesta no es una lista. Tipo: {type(suggestions)}")
+    
+    if len(suggestions) == 0:
+        raise ValueError("La respuesta está vacía (sin sugerencias)")
+    
+    return suggestions
+
+
+def prompt_signature() -> str:
+    """
+    Identifica el modelo y las instrucciones vigentes: cambia si se edita cualquiera de los
+    prompts (la plantilla de build_prompt se renderiza con un dataset vacío) o su presupuesto de tokens.
+    """
+    template = build_prompt({"columns": [], "dtypes": {}, "describe": {}})
+    payload = "\n".join([LLM_MODEL, SYSTEM_PROMPT, template, str(PROMPT_TOKEN_BUDGET)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+async def get_suggestions_from_llm(prompt: str) -> List[Dict[str, Any]]:
+    """Llama a la API de OpenAI y devuelve las sugerencias de visualización."""
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY no está configurada. Por favor, configúrala en tu archivo .env")
+    
+    try:
+        logger.info("Llamando a la API de OpenAI...")
+        
+        response = await _create_completion(prompt)
         
         logger.info("Respuesta recibida de OpenAI")
         
         if not response.choices or not response.choices[0].message:
             raise ValueError("La respuesta de OpenAI está vacía")
         
-        content = response.choices[0].message.content.strip()
-        
-        if not content:
-            raise ValueError("La respuesta de la IA está vacía")
-        
-        # Limpiar markdown si existe
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.startswith("```"):
-            content = content[3:]
-        if content.endswith("```"):
-            content = content[:-3]
-        content = content.strip()
-        
-        suggestions = json.loads(content)
-        
-        if not isinstance(suggestions, list):
-            raise ValueError(f"La respuesta no es una lista. Tipo: {type(suggestions)}")
-        
-        if len(suggestions) == 0:
-            raise ValueError("La respuesta está vacía (sin sugerencias)")
+        suggestions = _parse_suggestions(response.choices[0].message.content or "")
         
         logger.info(f"Se recibieron {len(suggestions)} sugerencias de la IA")
         
         return suggestions
         
-    except json.JSONDecodeError as e:
-        error_msg = f"Error parseando JSON: {str(e)}"
-        if content:
-            error_msg += f"\n\nContenido recibido:\n{content[:500]}"
-        logger.error(error_msg)
-        raise ValueError(error_msg)
     except ValueError as e:
         logger.error(f"ValueError: {str(e)}")
         raise
+    except TimeoutError as e:
+        logger.error(str(e))
+        raise
     except Exception as e:
         error_msg = f"Error llamando a OpenAI: {str(e)}"
         logger.error(error_msg)
         raise Exception(error_msg)
+
+
+# Marca de fin de la respuesta en la cola de _read_suggestion_stream
+_STREAM_END = object()
+
+
+async def _read_suggestion_stream(prompt: str, queue: asyncio.Queue) -> None:
+    """
+    Lee la respuesta en streaming del LLM y deja en `queue` cada sugerencia en cuanto su objeto
+    JSON se cierra; al final, _STREAM_END o la excepción. No espera a que se consuma la cola:
+    la plaza del semáforo se libera al terminar la respuesta, vaya al ritmo que vaya el cliente.
+    """
+    global _in_flight
+    client, semaphore = _get_client()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LLM_DEADLINE_SECONDS
+    parser = SuggestionStreamParser()
+    try:
+        async with semaphore:
+            _in_flight += 1
+            try:
+                logger.info("Llamando a la API de OpenAI (streaming)...")
+                stream = await _request_with_retries(client, prompt, deadline, stream=True)
+                try:
+                    chunks = stream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0.001))
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            raise TimeoutError(f"La API de OpenAI no respondió en {LLM_DEADLINE_SECONDS:.0f} segundos")
+                        content = chunk.choices[0].delta.content if chunk.choices else None
+                        if content:
+                            for suggestion in parser.feed(content):
+                                queue.put_nowait(suggestion)
+                finally:
+                    await stream.close()
+            finally:
+                _in_flight -= 1
+        parser.close()
+        logger.info(f"Se recibieron {parser.count} sugerencias de la IA (streaming)")
+        queue.put_nowait(_STREAM_END)
+    except (ValueError, TimeoutError) as e:
+        logger.error(str(e))
+        queue.put_nowait(e)
+    except Exception as e:
+        error_msg = f"Error llamando a OpenAI: {str(e)}"
+        logger.error(error_msg)
+        queue.put_nowait(Exception(error_msg))
+
+
+async def stream_suggestions_from_llm(prompt: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Igual que get_suggestions_from_llm, pero con la respuesta en streaming: emite cada sugerencia
+    en cuanto su objeto JSON se cierra, sin esperar al resto de la respuesta. La lectura del LLM
+    corre en su propia tarea, así un cliente lento no retiene una plaza de LLM_MAX_CONCURRENCY.
+    """
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY no está configurada. Por favor, configúrala en tu archivo .env")
+    
+    queue: asyncio.Queue = asyncio.Queue()
+    reader = asyncio.create_task(_read_suggestion_stream(prompt, queue))
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # El cliente se desconectó (o falló la validación): no seguir leyendo del LLM
+        reader.cancel()
@@ -0,0 +1,109 @@
+# chart_formats.py
+# Formatos de respuesta de las gráficas (negociados con el header Accept): registros JSON por
+# defecto, JSON por columnas o stream Arrow IPC, construidos directamente desde el DataFrame agregado
+import json
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+import pydantic_core
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# Lista de objetos {columna: valor} (formato original de /chart-data)
+RECORDS = "application/json"
+# {"columns": [...], "data": {columna: [valores]}, "rows": n}: sin repetir nombres por fila
+COLUMNAR_JSON = "application/vnd.analisis.columnar+json"
+# Stream Arrow IPC con una tabla (las columnas en el orden de "columns")
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+CHART_MEDIA_TYPES = (RECORDS, COLUMNAR_JSON, ARROW_STREAM)
+
+
+def negotiate(accept: Optional[str], offered: Sequence[str] = CHART_MEDIA_TYPES) -> str:
+    """
+    Elige el formato ofrecido con mayor preferencia (parámetro q) en el header Accept.
+    Sin header, con */* o sin coincidencias se usa el formato por defecto (registros JSON).
+    """
+    if not accept:
+        return offered[0]
+    best, best_q = offered[0], 0.0
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        # Los comodines (*/*) no desplazan al formato por defecto
+        if media_type in offered and q > best_q:
+            best, best_q = media_type, q
+    return best
+
+
+def to_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    return frame.to_dict('records')
+
+
+def _column_json(series: pd.Series) -> bytes:
+    """
+    Valores de una columna como array JSON, con el mismo serializador que FastAPI usa para los
+    registros (pydantic-core): flotantes con la representación más corta que los reproduce
+    (123136.71, no 123136.710000000006403), enteros de cualquier dtype como enteros y fechas en
+    ISO 8601 como en los registros. NaN e infinitos se escriben como null (JSON válido).
+    """
+    if series.dtype.kind == "M" and getattr(series.dtype, "tz", None) is None:
+        values = _iso_datetimes(series)
+    elif series.dtype.kind in "mM" and series.hasnans:
+        # NaT no es serializable: se pasa a None (null) en una copia de tipo object
+        values = series.astype(object).where(series.notna(), None).tolist()
+    else:
+        values = series.tolist()
+    return pydantic_core.to_json(values, inf_nan_mode="null")
+
+
+def _iso_datetimes(series: pd.Series) -> List[Optional[str]]:
+    """
+    Fechas sin zona horaria en ISO 8601 con numpy, sin crear un Timestamp por valor: segundos
+    enteros y microsegundos solo si los hay, como datetime.isoformat(); NaT pasa a None.
+    """
+    micros = series.to_numpy(dtype="datetime64[us]")
+    seconds = micros.astype("datetime64[s]")
+    text = np.datetime_as_string(seconds, unit="s").astype(object)
+    fractional = micros != seconds
+    if fractional.any():
+        text[fractional] = np.datetime_as_string(micros[fractional], unit="us")
+    text[np.isnat(micros)] = None
+    return text.tolist()
+
+
+def to_columnar_json(frame: pd.DataFrame, columns: List[str]) -> bytes:
+    """
+    JSON por columnas (un array por columna), sin crear un dict de Python por fila. Cada valor
+    se escribe igual que en los registros (ver _column_json), salvo NaN/infinitos, que son null.
+    """
+    data = b",".join(json.dumps(str(col)).encode("utf-8") + b":" + _column_json(frame[col]) for col in columns)
+    return b'{"columns":' + json.dumps(columns).encode("utf-8") + b',"data":{' + data + b'},"rows":' + str(len(frame)).encode() + b"}"
+
+
+def to_columnar_json_batch(results: List[Dict[str, Any]]) -> bytes:
+    """
+    Resultados de /chart-data/batch en JSON por columnas: cada elemento es un objeto columnar
+    o {"error": "..."}.
+    """
+    items = [
+        json.dumps({"error": result["error"]}).encode("utf-8") if "error" in result
+        else to_columnar_json(result["frame"], result["columns"])
+        for result in results
+    ]
+    return b'{"results":[' + b",".join(items) + b"]}"
+
+
+def to_arrow_stream(frame: pd.DataFrame, columns: List[str]) -> bytes:
+    table = pa.Table.from_pandas(frame[columns], preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
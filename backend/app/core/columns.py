@@ -0,0 +1,91 @@
+# columns.py
+# Clasificación de columnas a partir del resumen (tipo, cardinalidad, utilidad para gráficas),
+# compartida por el compilador del prompt (app/core/ai.py) y el motor local (app/core/local_suggestions.py)
+from typing import Optional, Tuple
+
+# Utilidad de cada tipo de columna para las gráficas (ver column_usefulness)
+_TYPE_USEFULNESS = {
+    "TEMPORAL": 4.0,
+    "CATEGÓRICA": 3.5,
+    "NUMÉRICA": 3.0,
+    "CATEGÓRICA (alta cardinalidad)": 1.5,
+    "OTRO": 1.0,
+    "IDENTIFICADOR ÚNICO": 0.5,
+}
+
+
+def _classify_column(dtype: str, col_stats: dict, errors: dict) -> Tuple[str, str]:
+    """Tipo de la columna para el prompt y sugerencia de uso."""
+    unique_count = col_stats.get("unique", "N/A")
+    total_count = col_stats.get("count", "N/A")
+    # Valores distintos estimados (resumen aproximado): se muestran como ≈N
+    unique_label = f"≈{unique_count}" if "unique_relative_error" in errors else unique_count
+    
+    cardinality_ratio = None
+    if isinstance(unique_count, (int, float)) and isinstance(total_count, (int, float)) and total_count > 0:
+        cardinality_ratio = unique_count / total_count
+    
+    if "int" in dtype or "float" in dtype:
+        return "NUMÉRICA", f"✅ Útil para: agregaciones (mean/sum/max/min), correlaciones, scatter plots"
+    if "object" in dtype or "string" in dtype:
+        if cardinality_ratio and cardinality_ratio > 0.8:
+            return "IDENTIFICADOR ÚNICO", f"❌ EVITAR: {unique_label} valores únicos (probablemente ID) → NO usar en gráficos"
+        if isinstance(unique_count, (int, float)) and unique_count > 15:
+            return "CATEGÓRICA (alta cardinalidad)", f"⚠️ {unique_label} categorías → Solo si es crítico (limitar top 10)"
+        return "CATEGÓRICA", f"✅ {unique_label} categorías → Ideal para x_axis en bar/pie/donut"
+    if "datetime" in dtype:
+        return "TEMPORAL", "✅ Ideal para x_axis en line/area charts (series de tiempo)"
+    return "OTRO", "⚠️ Analizar caso por caso"
+
+
+def classify_columns(columns: list, dtypes: dict, describe: dict, approximate: dict = None) -> tuple:
+    """
+    Clasifica columnas y genera análisis detallado.
+    Retorna ({columna: (tipo, línea de clasificación)}, análisis).
+    """
+    approximate = approximate or {}
+    classification = {}
+    numeric_cols = []
+    categorical_cols = []
+    temporal_cols = []
+    high_cardinality_cols = []
+    
+    for col in columns:
+        col_type, suggestion = _classify_column(dtypes.get(col, "unknown"), describe.get(col, {}), approximate.get(col, {}))
+        if col_type == "NUMÉRICA":
+            numeric_cols.append(col)
+        elif col_type == "TEMPORAL":
+            temporal_cols.append(col)
+        elif col_type != "OTRO":
+            categorical_cols.append(col)
+            if col_type != "CATEGÓRICA":
+                high_cardinality_cols.append(col)
+        classification[col] = (col_type, f"  - {col}: {col_type} → {suggestion}")
+    
+    analysis = {
+        "numeric_columns": numeric_cols,
+        "categorical_columns": [c for c in categorical_cols if c not in high_cardinality_cols],
+        "temporal_columns": temporal_cols,
+        "high_cardinality_columns": high_cardinality_cols,
+        "total_rows": describe.get(columns[0], {}).get("count", "unknown") if columns else 0
+    }
+    
+    return classification, analysis
+
+
+def column_usefulness(col_type: str, col_stats: dict, total_rows: Optional[float]) -> float:
+    """
+    Puntuación de una columna para las gráficas según su tipo, cardinalidad y nulos
+    (decide qué columnas entran primero al prompt y cuáles usa el motor local).
+    """
+    score = _TYPE_USEFULNESS.get(col_type, 1.0)
+    unique_count = col_stats.get("unique")
+    if col_type == "CATEGÓRICA" and isinstance(unique_count, (int, float)) and 2 <= unique_count <= 7:
+        score += 0.5  # ideal para pie/donut
+    # Las columnas constantes no sirven como eje ni como métrica
+    if (col_type == "NUMÉRICA" and not col_stats.get("std")) or unique_count == 1:
+        score *= 0.2
+    count = col_stats.get("count")
+    if isinstance(count, (int, float)) and total_rows:
+        score *= 0.5 + 0.5 * min(count / total_rows, 1.0)
+    return score
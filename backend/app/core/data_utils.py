@@ -1,107 +1,288 @@
 # data_utils.py
 # Utilidades para procesamiento de datos con pandas en la API
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, Tuple
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from typing import Dict, Any, List, Tuple, BinaryIO
 from fastapi import UploadFile
-import io
+import codecs
+import csv
+import hashlib
 import re
+import shutil
+import tempfile
 import logging
+from app.core.profiler import profile_dataframe, sketch_dataframe, info_text
+from app.core.downsample import lttb_indices, grid_sample_indices
+from app.core.excel import is_excel_filename, list_sheets, read_excel_sheet
+from app.core.ingest import visible_columns, logical_dtype, temporal_group_keys, period_labels
+from app.config import CHART_MAX_POINTS, SCATTER_MAX_POINTS, CHART_CATEGORY_LIMIT
 
 logger = logging.getLogger(__name__)
 
+# Lectura por bloques de la subida y muestra inicial usada para detectar formato
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+SNIFF_SAMPLE_BYTES = 64 * 1024
+# Tamaño a partir del cual el archivo temporal deja la memoria y pasa a disco
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+# Bloque de lectura de pyarrow (cada bloque se parsea en un hilo distinto)
+CSV_BLOCK_SIZE = 8 * 1024 * 1024
+CSV_DELIMITERS = ",;\t|"
+# Mismos valores nulos que reconoce pandas.read_csv, para que ambos motores coincidan
+CSV_NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
 
-def read_file_to_df(file: UploadFile) -> pd.DataFrame:
+
+def read_file_to_df(file: UploadFile, sheet: str = None) -> pd.DataFrame:
     """
-    Lee un UploadFile (.csv o .xlsx) y retorna un DataFrame de pandas
+    Lee un UploadFile (.csv o .xlsx) y retorna un DataFrame de pandas.
+    En archivos Excel se lee la hoja `sheet` (por defecto, la primera).
     """
-    content = file.file.read()
-    filename = file.filename.lower()
+    source = _spool_upload(file.file)
+    df = _read_source_to_df(source, file.filename, sheet)
     # Retrocede puntero para futuras lecturas (opcional)
-    file.file.seek(0)
-    if filename.endswith('.csv'):
-        df = pd.read_csv(io.BytesIO(content))
-    elif filename.endswith('.xlsx') or filename.endswith('.xls'):
-        df = pd.read_excel(io.BytesIO(content))
+    source.seek(0)
+    return df
+
+def read_path_to_df(path: str, filename: str, sheet: str = None) -> pd.DataFrame:
+    """
+    Igual que read_file_to_df pero desde un archivo en disco (usado por los procesos de trabajo,
+    que no pueden recibir el UploadFile).
+    """
+    with open(path, 'rb') as source:
+        return _read_source_to_df(source, filename, sheet)
+
+def list_upload_sheets(file: UploadFile) -> List[Dict[str, Any]]:
+    """
+    Hojas de un archivo Excel subido, sin cargar sus datos.
+    """
+    if not is_excel_filename(file.filename):
+        raise ValueError('Solo los archivos .xlsx o .xls tienen hojas')
+    source = _spool_upload(file.file)
+    try:
+        return list_sheets(source, file.filename)
+    finally:
+        source.seek(0)
+
+def spool_upload_to_path(file: UploadFile, directory: str = None) -> str:
+    """
+    Copia la subida por bloques a un archivo temporal con nombre y retorna su ruta.
+    Quien llama es responsable de borrarlo.
+    """
+    source = _spool_upload(file.file)
+    suffix = '.' + file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=directory, delete=False) as target:
+        shutil.copyfileobj(source, target, UPLOAD_CHUNK_SIZE)
+    source.seek(0)
+    return target.name
+
+def upload_digest(file: UploadFile) -> str:
+    """
+    SHA-256 del contenido de la subida, calculado por bloques sin cargarla entera en memoria.
+    Deja el puntero al inicio para leerla después.
+    """
+    source = file.file = _spool_upload(file.file)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+def _read_source_to_df(source: BinaryIO, filename: str, sheet: str = None) -> pd.DataFrame:
+    if filename.lower().endswith('.csv'):
+        if sheet is not None:
+            raise ValueError('La selección de hoja solo aplica a archivos Excel')
+        return _read_csv_stream(source)
+    elif is_excel_filename(filename):
+        return read_excel_sheet(source, filename, sheet)
     else:
         raise ValueError('Formato de archivo no soportado: debe ser .csv o .xlsx')
-    return df
 
-def get_dataframe_summary(df: pd.DataFrame) -> Dict[str, Any]:
+def _spool_upload(source: BinaryIO) -> BinaryIO:
     """
-    Obtiene nombres de columnas, tipos, describe() e info (como texto)
+    Garantiza un origen con seek sin cargar la subida completa en memoria.
+    Starlette ya entrega un SpooledTemporaryFile; cualquier otro flujo se copia por bloques a uno.
     """
-    # Columnas y tipos
-    columns = df.columns.tolist()
-    dtypes = {col: str(dtype) for col, dtype in df.dtypes.items()}
-    # Estadísticas numéricas generales
-    describe = df.describe(include='all').fillna("").to_dict()
-    # info como texto plano
-    buffer = io.StringIO()
-    df.info(buf=buffer)
-    info_str = buffer.getvalue()
-    return {
+    if source.seekable():
+        source.seek(0)
+        return source
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    shutil.copyfileobj(source, spooled, UPLOAD_CHUNK_SIZE)
+    spooled.seek(0)
+    return spooled
+
+def _sniff_csv_format(sample: bytes) -> Tuple[str, str]:
+    """
+    Detecta codificación y delimitador a partir de los primeros bytes del archivo.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8"
+        sample = sample[len(codecs.BOM_UTF8):]
+    else:
+        encoding = None
+        for candidate in ("utf-8", "cp1252"):
+            try:
+                # Decodificador incremental: la muestra puede cortar un carácter multibyte
+                codecs.getincrementaldecoder(candidate)().decode(sample, final=False)
+                encoding = candidate
+                break
+            except UnicodeDecodeError:
+                continue
+        encoding = encoding or "latin-1"
+    text = codecs.getincrementaldecoder(encoding)(errors="replace").decode(sample, final=False)
+    # Solo líneas completas para que el sniffer no vea un registro truncado
+    if "\n" in text:
+        text = text[:text.rindex("\n")]
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ","
+    return encoding, delimiter
+
+def _read_csv_stream(source: BinaryIO) -> pd.DataFrame:
+    """
+    Parsea un CSV con el lector multihilo de pyarrow directamente desde el archivo temporal.
+    Si pyarrow no puede (tipos inconsistentes entre bloques, encabezados duplicados, etc.)
+    se recurre a pandas.read_csv con el mismo formato detectado.
+    """
+    encoding, delimiter = _sniff_csv_format(source.read(SNIFF_SAMPLE_BYTES))
+    logger.info(f"CSV detectado: codificación={encoding}, delimitador={delimiter!r}")
+    read_options = pacsv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_SIZE, encoding=encoding)
+    parse_options = pacsv.ParseOptions(delimiter=delimiter, newlines_in_values=True)
+    try:
+        # pyarrow infiere fechas; se mantienen como texto igual que en pandas.read_csv
+        source.seek(0)
+        with pacsv.open_csv(source, read_options=read_options, parse_options=parse_options) as reader:
+            schema = reader.schema
+        if len(set(schema.names)) != len(schema.names):
+            raise pa.ArrowInvalid("Encabezados de columna duplicados")
+        text_columns = {
+            field.name: pa.string() for field in schema
+            if pa.types.is_temporal(field.type)
+        }
+        convert_options = pacsv.ConvertOptions(
+            column_types=text_columns,
+            null_values=CSV_NULL_VALUES,
+            strings_can_be_null=True,
+        )
+        source.seek(0)
+        table = pacsv.read_csv(source, read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+        # self_destruct libera cada columna Arrow a medida que se convierte (pico de memoria ~1x)
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        logger.warning(f"Lector CSV de pyarrow falló, usando pandas: {e}")
+        source.seek(0)
+        return pd.read_csv(source, sep=delimiter, encoding=encoding)
+
+def get_dataframe_summary(df: pd.DataFrame, percentiles: bool = True, approximate: bool = False,
+                          chunk_rows: int = 262144) -> Dict[str, Any]:
+    """
+    Obtiene nombres de columnas, tipos, describe() e info (como texto).
+    Las estadísticas se calculan con el perfilador de una sola pasada (ver profiler.py);
+    percentiles=False omite los cuartiles de describe. Con approximate=True se usan sketches
+    por bloques de `chunk_rows` filas y el resumen incluye las cotas de error por columna.
+    """
+    # Solo las columnas del archivo (sin las derivadas de la ingesta), sin copiar el DataFrame
+    columns = visible_columns(df)
+    dtypes = {col: logical_dtype(df[col]) for col in columns}
+    # Estadísticas generales (mismo formato que describe(include='all').fillna(""))
+    errors = None
+    if approximate:
+        describe, non_null, errors = sketch_dataframe(df, percentiles=percentiles, chunk_rows=chunk_rows, columns=columns)
+    else:
+        describe, non_null = profile_dataframe(df, percentiles=percentiles, columns=columns)
+    # info como texto plano, a partir de los conteos ya calculados
+    info_str = info_text(df, non_null, columns)
+    summary = {
         "columns": columns,
         "dtypes": dtypes,
         "describe": describe,
         "info": info_str
     }
+    if errors is not None:
+        summary["approximate"] = errors
+    return summary
+
+# Etiqueta del grupo que reúne las categorías fuera del top-N
+OTHER_LABEL = "Otros"
+# Órdenes admitidos: por valor (desc/asc) o por el eje X
+CHART_SORTS = ("desc", "asc", "x")
+
+# Columnas de estadísticas que retorna un box plot (además del eje X)
+BOXPLOT_COLUMNS = ['min', 'q1', 'median', 'q3', 'max', 'mean', 'count', 'whisker_low', 'whisker_high', 'outliers']
+
 
-def _calculate_boxplot_stats(df: pd.DataFrame, x_axis: str, y_axis: str) -> Tuple[list, list]:
+def _calculate_boxplot_stats(values: pd.Series, keys: pd.Series) -> pd.DataFrame:
     """
-    Calcula estadísticas de box plot (min, Q1, median, Q3, max) por categoría.
+    Calcula estadísticas de box plot por categoría en una sola pasada agrupada:
+    min, Q1, mediana, Q3, max, media y conteo, más los bigotes (valores extremos dentro de
+    Q1 - 1.5·IQR y Q3 + 1.5·IQR) y la cantidad de valores atípicos fuera de ellos.
+    `keys` es la serie por la que se agrupa (la columna X o sus claves de periodo).
     """
-    logger.info(f"Calculando estadísticas de box plot para {x_axis} vs {y_axis}")
+    grouped = values.groupby(keys, observed=True)
+    stats = grouped.agg(['min', 'max', 'mean', 'count'])
+    quantiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats['q1'] = quantiles[0.25]
+    stats['median'] = quantiles[0.5]
+    stats['q3'] = quantiles[0.75]
+    iqr = stats['q3'] - stats['q1']
+    lower = (stats['q1'] - 1.5 * iqr).to_numpy(dtype=float)
+    upper = (stats['q3'] + 1.5 * iqr).to_numpy(dtype=float)
     
-    result = []
-    categories = df[x_axis].unique()
+    # Bigotes: cada fila se compara con las cotas de su grupo (vía el código del grupo)
+    codes = stats.index.get_indexer(keys)
+    numbers = values.to_numpy(dtype=float, na_value=np.nan)
+    valid = (codes >= 0) & ~np.isnan(numbers)
+    codes, numbers = codes[valid], numbers[valid]
+    inside = (numbers >= lower[codes]) & (numbers <= upper[codes])
+    inner = pd.Series(numbers[inside]).groupby(codes[inside])
+    positions = np.arange(len(stats))
+    stats['whisker_low'] = inner.min().reindex(positions).to_numpy()
+    stats['whisker_high'] = inner.max().reindex(positions).to_numpy()
+    stats['outliers'] = stats['count'].to_numpy() - np.bincount(codes[inside], minlength=len(stats))
     
-    for category in categories:
-        category_data = df[df[x_axis] == category][y_axis].dropna()
-        
-        if len(category_data) > 0:
-            stats = {
-                x_axis: category,
-                'min': float(category_data.min()),
-                'q1': float(category_data.quantile(0.25)),
-                'median': float(category_data.quantile(0.5)),
-                'q3': float(category_data.quantile(0.75)),
-                'max': float(category_data.max()),
-                'mean': float(category_data.mean()),
-                'count': int(len(category_data))
-            }
-            result.append(stats)
-    
-    columns = [x_axis, 'min', 'q1', 'median', 'q3', 'max', 'mean', 'count']
-    return result, columns
+    # Categorías sin valores numéricos no tienen distribución
+    stats = stats[stats['count'] > 0]
+    return stats[BOXPLOT_COLUMNS].astype({'count': int, 'outliers': int})
 
 
-def aggregate_for_chart(df: pd.DataFrame, params: Dict[str, Any]) -> Tuple[list, list]:
+def normalize_chart_params(params: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Devuelve datos agregados y columnas para el gráfico según los parámetros.
-    Soporta agregaciones como sum, mean, count, etc.
-    Para box plots, calcula estadísticas de distribución.
+    Canonicaliza los parámetros de una gráfica: limpia espacios, resuelve columnas virtuales
+    como "average(Salario)" o "count" y normaliza el nombre de la agregación.
+    Peticiones equivalentes producen exactamente el mismo resultado (y es idempotente).
     """
     # Manejo seguro de None values
     x_axis = params.get("x_axis") or ""
     y_axis = params.get("y_axis") or ""
     hue = params.get("hue")
     agg_func = params.get("agg_func") or "sum"
-    chart_type = params.get("chart_type", "").lower()
+    chart_type = (params.get("chart_type") or "").lower()
+    max_points = params.get("max_points")
+    tooltip = params.get("tooltip") or []
+    limit = params.get("limit")
+    sort = (params.get("sort") or "").strip().lower() or None
     
     # Strip solo si no es None
     x_axis = x_axis.strip() if x_axis else ""
     y_axis = y_axis.strip() if y_axis else ""
     if hue:
         hue = hue.strip() if isinstance(hue, str) else hue
+    # Columnas extra de los tooltips (sin repetir, en el orden pedido)
+    tooltip = tuple(dict.fromkeys(col.strip() for col in tooltip if col and col.strip()))
+    # Los límites muy pequeños no permiten conservar el primer y el último punto de una serie
+    max_points = max(3, int(max_points)) if max_points else None
+    # limit=0 desactiva el top-N; None usa el límite por defecto
+    limit = max(0, int(limit)) if limit is not None else None
+    if sort is not None and sort not in CHART_SORTS:
+        raise ValueError(f"Orden '{sort}' no válido. Opciones: {', '.join(CHART_SORTS)}")
     
-    logger.info(f"Agregando datos: x={x_axis}, y={y_axis}, hue={hue}, agg={agg_func}, chart_type={chart_type}")
-    
-    # CASO ESPECIAL: Box plots deshabilitados - convertir a bar con mean
-    if chart_type in ['box', 'boxplot']:
-        logger.warning(f"Box plot detectado, convirtiendo a bar chart con mean")
-        chart_type = 'bar'
-        if not agg_func or agg_func == 'sum':
-            agg_func = 'mean'
+    # Box plots: se calculan estadísticas de distribución (la agregación no aplica)
+    if chart_type == 'boxplot':
+        chart_type = 'box'
     
     # Parsear columnas virtuales como "average(Salario)" o "count"
     if y_axis and '(' in y_axis and ')' in y_axis:
@@ -109,150 +290,381 @@ def aggregate_for_chart(df: pd.DataFrame, params: Dict[str, Any]) -> Tuple[list,
         if match:
             agg_func = match.group(1).lower()
             y_axis = match.group(2).strip()
-            # Normalizar nombres de funciones
-            if agg_func in ['average', 'avg', 'mean']:
-                agg_func = 'mean'
-            elif agg_func in ['count', 'cnt']:
-                agg_func = 'count'
-            elif agg_func in ['total', 'sum']:
-                agg_func = 'sum'
+    
+    # Normalizar nombres de funciones
+    agg_func = agg_func.lower()
+    if agg_func in ['average', 'avg', 'mean']:
+        agg_func = 'mean'
+    elif agg_func in ['count', 'cnt']:
+        agg_func = 'count'
+    elif agg_func in ['total', 'sum']:
+        agg_func = 'sum'
     
     # Si y_axis es "count", es una agregación especial
     if y_axis and y_axis.lower() == 'count':
         y_axis = None
         agg_func = 'count'
     
+    return {
+        "x_axis": x_axis,
+        "y_axis": y_axis or None,
+        "hue": hue or None,
+        "agg_func": agg_func,
+        "chart_type": chart_type,
+        "max_points": max_points,
+        "tooltip": tooltip,
+        "limit": limit,
+        "sort": sort,
+    }
+
+
+def chart_cache_key(file_id: str, params: Dict[str, Any]) -> Tuple:
+    """
+    Clave de caché de una gráfica: el file_id más los parámetros ya canonicalizados.
+    """
+    normalized = normalize_chart_params(params)
+    return (file_id,) + tuple(sorted(normalized.items()))
+
+
+def _plan_chart(df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida los parámetros contra el DataFrame y decide cómo calcular la gráfica:
+    "rows" (primeros registros), "box" (distribución por categoría), "scatter" (datos sin
+    agregar), "aggregate" (groupby con agregación numérica) o "count" (conteo de frecuencias).
+    """
+    normalized = normalize_chart_params(params)
+    x_axis = normalized["x_axis"]
+    y_axis = normalized["y_axis"]
+    hue = normalized["hue"]
+    agg_func = normalized["agg_func"]
+    chart_type = normalized["chart_type"]
+    
+    logger.info(f"Agregando datos: x={x_axis}, y={y_axis}, hue={hue}, agg={agg_func}, chart_type={chart_type}")
+    
+    # Columnas del archivo original (las derivadas de la ingesta quedan ocultas)
+    available_columns = visible_columns(df)
+    
     # Validar que x_axis exista
-    if x_axis and x_axis not in df.columns:
+    if x_axis and x_axis not in available_columns:
         if not x_axis or x_axis == '':
-            x_axis = df.columns[0] if len(df.columns) > 0 else None
+            x_axis = available_columns[0] if len(available_columns) > 0 else None
         else:
-            raise ValueError(f"Columna '{x_axis}' no existe en el DataFrame. Columnas disponibles: {', '.join(df.columns.tolist())}")
+            raise ValueError(f"Columna '{x_axis}' no existe en el DataFrame. Columnas disponibles: {', '.join(available_columns)}")
     
     # Validar que y_axis exista (si se especificó)
-    if y_axis and y_axis not in df.columns:
-        raise ValueError(f"Columna '{y_axis}' no existe en el DataFrame. Columnas disponibles: {', '.join(df.columns.tolist())}")
+    if y_axis and y_axis not in available_columns:
+        raise ValueError(f"Columna '{y_axis}' no existe en el DataFrame. Columnas disponibles: {', '.join(available_columns)}")
     
     # Validar que hue exista (si se especificó)
-    if hue and hue not in df.columns:
+    if hue and hue not in available_columns:
         raise ValueError(f"Columna '{hue}' no existe en el DataFrame")
     
-    # Detectar si x_axis es temporal y convertir si es necesario
+    missing = [col for col in normalized["tooltip"] if col not in available_columns]
+    if missing:
+        raise ValueError(f"Columnas de tooltip no existen en el DataFrame: {', '.join(missing)}")
+    
+    # Detectar si x_axis es temporal. Las fechas se convierten una sola vez al subir el archivo
+    # (ver ingest.py); aquí se agrupa por las claves enteras del periodo sin modificar el DataFrame.
     is_temporal = False
     temporal_aggregation = None
-    if x_axis and x_axis in df.columns:
-        # Verificar si es datetime o string que parece fecha
-        if pd.api.types.is_datetime64_any_dtype(df[x_axis]):
-            is_temporal = True
-            logger.info(f"Columna '{x_axis}' detectada como temporal (datetime)")
-        elif pd.api.types.is_object_dtype(df[x_axis]):
-            # Intentar convertir a datetime
-            try:
-                df[x_axis] = pd.to_datetime(df[x_axis])
-                is_temporal = True
-                logger.info(f"Columna '{x_axis}' convertida a temporal")
-            except:
-                logger.info(f"Columna '{x_axis}' no se pudo convertir a temporal")
-        
-        # Si es temporal, determinar el nivel de agregación apropiado
-        if is_temporal:
-            # Calcular el rango temporal
-            date_range = df[x_axis].max() - df[x_axis].min()
-            unique_dates = df[x_axis].nunique()
-            
-            # Decidir agregación según el rango
-            if date_range.days > 365 * 2:  # Más de 2 años → Agrupar por trimestre
-                temporal_aggregation = 'quarter'
-                # Crear columna temporal formateada (2018-Q1, 2018-Q2, etc.)
-                df[x_axis] = df[x_axis].dt.to_period('Q').astype(str)
-                logger.info(f"Agregación temporal: TRIMESTRE (rango: {date_range.days} días)")
-            elif date_range.days > 90 or unique_dates > 30:  # Más de 3 meses o >30 fechas → Agrupar por mes
-                temporal_aggregation = 'month'
-                # Crear columna temporal formateada (YYYY-MM)
-                df[x_axis] = df[x_axis].dt.to_period('M').astype(str)
-                logger.info(f"Agregación temporal: MES (rango: {date_range.days} días, {unique_dates} fechas únicas)")
-            else:  # Menos de 3 meses y pocas fechas → Mantener por día
-                temporal_aggregation = 'day'
-                # Formatear como YYYY-MM-DD para mejor legibilidad
-                df[x_axis] = df[x_axis].dt.strftime('%Y-%m-%d')
-                logger.info(f"Agregación temporal: DÍA (rango corto: {date_range.days} días)")
+    group_x = x_axis  # Lo que se pasa a groupby para el eje X (columna o serie de claves)
+    if x_axis and pd.api.types.is_datetime64_any_dtype(df[x_axis]):
+        is_temporal = True
+        temporal_aggregation, group_x = temporal_group_keys(df, x_axis)
+        logger.info(f"Columna '{x_axis}' temporal, agregación por {temporal_aggregation}")
     
-    # Si no hay x_axis, retornar los primeros registros
     if not x_axis:
-        result = df.head(10).to_dict('records')
-        columns = df.columns.tolist()
-        return result, columns
+        kind = "rows"
+    elif chart_type == "box" and y_axis and pd.api.types.is_numeric_dtype(df[y_axis]):
+        kind = "box"
+    elif y_axis and pd.api.types.is_numeric_dtype(df[y_axis]):
+        # Si x_axis también es numérico, es un scatter plot - NO agregamos
+        kind = "scatter" if pd.api.types.is_numeric_dtype(df[x_axis]) else "aggregate"
+    else:
+        kind = "count"
     
-    # Caso 1: Tenemos y_axis numérico
-    if y_axis and pd.api.types.is_numeric_dtype(df[y_axis]):
-        # Si x_axis también es numérico, es un scatter plot - NO agregamos, retornamos datos raw
-        if x_axis and pd.api.types.is_numeric_dtype(df[x_axis]):
-            logger.info("Detectado scatter plot (ambas columnas numéricas) - retornando datos sin agregar")
-            # Para scatter plots, incluir todas las columnas para contexto en tooltips
-            result = df[[x_axis, y_axis] + [col for col in df.columns if col not in [x_axis, y_axis]]].head(50).to_dict('records')
-            columns = df.columns.tolist()
+    # Límite de puntos (por defecto según el tipo de gráfica)
+    max_points = normalized["max_points"] or (SCATTER_MAX_POINTS if kind == "scatter" else CHART_MAX_POINTS)
+    
+    return {
+        "kind": kind,
+        "x_axis": x_axis,
+        "y_axis": y_axis,
+        "hue": hue,
+        "agg_func": agg_func,
+        "chart_type": chart_type,
+        "available_columns": available_columns,
+        "is_temporal": is_temporal,
+        "temporal_aggregation": temporal_aggregation,
+        "group_x": group_x,
+        "max_points": max_points,
+        "tooltip": list(normalized["tooltip"]),
+        "limit": CHART_CATEGORY_LIMIT if normalized["limit"] is None else normalized["limit"],
+        "sort": normalized["sort"],
+    }
+
+
+def _label_periods(grouped: pd.DataFrame, plan: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Convierte las claves de periodo en etiquetas (2018Q1, 2018-01, 2018-01-15) tras agregar.
+    """
+    if plan["is_temporal"]:
+        x_axis = plan["x_axis"]
+        grouped[x_axis] = period_labels(grouped[x_axis], plan["temporal_aggregation"]).to_numpy()
+    return grouped
+
+
+def _downsample_series(grouped: pd.DataFrame, plan: Dict[str, Any], value_column: str) -> pd.DataFrame:
+    """
+    Reduce las series ordenadas (eje temporal o gráficas de línea/área) a `max_points` puntos
+    con LTTB, antes de etiquetar los periodos (las claves enteras sirven como eje X).
+    Con hue, cada serie recibe una parte proporcional del límite.
+    """
+    max_points = plan["max_points"]
+    if len(grouped) <= max_points or not (plan["is_temporal"] or plan["chart_type"] in ("line", "area")):
+        return grouped
+    x_axis, hue = plan["x_axis"], plan["hue"]
+    series_groups = [grouped] if not hue else [group for _, group in grouped.groupby(hue, observed=True, sort=False)]
+    threshold = max(3, max_points // len(series_groups))
+    positions = []
+    for group in series_groups:
+        # Sin eje X numérico (categorías en orden) se usa la posición
+        x = group[x_axis].to_numpy(dtype=float, na_value=np.nan) if pd.api.types.is_numeric_dtype(group[x_axis]) else np.arange(len(group), dtype=float)
+        y = group[value_column].to_numpy(dtype=float, na_value=np.nan)
+        valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+        keep = valid[lttb_indices(x[valid], y[valid], threshold)]
+        positions.append(grouped.index.get_indexer(group.index[keep]))
+    logger.info(f"Serie reducida con LTTB: {len(grouped)} → {sum(map(len, positions))} puntos")
+    return grouped.iloc[np.sort(np.concatenate(positions))].reset_index(drop=True)
+
+
+def _limit_categories(grouped: pd.DataFrame, df: pd.DataFrame, plan: Dict[str, Any], value_column: str,
+                      default_sort: str = None) -> pd.DataFrame:
+    """
+    Top-N para ejes de muchas categorías: conserva las `limit` categorías de X con mayor valor
+    (por cada grupo de hue si lo hay) con selección parcial (nlargest, sin ordenar todo) y
+    reúne el resto en una fila "Otros". Después aplica el orden pedido; "Otros" queda al final.
+    Los ejes temporales no se recortan (ver _downsample_series).
+    """
+    x_axis, hue, limit = plan["x_axis"], plan["hue"], plan["limit"]
+    sort = plan["sort"] or default_sort
+    other = None
+    if limit and not plan["is_temporal"] and len(grouped) > limit:
+        if hue:
+            top = grouped.groupby(hue, observed=True, sort=False)[value_column].nlargest(limit).index.get_level_values(-1)
         else:
-            # Es un gráfico de barras/línea - agregamos
-            try:
-                if hue:
-                    # Agrupar por x_axis y hue
-                    grouped = df.groupby([x_axis, hue])[y_axis].agg(agg_func).reset_index()
-                    result = grouped.to_dict('records')
-                    columns = [x_axis, hue, y_axis]
-                else:
-                    # Agrupar solo por x_axis
-                    grouped = df.groupby(x_axis)[y_axis].agg(agg_func).reset_index()
-                    # Ordenar por x_axis si es temporal
-                    if is_temporal:
-                        grouped = grouped.sort_values(by=x_axis)
-                        logger.info(f"Datos ordenados cronológicamente por '{x_axis}'")
-                    result = grouped.to_dict('records')
-                    columns = [x_axis, y_axis]
-            except Exception as e:
-                logger.warning(f"Error en agregación {agg_func}, usando sum como fallback: {e}")
-                # Fallback a sum si falla
-                if hue:
-                    grouped = df.groupby([x_axis, hue])[y_axis].sum().reset_index()
-                    result = grouped.to_dict('records')
-                    columns = [x_axis, hue, y_axis]
-                else:
-                    grouped = df.groupby(x_axis)[y_axis].sum().reset_index()
-                    # Ordenar por x_axis si es temporal
-                    if is_temporal:
-                        grouped = grouped.sort_values(by=x_axis)
-                    result = grouped.to_dict('records')
-                    columns = [x_axis, y_axis]
+            top = grouped.nlargest(limit, value_column).index
+        kept = grouped.index.isin(top)
+        if not kept.all():
+            other = _other_bucket(grouped[~kept], grouped[kept], df, plan, value_column)
+            logger.info(f"Top {limit} de '{x_axis}': {int((~kept).sum())} grupos reunidos en '{OTHER_LABEL}'")
+            grouped = grouped[kept]
+    if sort == "x":
+        grouped = grouped.sort_values([x_axis, hue] if hue else x_axis, kind="stable")
+    elif sort:
+        grouped = grouped.sort_values(value_column, ascending=sort == "asc", kind="stable")
+    if other is None:
+        return grouped
+    # La columna X puede ser category o numérica: se pasa a texto para admitir la etiqueta
+    # (una columna homogénea también se puede serializar en Arrow)
+    return pd.concat([grouped.astype({x_axis: str}), other], ignore_index=True)
+
+
+def _other_bucket(rest: pd.DataFrame, kept: pd.DataFrame, df: pd.DataFrame, plan: Dict[str, Any], value_column: str) -> pd.DataFrame:
+    """
+    Valor de "Otros" (por hue si lo hay). Sumas, conteos, mínimos y máximos se combinan desde
+    los grupos ya agregados; el resto de funciones (media, mediana...) se recalculan sobre las
+    filas originales de las categorías descartadas.
+    """
+    x_axis, hue, y_axis = plan["x_axis"], plan["hue"], plan["y_axis"]
+    agg_func = "sum" if value_column == "count" else plan["agg_func"]
+    combine = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}.get(agg_func)
+    values = None
+    if combine is None:
+        if hue:
+            pairs = pd.MultiIndex.from_frame(kept[[x_axis, hue]])
+            mask = ~pd.MultiIndex.from_arrays([df[x_axis], df[hue]]).isin(pairs)
+        else:
+            mask = ~df[x_axis].isin(kept[x_axis])
+        rows = df.loc[mask]
+        try:
+            values = rows.groupby(hue, observed=True)[y_axis].agg(agg_func) if hue else rows[y_axis].agg(agg_func)
+        except Exception as e:
+            # Misma degradación que la agregación principal
+            logger.warning(f"Error calculando '{OTHER_LABEL}' con {agg_func}, usando sum: {e}")
+            combine = "sum"
+    if values is None:
+        values = rest.groupby(hue, observed=True)[value_column].agg(combine) if hue else rest[value_column].agg(combine)
+    if hue:
+        other = values.rename(value_column).reset_index()
+        other.insert(0, x_axis, OTHER_LABEL)
+        # Solo los grupos de hue que realmente tenían categorías descartadas
+        return other[other[hue].isin(rest[hue])][list(rest.columns)]
+    return pd.DataFrame({x_axis: [OTHER_LABEL], value_column: [values]})
+
+
+def _scatter_frame(df: pd.DataFrame, plan: Dict[str, Any]) -> Tuple[pd.DataFrame, list]:
+    """
+    Puntos de un scatter plot: solo x, y, hue y las columnas de tooltip pedidas, con
+    muestreo estratificado por rejilla si hay más de `max_points` puntos válidos.
+    """
+    x_axis, y_axis, hue = plan["x_axis"], plan["y_axis"], plan["hue"]
+    columns = list(dict.fromkeys([x_axis, y_axis] + ([hue] if hue else []) + plan["tooltip"]))
+    x = df[x_axis].to_numpy(dtype=float, na_value=np.nan)
+    y = df[y_axis].to_numpy(dtype=float, na_value=np.nan)
+    valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+    rows = valid[grid_sample_indices(x[valid], y[valid], plan["max_points"])]
+    logger.info(f"Scatter: {len(rows)} de {len(valid)} puntos")
+    return df[columns].iloc[rows].reset_index(drop=True), columns
+
+
+def _execute_plan(df: pd.DataFrame, plan: Dict[str, Any]) -> Tuple[pd.DataFrame, list]:
+    x_axis = plan["x_axis"]
+    y_axis = plan["y_axis"]
+    hue = plan["hue"]
+    agg_func = plan["agg_func"]
+    group_x = plan["group_x"]
+    available_columns = plan["available_columns"]
+    kind = plan["kind"]
+    
+    # Si no hay x_axis, retornar los primeros registros
+    if kind == "rows":
+        frame = df.head(10)[available_columns]
+        columns = available_columns
+        return frame, columns
+    
+    if kind == "box":
+        logger.info(f"Calculando estadísticas de box plot para {x_axis} vs {y_axis}")
+        group_keys = group_x if plan["is_temporal"] else df[x_axis]
+        stats = _calculate_boxplot_stats(df[y_axis], group_keys).rename_axis(x_axis).reset_index()
+        frame = _label_periods(stats, plan)
+        columns = [x_axis] + BOXPLOT_COLUMNS
+    # Caso 1: Tenemos y_axis numérico
+    elif kind == "scatter":
+        logger.info("Detectado scatter plot (ambas columnas numéricas) - retornando datos sin agregar")
+        frame, columns = _scatter_frame(df, plan)
+    elif kind == "aggregate":
+        # Es un gráfico de barras/línea - agregamos
+        # (las claves de periodo ya ordenan cronológicamente al agrupar)
+        keys = [group_x, hue] if hue else group_x
+        columns = [x_axis, hue, y_axis] if hue else [x_axis, y_axis]
+        try:
+            grouped = df.groupby(keys, observed=True)[y_axis].agg(agg_func).reset_index()
+        except Exception as e:
+            logger.warning(f"Error en agregación {agg_func}, usando sum como fallback: {e}")
+            # Fallback a sum si falla
+            grouped = df.groupby(keys, observed=True)[y_axis].sum().reset_index()
+        frame = _label_periods(_limit_categories(_downsample_series(grouped, plan, y_axis), df, plan, y_axis), plan)
     
     # Caso 2: Solo x_axis (conteo de frecuencias)
-    elif x_axis:
+    else:
         try:
             if hue:
                 # Contar combinaciones de x_axis y hue
-                grouped = df.groupby([x_axis, hue]).size().reset_index(name='count')
-                result = grouped.to_dict('records')
+                grouped = df.groupby([group_x, hue], observed=True).size().reset_index(name='count')
+                frame = _label_periods(_limit_categories(_downsample_series(grouped, plan, 'count'), df, plan, 'count'), plan)
                 columns = [x_axis, hue, 'count']
+            elif plan["is_temporal"]:
+                # Conteo por periodo, en orden cronológico (en lugar de por frecuencia)
+                grouped = df.groupby(group_x, observed=True).size().reset_index(name='count')
+                logger.info(f"Conteo ordenado cronológicamente por '{x_axis}'")
+                frame = _label_periods(_limit_categories(_downsample_series(grouped, plan, 'count'), df, plan, 'count'), plan)
+                columns = [x_axis, 'count']
             else:
-                # Contar valores únicos de x_axis
-                grouped = df[x_axis].value_counts().reset_index()
+                # Contar valores únicos de x_axis (por defecto de mayor a menor frecuencia);
+                # sin ordenar aquí: el top-N solo necesita una selección parcial
+                grouped = df[x_axis].value_counts(sort=False).reset_index()
                 grouped.columns = [x_axis, 'count']
-                # Ordenar por x_axis si es temporal (en lugar de por frecuencia)
-                if is_temporal:
-                    grouped = grouped.sort_values(by=x_axis)
-                    logger.info(f"Conteo ordenado cronológicamente por '{x_axis}'")
-                result = grouped.to_dict('records')
+                frame = _limit_categories(grouped, df, plan, 'count', default_sort="desc")
                 columns = [x_axis, 'count']
         except Exception as e:
             logger.warning(f"Error en conteo, usando value_counts: {e}")
             # Fallback
             unique_values = df[x_axis].value_counts().reset_index()
             unique_values.columns = [x_axis, 'count']
-            result = unique_values.head(10).to_dict('records')
+            frame = unique_values.head(10)
             columns = [x_axis, 'count']
     
-    # Caso 3: Sin parámetros válidos
-    else:
-        result = df.head(10).to_dict('records')
-        columns = df.columns.tolist()
+    logger.info(f"Datos agregados: {len(frame)} registros, columnas: {columns}")
+    return frame, columns
+
+
+def aggregate_for_chart(df: pd.DataFrame, params: Dict[str, Any]) -> Tuple[list, list]:
+    """
+    Devuelve datos agregados y columnas para el gráfico según los parámetros.
+    Soporta agregaciones como sum, mean, count, etc.
+    Para box plots, calcula estadísticas de distribución.
+    """
+    frame, columns = aggregate_chart_frame(df, params)
+    return frame.to_dict('records'), columns
+
+
+def aggregate_chart_frame(df: pd.DataFrame, params: Dict[str, Any]) -> Tuple[pd.DataFrame, list]:
+    """
+    Igual que aggregate_for_chart pero retorna el DataFrame agregado, para serializarlo en el
+    formato que pida el cliente (ver chart_formats.py) sin pasar por registros.
+    """
+    return _execute_plan(df, _plan_chart(df, params))
+
+
+def chart_group_key(params: Dict[str, Any]) -> Tuple:
+    """
+    Gráficas con la misma clave agrupan por las mismas columnas y pueden calcularse juntas.
+    """
+    normalized = normalize_chart_params(params)
+    return (normalized["x_axis"], normalized["hue"])
+
+
+def _chart_result(df: pd.DataFrame, plan: Dict[str, Any]) -> Dict[str, Any]:
+    # Un error en una gráfica no debe invalidar el resto del lote
+    try:
+        frame, columns = _execute_plan(df, plan)
+    except Exception as e:
+        logger.error(f"Error calculando gráfica {plan['x_axis']}/{plan['y_axis']}: {e}")
+        return {"error": f"Error procesando datos: {e}"}
+    return {"frame": frame, "columns": columns}
+
+
+def aggregate_many_for_chart(df: pd.DataFrame, params_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Calcula varias gráficas del mismo DataFrame compartiendo trabajo: las agregaciones que
+    agrupan por las mismas columnas (x/hue) se resuelven con un único groupby().agg({...})
+    con todas sus funciones. Retorna, en el mismo orden, {"frame", "columns"} (DataFrame agregado)
+    o {"error"} por gráfica.
+    """
+    results: List[Dict[str, Any]] = [None] * len(params_list)
+    shared: Dict[Tuple, List[Tuple[int, Dict[str, Any]]]] = {}
+    for i, params in enumerate(params_list):
+        try:
+            plan = _plan_chart(df, params)
+        except ValueError as e:
+            results[i] = {"error": str(e)}
+            continue
+        if plan["kind"] == "aggregate":
+            shared.setdefault((plan["x_axis"], plan["hue"]), []).append((i, plan))
+        else:
+            results[i] = _chart_result(df, plan)
     
-    logger.info(f"Datos agregados: {len(result)} registros, columnas: {columns}")
-    return result, columns
+    for (x_axis, hue), items in shared.items():
+        first = items[0][1]
+        keys = [first["group_x"], hue] if hue else first["group_x"]
+        funcs: Dict[str, List[str]] = {}
+        for _, plan in items:
+            if plan["agg_func"] not in funcs.setdefault(plan["y_axis"], []):
+                funcs[plan["y_axis"]].append(plan["agg_func"])
+        try:
+            grouped = df.groupby(keys, observed=True).agg(funcs)
+        except Exception as e:
+            # Alguna función no aplica: cada gráfica por separado (con su fallback a sum)
+            logger.warning(f"Agregación compartida por {x_axis}/{hue} falló, calculando por separado: {e}")
+            for i, plan in items:
+                results[i] = _chart_result(df, plan)
+            continue
+        logger.info(f"Agregación compartida por {x_axis}/{hue}: {len(items)} gráficas en un groupby")
+        for i, plan in items:
+            y_axis = plan["y_axis"]
+            chart = grouped[(y_axis, plan["agg_func"])].rename(y_axis).reset_index()
+            chart = _label_periods(_limit_categories(_downsample_series(chart, plan, y_axis), df, plan, y_axis), plan)
+            columns = [x_axis, hue, y_axis] if hue else [x_axis, y_axis]
+            results[i] = {"frame": chart, "columns": columns}
+    return results
@@ -0,0 +1,296 @@
+# dataset_store.py
+# Almacén de DataFrames en memoria con presupuesto de memoria, expulsión LRU y expiración por TTL,
+# opcionalmente respaldado por un almacén persistente (ver spill_store.py)
+import threading
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Any, List, Optional, TYPE_CHECKING
+import pandas as pd
+from app.core.ingest import visible_columns
+
+if TYPE_CHECKING:
+    from app.core.spill_store import ArrowSpillStore
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto (como mucho) un acceso en memoria renueva la fecha del archivo persistido, para que
+# el TTL del disco no expire un dataset que se sigue usando
+SPILL_TOUCH_SECONDS = 60.0
+
+
+def dataframe_size_bytes(df: pd.DataFrame) -> int:
+    """
+    Memoria real ocupada por el DataFrame (incluye el contenido de columnas object).
+    """
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+@dataclass
+class DatasetEntry:
+    """
+    Un DataFrame almacenado junto con sus estadísticas de acceso.
+    """
+    df: pd.DataFrame
+    size_bytes: int
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+    hits: int = 0
+    # Si tiene copia en disco (que debe seguir existiendo para servirlo desde memoria)
+    persisted: bool = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size_bytes": self.size_bytes,
+            "rows": int(len(self.df)),
+            "columns": len(visible_columns(self.df)),
+            "hits": self.hits,
+            "created_at": self.created_at,
+            "last_access": self.last_access,
+            "in_memory": True,
+        }
+
+
+class DatasetStore:
+    """
+    Guarda DataFrames por file_id sin superar un presupuesto de memoria.
+
+    - Cuando se supera el presupuesto se expulsan los datasets menos usados recientemente (LRU).
+    - Los datasets sin accesos durante más de `ttl_seconds` expiran (0 desactiva el TTL).
+    - Si se indica un `spill`, cada dataset se persiste una vez en disco y la memoria actúa
+      como caché caliente: un dataset expulsado (o subido desde otro worker) se reabre desde disco.
+    - Un alias es otro file_id para el mismo dataset (subidas con idéntico contenido): comparte el
+      DataFrame sin copiarlo. Borrar un alias solo elimina ese nombre; borrar el dataset invalida sus alias.
+    - Con `spill`, un acceso en memoria comprueba que el archivo siga en disco: un dataset borrado
+      desde otro worker (o expirado en disco) deja de servirse también desde la memoria de este.
+    Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float = 0, spill: Optional["ArrowSpillStore"] = None):
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.spill = spill
+        self._entries: "OrderedDict[str, DatasetEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._lock = threading.RLock()
+        self._removal_listeners: List[Callable[[str], None]] = []
+        # alias → file_id del dataset al que apunta
+        self._aliases: Dict[str, str] = {}
+
+    def add_removal_listener(self, listener: Callable[[str], None]) -> None:
+        """
+        Registra una función que se llama con el file_id cada vez que un dataset sale de memoria
+        (expulsión, expiración o borrado), para invalidar resultados derivados de él.
+        """
+        self._removal_listeners.append(listener)
+
+    def put(self, file_id: str, df: pd.DataFrame) -> None:
+        """
+        Guarda un DataFrame, expulsando otros si es necesario para respetar el presupuesto.
+        """
+        size = dataframe_size_bytes(df)
+        persisted = self.spill.write(file_id, df) if self.spill else False
+        if size > self.max_bytes:
+            if persisted:
+                # Demasiado grande para la caché caliente: se servirá directamente desde disco
+                logger.info(f"Dataset '{file_id}' ({size} bytes) excede la caché en memoria; solo se guarda en disco")
+                return
+            raise ValueError(
+                f"El archivo ocupa {size / 1024 ** 2:.1f} MB en memoria y supera el límite "
+                f"de {self.max_bytes / 1024 ** 2:.1f} MB del servidor"
+            )
+        self._insert(file_id, df, size, persisted)
+
+    def _insert(self, file_id: str, df: pd.DataFrame, size: int, persisted: bool = False) -> None:
+        with self._lock:
+            self._remove(file_id)
+            self._purge_expired()
+            while self._entries and self._total_bytes + size > self.max_bytes:
+                evicted_id, _ = next(iter(self._entries.items()))
+                self._remove(evicted_id)
+                self._evictions += 1
+                logger.info(f"Dataset '{evicted_id}' expulsado del almacén por presupuesto de memoria")
+            self._entries[file_id] = DatasetEntry(df=df, size_bytes=size, persisted=persisted)
+            self._total_bytes += size
+
+    def add_alias(self, alias_id: str, file_id: str) -> None:
+        """
+        Registra alias_id como otro nombre del dataset file_id (que puede ser a su vez un alias).
+        """
+        file_id = self.resolve(file_id)
+        with self._lock:
+            self._aliases[alias_id] = file_id
+        if self.spill is not None:
+            self.spill.write_alias(alias_id, file_id)
+
+    def resolve(self, file_id: str) -> str:
+        """
+        file_id del dataset al que apunta un alias, o el mismo file_id si no es un alias.
+        """
+        with self._lock:
+            target = self._aliases.get(file_id)
+        if target is None and self.spill is not None:
+            # Alias creado por otro worker
+            target = self.spill.read_alias(file_id)
+            if target is not None:
+                with self._lock:
+                    self._aliases[file_id] = target
+        return target or file_id
+
+    def get(self, file_id: str) -> Optional[pd.DataFrame]:
+        """
+        Retorna el DataFrame (o None si no existe o expiró) y actualiza sus estadísticas.
+        """
+        file_id = self.resolve(file_id)
+        with self._lock:
+            entry = self._live_entry(file_id)
+            if entry is not None:
+                entry.hits += 1
+                entry.last_access = time.time()
+                self._entries.move_to_end(file_id)
+                return entry.df
+        if self.spill is None:
+            return None
+        df = self.spill.read(file_id)
+        if df is None:
+            return None
+        logger.info(f"Dataset '{file_id}' reabierto desde disco")
+        size = dataframe_size_bytes(df)
+        if size <= self.max_bytes:
+            self._insert(file_id, df, size, persisted=True)
+            with self._lock:
+                entry = self._entries.get(file_id)
+                if entry is not None:
+                    entry.hits += 1
+        return df
+
+    def touch(self, file_id: str) -> bool:
+        """
+        Registra un acceso sin cargar el DataFrame (cuando otro proceso lo leerá desde disco).
+        Retorna False si el dataset no existe.
+        """
+        file_id = self.resolve(file_id)
+        with self._lock:
+            entry = self._live_entry(file_id)
+            if entry is not None:
+                entry.hits += 1
+                entry.last_access = time.time()
+                self._entries.move_to_end(file_id)
+                return True
+        return self.spill is not None and self.spill.keep_alive(file_id, SPILL_TOUCH_SECONDS)
+
+    def _live_entry(self, file_id: str) -> Optional[DatasetEntry]:
+        """
+        Entrada en memoria si sigue vigente: sin expirar por TTL y, si estaba persistida, con su
+        archivo aún en disco (cuya fecha se renueva como mucho cada SPILL_TOUCH_SECONDS).
+        Se llama con el lock tomado.
+        """
+        entry = self._entries.get(file_id)
+        if entry is None:
+            return None
+        if self._is_expired(entry):
+            self._remove(file_id)
+            self._expirations += 1
+            logger.info(f"Dataset '{file_id}' expirado por TTL")
+            return None
+        if entry.persisted and not self.spill.keep_alive(file_id, SPILL_TOUCH_SECONDS):
+            self._remove(file_id)
+            logger.info(f"Dataset '{file_id}' ya no está en disco (borrado por otro proceso o expirado)")
+            return None
+        return entry
+
+    def is_persisted(self, file_id: str) -> bool:
+        return self.spill is not None and self.spill.exists(self.resolve(file_id))
+
+    def delete(self, file_id: str) -> bool:
+        """
+        Elimina un dataset (de memoria y de disco) y sus alias, o solo el alias si file_id lo es.
+        Retorna False si no existía.
+        """
+        target = self.resolve(file_id)
+        if target != file_id:
+            with self._lock:
+                self._aliases.pop(file_id, None)
+            if self.spill is not None:
+                self.spill.delete_alias(file_id)
+            return True
+        with self._lock:
+            aliases = [alias for alias, points_to in self._aliases.items() if points_to == file_id]
+            for alias in aliases:
+                del self._aliases[alias]
+            removed = self._remove(file_id)
+        if self.spill is not None:
+            for alias in aliases:
+                self.spill.delete_alias(alias)
+        if self.spill is not None and self.spill.delete(file_id):
+            if not removed:
+                # Solo estaba en disco: igual se invalidan los resultados derivados
+                self._notify_removal(file_id)
+            removed = True
+        return removed
+
+    def entry_stats(self, file_id: str) -> Optional[Dict[str, Any]]:
+        target = self.resolve(file_id)
+        alias_of = {"alias_of": target} if target != file_id else {}
+        with self._lock:
+            entry = self._live_entry(target)
+            if entry is not None:
+                return {**entry.stats(), **alias_of}
+        if self.spill is not None:
+            info = self.spill.describe(target)
+            if info is not None:
+                return {**info, "hits": 0, "in_memory": False, **alias_of}
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Estadísticas globales del almacén y de cada dataset.
+        """
+        with self._lock:
+            self._purge_expired()
+            return {
+                "datasets": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "aliases": len(self._aliases),
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "persistent": self.spill is not None,
+                "entries": {file_id: entry.stats() for file_id, entry in self._entries.items()},
+            }
+
+    def __contains__(self, file_id: str) -> bool:
+        return self.entry_stats(file_id) is not None
+
+    def _is_expired(self, entry: DatasetEntry) -> bool:
+        return bool(self.ttl_seconds) and time.time() - entry.last_access > self.ttl_seconds
+
+    def _purge_expired(self) -> None:
+        expired = [file_id for file_id, entry in self._entries.items() if self._is_expired(entry)]
+        for file_id in expired:
+            self._remove(file_id)
+            self._expirations += 1
+            logger.info(f"Dataset '{file_id}' expirado por TTL")
+
+    def _remove(self, file_id: str) -> bool:
+        entry = self._entries.pop(file_id, None)
+        if entry is None:
+            return False
+        self._total_bytes -= entry.size_bytes
+        if self.spill is None:
+            # Sin copia en disco el dataset deja de existir: sus alias ya no apuntan a nada
+            for alias in [alias for alias, points_to in self._aliases.items() if points_to == file_id]:
+                del self._aliases[alias]
+        self._notify_removal(file_id)
+        return True
+
+    def _notify_removal(self, file_id: str) -> None:
+        for listener in self._removal_listeners:
+            try:
+                listener(file_id)
+            except Exception as e:
+                logger.warning(f"Error notificando la salida del dataset '{file_id}': {e}")
@@ -0,0 +1,69 @@
+# downsample.py
+# Reducción de puntos de las gráficas en el servidor: Largest-Triangle-Three-Buckets para series
+# ordenadas (líneas, series temporales) y muestreo estratificado por rejilla para scatter plots
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Índices de los puntos que conserva Largest-Triangle-Three-Buckets (Steinarsson, 2013):
+    se mantienen el primero y el último, y de cada uno de los `threshold - 2` tramos intermedios
+    el punto que forma el triángulo de mayor área con el punto elegido en el tramo anterior y
+    el promedio del tramo siguiente. Conserva picos y valles a diferencia de un muestreo uniforme.
+    `x` debe estar ordenado; sin nulos en `y`.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Límites de los tramos intermedios (el primer y el último punto forman tramos propios)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Promedio del tramo siguiente (el último tramo usa el punto final)
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        # Área (doble) de los triángulos (anterior, candidato, promedio siguiente)
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+
+def grid_sample_indices(x: np.ndarray, y: np.ndarray, max_points: int, seed: int = 0) -> np.ndarray:
+    """
+    Muestreo estratificado para scatter plots: divide el plano en una rejilla de ~max_points
+    celdas y toma los puntos por turnos (uno de cada celda ocupada, luego un segundo, etc.),
+    al azar dentro de cada celda. Las zonas poco pobladas y los atípicos quedan representados
+    y las densas no acaparan la muestra. La semilla fija hace que el resultado sea reproducible.
+    Retorna los índices elegidos en el orden original.
+    """
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bins = max(1, int(np.ceil(np.sqrt(max_points))))
+    cells = _grid_cells(x, bins) * bins + _grid_cells(y, bins)
+    # Orden aleatorio y luego por celda (estable): la posición dentro de la celda es su turno
+    permutation = np.random.default_rng(seed).permutation(n)
+    by_cell = permutation[np.argsort(cells[permutation], kind="stable")]
+    sorted_cells = cells[by_cell]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    turn = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+    chosen = by_cell[np.argsort(turn, kind="stable")[:max_points]]
+    return np.sort(chosen)
+
+
+def _grid_cells(values: np.ndarray, bins: int) -> np.ndarray:
+    low, high = values.min(), values.max()
+    if high <= low:
+        return np.zeros(len(values), dtype=np.int64)
+    return np.minimum(((values - low) / (high - low) * bins).astype(np.int64), bins - 1)
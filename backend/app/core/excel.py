@@ -0,0 +1,155 @@
+# excel.py
+# Lectura de libros Excel: lista de hojas sin cargarlas y lectura de una hoja con el motor más
+# rápido disponible (calamine si está instalado; si no, openpyxl en modo solo lectura por filas)
+import logging
+import re
+import zipfile
+from typing import Any, BinaryIO, Dict, List, Optional
+from xml.etree import ElementTree
+import pandas as pd
+
+try:
+    # Lector en Rust (paquete python-calamine), bastante más rápido que openpyxl
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+logger = logging.getLogger(__name__)
+
+_DIMENSION_RE = re.compile(rb'<(?:\w+:)?dimension ref="([A-Z0-9:$]+)"')
+# La dimensión está al principio del XML de cada hoja
+DIMENSION_SNIFF_BYTES = 4096
+
+
+def is_excel_filename(filename: str) -> bool:
+    return filename.lower().endswith(('.xlsx', '.xls'))
+
+
+def list_sheets(source: BinaryIO, filename: str) -> List[Dict[str, Any]]:
+    """
+    Hojas del libro en orden, sin leer sus celdas. Para .xlsx se incluyen filas (sin el
+    encabezado) y columnas según la dimensión declarada en la hoja; si no se conoce, None.
+    """
+    source.seek(0)
+    if not filename.lower().endswith('.xls'):
+        return _xlsx_sheets(source)
+    if CalamineWorkbook is not None:
+        names = CalamineWorkbook.from_filelike(source).sheet_names
+    else:
+        import xlrd
+        # on_demand: solo se lee el índice de hojas
+        names = xlrd.open_workbook(file_contents=source.read(), on_demand=True).sheet_names()
+    return [{"name": name, "rows": None, "columns": None} for name in names]
+
+
+def _xlsx_sheets(source: BinaryIO) -> List[Dict[str, Any]]:
+    """
+    Lee solo el índice del libro (xl/workbook.xml y sus relaciones) y el inicio de cada hoja,
+    donde está la dimensión declarada. openpyxl cargaría además todos los textos compartidos.
+    """
+    with zipfile.ZipFile(source) as archive:
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        relations = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in relations}
+        sheets = []
+        # Se comparan los nombres locales: las variantes "strict" de OOXML usan otros espacios de nombres
+        for sheet in (element for element in workbook.iter() if _local_name(element.tag) == "sheet"):
+            relation_id = next((value for key, value in sheet.attrib.items() if _local_name(key) == "id"), None)
+            target = targets.get(relation_id, "")
+            path = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+            sheets.append({"name": sheet.get("name"), **_declared_size(archive, path)})
+    return sheets
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _declared_size(archive: zipfile.ZipFile, path: str) -> Dict[str, Optional[int]]:
+    from openpyxl.utils import range_boundaries
+    try:
+        with archive.open(path) as stream:
+            match = _DIMENSION_RE.search(stream.read(DIMENSION_SNIFF_BYTES))
+        # Una sola celda ("A1") no indica el tamaño real: algunos generadores no la calculan
+        if match is None or b":" not in match.group(1):
+            return {"rows": None, "columns": None}
+        min_col, min_row, max_col, max_row = range_boundaries(match.group(1).decode())
+    except (KeyError, ValueError, TypeError):
+        return {"rows": None, "columns": None}
+    return {"rows": max(max_row - min_row, 0), "columns": max_col - min_col + 1}
+
+
+def read_excel_sheet(source: BinaryIO, filename: str, sheet: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lee una hoja (por nombre; la primera si no se indica) con la primera fila como encabezado.
+    """
+    source.seek(0)
+    if CalamineWorkbook is not None:
+        logger.info(f"Leyendo hoja '{sheet or 0}' con calamine")
+        return pd.read_excel(source, sheet_name=_sheet_name(source, filename, sheet), engine="calamine")
+    if filename.lower().endswith('.xls'):
+        return pd.read_excel(source, sheet_name=_sheet_name(source, filename, sheet), engine="xlrd")
+    return _read_xlsx_rows(source, sheet)
+
+
+def _sheet_name(source: BinaryIO, filename: str, sheet: Optional[str]):
+    if sheet is None:
+        return 0
+    names = [info["name"] for info in list_sheets(source, filename)]
+    source.seek(0)
+    if sheet not in names:
+        raise ValueError(f"La hoja '{sheet}' no existe. Hojas disponibles: {', '.join(names)}")
+    return sheet
+
+
+def _open_xlsx(source: BinaryIO):
+    import openpyxl
+    # read_only: las filas se leen en streaming desde el XML, sin crear el modelo de celdas;
+    # data_only: valores calculados de las fórmulas (igual que pandas)
+    return openpyxl.load_workbook(source, read_only=True, data_only=True, keep_links=False)
+
+
+def _read_xlsx_rows(source: BinaryIO, sheet: Optional[str]) -> pd.DataFrame:
+    """
+    Recorre la hoja fila a fila como tuplas de valores (sin objetos de celda) y construye el
+    DataFrame de una vez; pandas infiere los tipos por columna como en read_excel.
+    """
+    workbook = _open_xlsx(source)
+    try:
+        if sheet is None:
+            worksheet = workbook.worksheets[0]
+        elif sheet in workbook.sheetnames:
+            worksheet = workbook[sheet]
+        else:
+            raise ValueError(f"La hoja '{sheet}' no existe. Hojas disponibles: {', '.join(workbook.sheetnames)}")
+        logger.info(f"Leyendo hoja '{worksheet.title}' con openpyxl (solo lectura)")
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        records = list(rows)
+    finally:
+        workbook.close()
+    # Las filas vacías del final (celdas con formato pero sin valores) no son datos
+    while records and all(value is None for value in records[-1]):
+        records.pop()
+    width = max(len(header), max(map(len, records), default=0))
+    return pd.DataFrame.from_records(records, columns=_header_names(header, width))
+
+
+def _header_names(header: tuple, width: int) -> List[str]:
+    """
+    Nombres de columna como los de pandas.read_excel: "Unnamed: i" para celdas vacías
+    y sufijos ".1", ".2"... para nombres repetidos.
+    """
+    names = []
+    seen: Dict[str, int] = {}
+    for position in range(width):
+        value = header[position] if position < len(header) else None
+        name = f"Unnamed: {position}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
@@ -0,0 +1,99 @@
+# executors.py
+# Capa de ejecutores: corre el trabajo bloqueante (parseo, pandas, E/S de disco) fuera del event loop
+import asyncio
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, Iterator
+from app.config import CPU_EXECUTOR, PARSE_WORKERS, AGGREGATE_WORKERS, IO_WORKERS, PROFILING_ENABLED
+from app.core import profiling
+
+logger = logging.getLogger(__name__)
+
+# Cada etapa tiene su propio pool, así su tamaño es también su límite de concurrencia:
+# un archivo grande parseándose nunca ocupa los trabajadores de las gráficas interactivas.
+# Las etapas CPU ("parse", "aggregate") usan procesos si CPU_EXECUTOR == "process".
+STAGES: Dict[str, Dict[str, Any]] = {
+    "parse": {"kind": CPU_EXECUTOR, "workers": PARSE_WORKERS},
+    "aggregate": {"kind": CPU_EXECUTOR, "workers": AGGREGATE_WORKERS},
+    # Agregaciones de datasets que solo existen en la memoria de este proceso (no persistidos)
+    "aggregate_local": {"kind": "thread", "workers": AGGREGATE_WORKERS},
+    "io": {"kind": "thread", "workers": IO_WORKERS},
+}
+
+_pools: Dict[str, Executor] = {}
+_pools_lock = threading.Lock()
+
+
+def uses_processes(stage: str) -> bool:
+    """
+    Indica si la etapa corre en procesos separados (sus argumentos deben ser serializables).
+    """
+    return STAGES[stage]["kind"] == "process"
+
+
+def _get_pool(stage: str) -> Executor:
+    with _pools_lock:
+        pool = _pools.get(stage)
+        if pool is None:
+            config = STAGES[stage]
+            workers = max(1, int(config["workers"]))
+            if config["kind"] == "process":
+                # "spawn" evita heredar hilos del servidor (fork + hilos de pyarrow puede bloquearse)
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{stage}-worker")
+            _pools[stage] = pool
+            logger.info(f"Pool '{stage}' creado ({config['kind']}, {workers} trabajadores)")
+        return pool
+
+
+async def run_in_stage(stage: str, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Ejecuta fn(*args, **kwargs) en el pool de la etapa y espera el resultado sin bloquear el event loop.
+    Si la petición en curso se está perfilando, fn se perfila en el trabajador (ver app/core/profiling.py).
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pool(stage)
+    profile = profiling.current() if PROFILING_ENABLED else None
+    try:
+        if profile is None:
+            return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+        start = time.perf_counter()
+        result, stats = await loop.run_in_executor(pool, functools.partial(profiling.profiled_call, fn, *args, **kwargs))
+        profile.add_stage(stage, getattr(fn, "__qualname__", repr(fn)), time.perf_counter() - start, stats)
+        return result
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. por falta de memoria): se descarta el pool para recrearlo en la próxima llamada
+        with _pools_lock:
+            if _pools.get(stage) is pool:
+                del _pools[stage]
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.error(f"El pool '{stage}' se rompió; se recreará en la próxima petición")
+        raise RuntimeError("El proceso de trabajo terminó inesperadamente (posible falta de memoria)")
+
+
+def map_in_stage(stage: str, fn: Callable, items: Iterable) -> Iterator:
+    """
+    Para código que ya corre en un trabajador (síncrono): reparte fn sobre `items` entre los hilos
+    de la etapa y retorna los resultados en orden, a medida que terminan. Solo etapas de hilos:
+    fn puede ser un closure y compartir memoria con quien llama.
+    """
+    if uses_processes(stage):
+        raise ValueError(f"La etapa '{stage}' usa procesos; map_in_stage requiere una etapa de hilos")
+    return _get_pool(stage).map(fn, items)
+
+
+def shutdown() -> None:
+    """
+    Cierra todos los pools (al apagar la aplicación).
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
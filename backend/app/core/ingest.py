@@ -0,0 +1,191 @@
+# ingest.py
+# Preparación de los DataFrames al subirse: inferencia de tipos y columnas derivadas que
+# las agregaciones reutilizan sin volver a parsear ni modificar el DataFrame original
+import logging
+import warnings
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de las columnas derivadas; nunca se muestran al usuario ni a la IA
+DERIVED_COLUMN_PREFIX = "__periodo_"
+# Valores que se prueban antes de intentar convertir una columna completa a fecha
+DATE_SNIFF_SAMPLE = 200
+
+
+def period_key_column(column: str, freq: str) -> str:
+    return f"{DERIVED_COLUMN_PREFIX}{freq}__{column}"
+
+
+def is_derived_column(column) -> bool:
+    return isinstance(column, str) and column.startswith(DERIVED_COLUMN_PREFIX)
+
+
+def visible_columns(df: pd.DataFrame) -> List[str]:
+    """
+    Columnas originales del archivo (sin las derivadas).
+    """
+    return [col for col in df.columns if not is_derived_column(col)]
+
+
+def prepare_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pasada única al subir un archivo:
+    - convierte a datetime64 las columnas de texto que contienen fechas;
+    - precalcula, para cada columna temporal, claves enteras de día/mes/trimestre
+      como columnas derivadas (agrupar por enteros es mucho más barato que por fechas o textos).
+    """
+    for col in visible_columns(df):
+        if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
+            parsed = _parse_dates(df[col])
+            if parsed is not None:
+                df[col] = parsed
+                logger.info(f"Columna '{col}' convertida a temporal al subir el archivo")
+    for col in visible_columns(df):
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            for freq, keys in _period_keys(df[col]).items():
+                df[period_key_column(col, freq)] = keys
+    return df
+
+
+def compact_dtypes(df: pd.DataFrame, category_max_ratio: float = 0.5, arrow_strings: bool = False) -> pd.DataFrame:
+    """
+    Reduce la memoria del DataFrame sin perder información:
+    - columnas de texto con pocos valores distintos (≤ category_max_ratio de las filas) → category;
+    - el resto de textos → string[pyarrow] si arrow_strings está activo;
+    - enteros → el tipo entero más pequeño que contiene todos los valores;
+    - flotantes → float32 solo si la conversión es exacta.
+    Los dtypes que ve la IA no cambian (ver logical_dtype).
+    """
+    rows = len(df)
+    for col in visible_columns(df):
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+            continue
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if rows and series.nunique(dropna=True) <= rows * category_max_ratio:
+                df[col] = series.astype("category")
+            elif arrow_strings and series.dropna().map(type).eq(str).all():
+                df[col] = series.astype("string[pyarrow]")
+        elif pd.api.types.is_integer_dtype(series) and not pd.api.types.is_extension_array_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series) and series.dtype == np.float64:
+            as_float32 = series.to_numpy().astype(np.float32)
+            if np.array_equal(as_float32.astype(np.float64), series.to_numpy(), equal_nan=True):
+                df[col] = as_float32
+    return df
+
+
+def logical_dtype(series: pd.Series) -> str:
+    """
+    Nombre de dtype estable para el resumen y la IA (classify_columns busca "int", "float",
+    "object"/"string" y "datetime"): oculta la compactación de tipos de compact_dtypes.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return logical_dtype(pd.Series(dtype.categories))
+    if pd.api.types.is_bool_dtype(dtype):
+        return str(dtype)
+    if pd.api.types.is_integer_dtype(dtype):
+        return "int64"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float64"
+    if pd.api.types.is_string_dtype(dtype) and not pd.api.types.is_datetime64_any_dtype(dtype):
+        return "object"
+    return str(dtype)
+
+
+def _parse_dates(series: pd.Series):
+    """
+    Retorna la columna convertida a datetime64 si TODOS sus valores no nulos son fechas; si no, None.
+    Primero se prueba una muestra para descartar rápido las columnas que no son fechas.
+    """
+    values = series.dropna()
+    if values.empty:
+        return None
+    sample = values.iloc[:DATE_SNIFF_SAMPLE].astype(str)
+    # Números sueltos ("2019", "12345") no se tratan como fechas
+    if sample.str.fullmatch(r"\s*[-+]?\d+(\.\d+)?\s*").any():
+        return None
+    with warnings.catch_warnings():
+        # guess_datetime_format avisa cuando el formato detectado pone el día primero
+        warnings.simplefilter("ignore", UserWarning)
+        date_format = guess_datetime_format(sample.iloc[0])
+    if date_format is None:
+        return None
+    try:
+        pd.to_datetime(sample, format=date_format)
+        return pd.to_datetime(series, format=date_format)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _period_keys(series: pd.Series) -> dict:
+    """
+    Claves enteras por periodo contadas desde 1970-01-01: días, meses y trimestres.
+    Los valores NaT quedan como nulos (Int32 admite nulos).
+    """
+    if getattr(series.dt, "tz", None) is not None:
+        series = series.dt.tz_localize(None)
+    mask = series.isna().to_numpy()
+    values = series.to_numpy()
+    months = values.astype("datetime64[M]").astype(np.int64)
+    keys = {
+        "day": values.astype("datetime64[D]").astype(np.int64),
+        "month": months,
+        "quarter": months // 3,
+    }
+    return {
+        freq: pd.arrays.IntegerArray(np.where(mask, 0, key).astype(np.int32), mask.copy())
+        for freq, key in keys.items()
+    }
+
+
+def choose_period(df: pd.DataFrame, column: str) -> str:
+    """
+    Nivel de agregación temporal según el rango de fechas (mismo criterio que antes):
+    más de 2 años → trimestre; más de 3 meses o más de 30 fechas → mes; si no, día.
+    """
+    days = _get_period_keys(df, column, "day")
+    valid = days.dropna()
+    if valid.empty:
+        return "day"
+    range_days = int(valid.max() - valid.min())
+    if range_days > 365 * 2:
+        return "quarter"
+    if range_days > 90 or df[column].nunique() > 30:
+        return "month"
+    return "day"
+
+
+def temporal_group_keys(df: pd.DataFrame, column: str) -> Tuple[str, pd.Series]:
+    """
+    Retorna el periodo elegido y la serie de claves enteras (con el nombre de la columna)
+    para agrupar por ella sin modificar el DataFrame.
+    """
+    freq = choose_period(df, column)
+    return freq, _get_period_keys(df, column, freq).rename(column)
+
+
+def period_labels(keys: pd.Series, freq: str) -> pd.Series:
+    """
+    Convierte claves enteras en etiquetas legibles: 2018Q1, 2018-01 o 2018-01-15.
+    Solo se aplica a los grupos ya agregados (pocas filas).
+    """
+    values = keys.astype("int64")
+    if freq == "quarter":
+        return (1970 + values // 4).astype(str) + "Q" + (values % 4 + 1).astype(str)
+    if freq == "month":
+        return (1970 + values // 12).astype(str).str.zfill(4) + "-" + (values % 12 + 1).astype(str).str.zfill(2)
+    return pd.to_datetime(values, unit="D").dt.strftime("%Y-%m-%d")
+
+
+def _get_period_keys(df: pd.DataFrame, column: str, freq: str) -> pd.Series:
+    key_column = period_key_column(column, freq)
+    if key_column in df.columns:
+        return df[key_column]
+    # DataFrame sin preparar (p. ej. persistido por una versión anterior): se calcula al vuelo
+    return pd.Series(_period_keys(df[column])[freq], index=df.index)
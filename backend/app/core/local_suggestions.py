@@ -0,0 +1,138 @@
+# local_suggestions.py
+# Motor de sugerencias local y determinista: convierte la clasificación de columnas que alimenta el
+# prompt (ver app/core/columns.py) en sugerencias de gráficos en milisegundos, sin llamar al LLM
+from typing import Any, Dict, List, Optional
+from app.core.columns import classify_columns, column_usefulness
+
+# Modos de /suggest: solo reglas locales, solo LLM, o ambos compitiendo contra un plazo
+SUGGEST_ENGINES = ("local", "llm", "race")
+# Mismo número de sugerencias que pide el prompt
+MAX_SUGGESTIONS = 5
+# Máximo de categorías para ejes de barras y box plots (más serían ilegibles)
+MAX_AXIS_CATEGORIES = 15
+
+
+def _numeric_agg(stats: Dict[str, Any]) -> str:
+    # Las métricas sin valores negativos (ventas, unidades...) se suman; el resto se promedia
+    minimum = stats.get("min")
+    return "sum" if isinstance(minimum, (int, float)) and minimum >= 0 else "mean"
+
+
+def _agg_label(agg_func: str) -> str:
+    return "Total" if agg_func == "sum" else "Promedio"
+
+
+def _suggestion(title: str, chart_type: str, insight: str, x_axis: str,
+                y_axis: Optional[str] = None, agg_func: Optional[str] = None) -> Dict[str, Any]:
+    parameters: Dict[str, Any] = {"x_axis": x_axis}
+    if y_axis is not None:
+        parameters["y_axis"] = y_axis
+    if agg_func is not None:
+        parameters["agg_func"] = agg_func
+    return {"title": title, "chart_type": chart_type, "parameters": parameters, "insight": insight}
+
+
+def _candidates(summary: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Gráficos posibles para el dataset, de los más útiles a los menos, según el tipo y la
+    cardinalidad de cada columna (la misma clasificación que recibe el LLM).
+    """
+    columns = summary.get("columns", [])
+    dtypes = summary.get("dtypes", {})
+    describe = summary.get("describe", {})
+    classification, analysis = classify_columns(columns, dtypes, describe, summary.get("approximate") or {})
+    counts = [stats.get("count") for stats in describe.values() if isinstance(stats, dict)]
+    total_rows = max((c for c in counts if isinstance(c, (int, float))), default=None)
+
+    def ranked(names: List[str]) -> List[str]:
+        return sorted(names, key=lambda col: -column_usefulness(classification[col][0], describe.get(col, {}), total_rows))
+
+    def unique(col: str) -> float:
+        value = describe.get(col, {}).get("unique")
+        return value if isinstance(value, (int, float)) else 0
+
+    # Las métricas constantes no aportan a ningún gráfico
+    numeric = [col for col in ranked(analysis["numeric_columns"]) if describe.get(col, {}).get("std")]
+    categorical = [col for col in ranked(analysis["categorical_columns"]) if 2 <= unique(col) <= MAX_AXIS_CATEGORIES]
+    pie_categorical = [col for col in categorical if unique(col) <= 7]
+    temporal = analysis["temporal_columns"]
+    high_cardinality = [
+        col for col in ranked(analysis["high_cardinality_columns"]) if classification[col][0] != "IDENTIFICADOR ÚNICO"
+    ]
+
+    candidates = []
+    for x in categorical[:2]:
+        for y in numeric[:2]:
+            agg = _numeric_agg(describe.get(y, {}))
+            candidates.append(_suggestion(
+                f"{_agg_label(agg)} de {y} por {x}", "bar",
+                f"Compara el {_agg_label(agg).lower()} de {y} entre las categorías de {x} para identificar cuáles concentran más valor y priorizar acciones.",
+                x, y, agg,
+            ))
+    for x in pie_categorical[:2]:
+        candidates.append(_suggestion(
+            f"Distribución de registros por {x}", "donut",
+            f"Muestra la proporción de cada categoría de {x} para evaluar la composición del dataset y detectar concentraciones.",
+            x,
+        ))
+    if len(numeric) >= 2:
+        x, y = numeric[0], numeric[1]
+        candidates.append(_suggestion(
+            f"Relación entre {x} y {y}", "scatter",
+            f"Examina si {x} y {y} varían juntas para detectar correlaciones y valores atípicos.",
+            x, y,
+        ))
+    for x in temporal[:1]:
+        if numeric:
+            y = numeric[0]
+            agg = _numeric_agg(describe.get(y, {}))
+            candidates.append(_suggestion(
+                f"Evolución del {_agg_label(agg).lower()} de {y}", "line",
+                f"Observa la tendencia de {y} a lo largo de {x} para identificar estacionalidad, picos y cambios de ritmo.",
+                x, y, agg,
+            ))
+        candidates.append(_suggestion(
+            f"Registros a lo largo del tiempo ({x})", "area",
+            f"Muestra cuántos registros hay en cada periodo de {x} para detectar temporadas de mayor y menor actividad.",
+            x, None, "count",
+        ))
+    for x in categorical[:2]:
+        for y in numeric[:1]:
+            candidates.append(_suggestion(
+                f"Distribución de {y} por {x}", "box",
+                f"Compara la dispersión y los valores atípicos de {y} entre las categorías de {x} para detectar diferencias de comportamiento.",
+                x, y,
+            ))
+    for x in categorical + high_cardinality[:1]:
+        candidates.append(_suggestion(
+            f"Registros por {x}", "bar",
+            f"Cuenta los registros de cada categoría de {x} para identificar las más frecuentes.",
+            x, None, "count",
+        ))
+    return candidates
+
+
+def suggest_locally(summary: Dict[str, Any], max_suggestions: int = MAX_SUGGESTIONS) -> List[Dict[str, Any]]:
+    """
+    Sugerencias por reglas con el mismo formato que las del LLM. Como pide el prompt, se
+    prefieren tipos de gráfico y columnas de eje X distintos; si no alcanzan, se repiten.
+    """
+    candidates = _candidates(summary)
+    selected: List[Dict[str, Any]] = []
+    used_types, used_x = set(), set()
+    # Primero tipo y eje nuevos, luego tipo nuevo, luego eje nuevo y al final cualquiera no elegido
+    for accept in (
+        lambda c: c["chart_type"] not in used_types and c["parameters"]["x_axis"] not in used_x,
+        lambda c: c["chart_type"] not in used_types,
+        lambda c: c["parameters"]["x_axis"] not in used_x,
+        lambda c: True,
+    ):
+        for candidate in candidates:
+            if len(selected) >= max_suggestions:
+                return selected
+            if candidate in selected or not accept(candidate):
+                continue
+            selected.append(candidate)
+            used_types.add(candidate["chart_type"])
+            used_x.add(candidate["parameters"]["x_axis"])
+    return selected
@@ -0,0 +1,171 @@
+# metrics.py
+# Métricas del servidor en formato de texto de Prometheus (/metrics): latencia por ruta,
+# tiempos por etapa con la clase de tamaño del dataset y valores que se leen al consultar
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Prefijo de todas las métricas
+NAMESPACE = "analisis"
+# Límites superiores (en segundos) de los buckets de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Clases de tamaño de los datasets (etiquetas "rows" y "columns"): el límite superior de cada clase.
+# Así una etapa lenta se asocia a entradas grandes sin una serie por cada tamaño exacto.
+ROW_CLASSES = ((1_000, "1k"), (10_000, "10k"), (100_000, "100k"), (1_000_000, "1m"), (10_000_000, "10m"))
+COLUMN_CLASSES = ((10, "10"), (50, "50"), (200, "200"))
+
+
+def size_class(value: Optional[int], classes: Sequence[Tuple[int, str]]) -> str:
+    if value is None:
+        return "unknown"
+    for limit, label in classes:
+        if value <= limit:
+            return label
+    return "inf"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Histograma con etiquetas (acumulado, como los de Prometheus). Seguro entre hilos.
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de etiquetas: conteos por bucket (el último es +Inf), suma y total
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total[0]) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Histogramas propios y métricas que se leen al generar la salida (tamaño del almacén,
+    aciertos de cachés...). Cada proceso tiene la suya: con varios workers de uvicorn,
+    Prometheus debe consultar cada uno.
+    """
+
+    def __init__(self):
+        self._histograms: List[Histogram] = []
+        self._callbacks: List[Tuple[str, str, str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        histogram = Histogram(f"{NAMESPACE}_{name}", help_text, labelnames, buckets)
+        with self._lock:
+            self._histograms.append(histogram)
+        return histogram
+
+    def register(self, name: str, help_text: str, read: Callable[[], float], metric_type: str = "gauge") -> None:
+        """
+        Métrica sin etiquetas cuyo valor se lee al consultar /metrics. `metric_type` es
+        "gauge" o "counter" (valores acumulados que solo crecen, como expulsiones).
+        """
+        self.register_labeled(name, help_text, lambda: {(): read()}, metric_type)
+
+    def register_labeled(self, name: str, help_text: str, read: Callable[[], Dict[Tuple[Tuple[str, str], ...], float]],
+                         metric_type: str = "gauge") -> None:
+        """
+        Igual que register, pero `read` retorna {((etiqueta, valor), ...): valor}.
+        """
+        with self._lock:
+            self._callbacks.append((f"{NAMESPACE}_{name}", help_text, metric_type, read))
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = list(self._histograms)
+            callbacks = list(self._callbacks)
+        lines: List[str] = []
+        for name, help_text, metric_type, read in callbacks:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in read().items():
+                lines.append(f"{name}{_format_labels(dict(labels))} {_format_value(value)}")
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", ("method", "route", "status")
+)
+STAGE_SECONDS = registry.histogram(
+    "stage_duration_seconds",
+    "Duración de cada etapa (hash, parse, prepare, summary, persist, prompt, llm, llm_first, aggregate, serialize) por clase de tamaño del dataset",
+    ("stage", "rows", "columns"),
+)
+
+# Tamaño de los prompts enviados al LLM (tokens estimados, ver compile_prompt en app/core/ai.py)
+PROMPT_TOKENS = registry.histogram(
+    "prompt_tokens", "Tokens estimados de cada prompt de /suggest", (),
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000),
+)
+
+
+def observe_stage(stage: str, seconds: float, rows: Optional[int] = None, columns: Optional[int] = None) -> None:
+    STAGE_SECONDS.observe(
+        seconds, stage=stage, rows=size_class(rows, ROW_CLASSES), columns=size_class(columns, COLUMN_CLASSES)
+    )
+
+
+@contextmanager
+def time_stage(stage: str, rows: Optional[int] = None, columns: Optional[int] = None) -> Iterator[Dict[str, Optional[int]]]:
+    """
+    Mide el bloque como una etapa. El tamaño puede fijarse al entrar o, si solo se conoce
+    dentro del bloque, asignando size["rows"] / size["columns"] en el dict que retorna.
+    """
+    size: Dict[str, Optional[int]] = {"rows": rows, "columns": columns}
+    start = time.perf_counter()
+    try:
+        yield size
+    finally:
+        observe_stage(stage, time.perf_counter() - start, size["rows"], size["columns"])
+
+
+def render() -> str:
+    return registry.render()
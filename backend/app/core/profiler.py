@@ -0,0 +1,234 @@
+# profiler.py
+# Perfil estadístico de un DataFrame al subirlo: reemplaza describe(include='all') + df.info()
+# con una pasada vectorizada por columna y produce el mismo formato de salida
+import logging
+import warnings
+from functools import reduce
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from app.core.sketches import NumericSketch, DatetimeSketch, CategoricalSketch
+from app.core.executors import map_in_stage
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (25, 50, 75)
+PERCENTILE_LABELS = ("25%", "50%", "75%")
+
+
+def profile_dataframe(df: pd.DataFrame, percentiles: bool = True,
+                      columns: Optional[List[str]] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """
+    Calcula las estadísticas de describe(include='all') para las columnas `columns` (por defecto todas):
+    - numéricas: count, mean, std, min, percentiles y max, columna a columna en su propio dtype
+      (la memoria adicional no pasa de unas pocas copias de una columna);
+    - fechas: count, mean, min, percentiles y max;
+    - texto, categorías y booleanos: count, unique, top y freq (las category se cuentan sobre
+      sus códigos enteros, sin volver a comparar textos).
+    Con percentiles=False se omiten los cuartiles, que requieren ordenar cada columna y no
+    se usan en el prompt.
+
+    Retorna el dict de describe (estadísticas ausentes como "", igual que describe().fillna(""))
+    y los valores no nulos por columna (para el texto de info).
+    """
+    columns = list(df.columns) if columns is None else columns
+    profiles: Dict[str, Dict[str, Any]] = {}
+    for col in columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series) or not (
+            pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)
+        ):
+            profiles[col] = _categorical_stats(series)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            profiles[col] = _datetime_stats(series, percentiles)
+        else:
+            profiles[col] = _numeric_stats(series, percentiles)
+    return _assemble(columns, profiles)
+
+
+def sketch_dataframe(
+    df: pd.DataFrame,
+    percentiles: bool = True,
+    chunk_rows: int = 262144,
+    precision: int = 12,
+    compression: float = 300,
+    top_capacity: int = 64,
+    columns: Optional[List[str]] = None,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int], Dict[str, Dict[str, float]]]:
+    """
+    Variante aproximada de profile_dataframe para archivos muy grandes: recorre el DataFrame
+    en bloques de `chunk_rows` filas; cada bloque produce sketches independientes (ver
+    sketches.py) con memoria acotada. Los bloques se procesan en paralelo en los hilos de la
+    etapa "aggregate_local" (ordenar, hashear y contar con numpy/pandas libera el GIL en su
+    mayor parte) y se combinan en orden a medida que terminan, así el resultado no depende
+    del número de hilos.
+    Conteos, nulos, media, std, mínimo y máximo son exactos; los valores distintos, los
+    cuartiles y el valor más frecuente son estimaciones.
+
+    Retorna además las cotas de error por columna (solo las columnas con estadísticas aproximadas).
+    """
+    columns = list(df.columns) if columns is None else columns
+
+    def sketch_chunk(start: int) -> Dict[str, Any]:
+        sketches = {}
+        for col in columns:
+            series = df[col]
+            sketch = _column_sketch(series, percentiles, precision, compression, top_capacity)
+            sketch.update(series.iloc[start:start + chunk_rows])
+            sketches[col] = sketch
+        return sketches
+
+    def merge(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+        for col, sketch in right.items():
+            left[col].merge(sketch)
+        return left
+
+    starts = range(0, max(len(df), 1), chunk_rows)
+    chunks = map(sketch_chunk, starts) if len(starts) == 1 else map_in_stage("aggregate_local", sketch_chunk, starts)
+    sketches = reduce(merge, chunks)
+    labels = list(zip(PERCENTILE_LABELS, (p / 100 for p in PERCENTILES)))
+    describe, non_null = _assemble(columns, {col: sketch.describe(labels) for col, sketch in sketches.items()})
+    errors = {col: sketch.errors() for col, sketch in sketches.items() if sketch.errors()}
+    return describe, non_null, errors
+
+
+def _assemble(columns: List[str], profiles: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    # Mismo orden de estadísticas que describe: primero las de los perfiles más cortos
+    stat_names: List[str] = []
+    for profile in sorted((profiles[col] for col in columns), key=len):
+        stat_names.extend(name for name in profile if name not in stat_names)
+    describe = {
+        col: {name: _fill(profiles[col].get(name)) for name in stat_names}
+        for col in columns
+    }
+    non_null = {col: int(profiles[col]["count"]) for col in columns}
+    return describe, non_null
+
+
+def _column_sketch(series: pd.Series, percentiles: bool, precision: int, compression: float, top_capacity: int):
+    if pd.api.types.is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+        return CategoricalSketch(exact=True, precision=precision, capacity=top_capacity)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return DatetimeSketch(percentiles, compression, series.dtype)
+    if pd.api.types.is_numeric_dtype(series):
+        return NumericSketch(percentiles, compression)
+    return CategoricalSketch(exact=False, precision=precision, capacity=top_capacity)
+
+
+def info_text(df: pd.DataFrame, non_null: Dict[str, int], columns: Optional[List[str]] = None) -> str:
+    """
+    Texto equivalente a df[columns].info() a partir de los conteos ya calculados (sin recorrer los datos).
+    """
+    columns = list(df.columns) if columns is None else columns
+    index = df.index
+    index_line = f"{type(index).__name__}: {len(index)} entries"
+    if len(index):
+        index_line += f", {index[0]} to {index[-1]}"
+    headers = (" # ", "Column", "Non-Null Count", "Dtype")
+    rows = [
+        (f" {position}", str(col), f"{non_null[col]} non-null", str(df[col].dtype))
+        for position, col in enumerate(columns)
+    ]
+    widths = [max([len(header)] + [len(row[i]) for row in rows]) for i, header in enumerate(headers)]
+
+    def format_row(cells) -> str:
+        return "  ".join(cell.ljust(width) for cell, width in zip(cells, widths))
+
+    dtype_counts = df.dtypes[columns].astype(str).value_counts().sort_index()
+    lines = [
+        str(type(df)),
+        index_line,
+        f"Data columns (total {len(columns)} columns):",
+        format_row(headers),
+        format_row("-" * len(header) for header in headers),
+        *(format_row(row) for row in rows),
+        "dtypes: " + ", ".join(f"{dtype}({count})" for dtype, count in dtype_counts.items()),
+        f"memory usage: {_format_memory(df, columns)}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def _numeric_stats(series: pd.Series, percentiles: bool) -> Dict[str, Any]:
+    # Solo los valores válidos, en el dtype de la columna (los enteros no se copian a float64)
+    dtype = getattr(series.dtype, "numpy_dtype", series.dtype)
+    if series.hasnans:
+        # na_value solo rellena los huecos que la máscara descarta
+        values = series.to_numpy(dtype=dtype, na_value=0)[series.notna().to_numpy()]
+    else:
+        values = series.to_numpy(dtype=dtype)
+    stats = {"count": float(len(values)), "mean": np.nan, "std": np.nan, "min": np.nan}
+    if percentiles:
+        stats.update(dict.fromkeys(PERCENTILE_LABELS, np.nan))
+    stats["max"] = np.nan
+    if len(values):
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            # Con un solo valor std es NaN, igual que describe
+            warnings.simplefilter("ignore", RuntimeWarning)
+            stats["mean"] = values.mean(dtype=np.float64)
+            stats["std"] = values.std(dtype=np.float64, ddof=1)
+            stats["min"], stats["max"] = values.min(), values.max()
+            if percentiles:
+                stats.update(zip(PERCENTILE_LABELS, np.percentile(values, PERCENTILES)))
+    return {name: float(value) for name, value in stats.items()}
+
+
+def _datetime_stats(series: pd.Series, percentiles: bool) -> Dict[str, Any]:
+    tz = getattr(series.dt, "tz", None)
+    if tz is not None:
+        series = series.dt.tz_convert(None)
+    values = series.to_numpy()
+    ticks = values[~np.isnat(values)].view(np.int64)
+    names = ["mean", "min", *(PERCENTILE_LABELS if percentiles else ()), "max"]
+    stats: Dict[str, Any] = {"count": int(len(ticks)), **dict.fromkeys(names)}
+    if not len(ticks):
+        return stats
+    points = {"mean": ticks.mean(), "min": ticks.min(), "max": ticks.max()}
+    if percentiles:
+        points.update(zip(PERCENTILE_LABELS, np.percentile(ticks, PERCENTILES)))
+    unit = np.datetime_data(values.dtype)[0]
+    for name, tick in points.items():
+        timestamp = pd.Timestamp(np.datetime64(int(round(float(tick))), unit))
+        stats[name] = timestamp.tz_localize("UTC").tz_convert(tz) if tz is not None else timestamp
+    return stats
+
+
+def _categorical_stats(series: pd.Series) -> Dict[str, Any]:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        frequencies = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+        count = int(frequencies.sum())
+        stats = {"count": count, "unique": int(np.count_nonzero(frequencies)), "top": None, "freq": None}
+        if count:
+            top = int(frequencies.argmax())
+            stats["top"] = _native(series.cat.categories[top])
+            stats["freq"] = int(frequencies[top])
+        return stats
+    # Texto y booleanos: un único value_counts da count, unique, top y freq
+    value_counts = series.value_counts(dropna=True)
+    stats = {"count": int(value_counts.sum()), "unique": int(len(value_counts)), "top": None, "freq": None}
+    if len(value_counts):
+        stats["top"] = _native(value_counts.index[0])
+        stats["freq"] = int(value_counts.iloc[0])
+    return stats
+
+
+def _native(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _fill(value: Any) -> Any:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return value
+
+
+def _format_memory(df: pd.DataFrame, columns: List[str]) -> str:
+    # Igual que df.info(): uso superficial, con "+" si hay columnas object (su contenido no se mide)
+    usage = df.memory_usage(index=True, deep=False)
+    size = float(usage[["Index", *columns]].sum())
+    qualifier = "+" if any(pd.api.types.is_object_dtype(dtype) for dtype in df.dtypes[columns]) else ""
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if size < 1024.0:
+            return f"{size:3.1f}{qualifier} {unit}"
+        size /= 1024.0
+    return f"{size:3.1f}{qualifier} TB"
@@ -0,0 +1,227 @@
+# profiling.py
+# Perfilado bajo demanda de peticiones concretas (PROFILING_ENABLED): la petición que lo pide se
+# ejecuta bajo cProfile, tanto en el event loop como en los trabajadores de cada etapa, y el reporte
+# (árbol de llamadas y llamadas más costosas de pandas/numpy/pyarrow) se guarda para consultarlo después
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.config import PROFILING_DIR, PROFILING_MAX_REPORTS, PROFILING_TOP_FUNCTIONS
+
+logger = logging.getLogger(__name__)
+
+REQUEST_HEADER = "x-profile"
+QUERY_FLAG = "profile"
+# Header de la respuesta con el id del reporte (GET /profiles/{id})
+RESPONSE_HEADER = "X-Profile-Id"
+_TRUE_VALUES = ("1", "true", "yes")
+_REPORT_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+# Funciones de estas bibliotecas se listan aparte: suelen ser las que explican una petición lenta
+_LIBRARY_RE = r"[/\\](pandas|numpy|pyarrow)[/\\]"
+
+# Perfil de la petición en curso; las tareas y llamadas a run_in_stage lo heredan por contexto
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+# cProfile solo admite un perfilador activo por hilo: se perfila una petición a la vez
+_active = threading.Lock()
+
+
+class _StatsHolder:
+    """
+    Estadísticas ya recogidas (de un trabajador) con la interfaz que pstats.Stats acepta.
+    """
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+class RequestProfile:
+    """
+    Perfil de una petición: el del event loop y los que envían los trabajadores de cada etapa.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.created = datetime.now().isoformat(timespec="milliseconds")
+        self.loop_profiler = cProfile.Profile()
+        self.stages: List[Dict[str, Any]] = []
+        self._worker_stats: List[Dict] = []
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, function: str, seconds: float, stats: Optional[Dict]) -> None:
+        with self._lock:
+            self.stages.append({"stage": stage, "function": function, "seconds": seconds, "profiled": stats is not None})
+            if stats is not None:
+                self._worker_stats.append(stats)
+
+    def merged_stats(self, stream: io.StringIO) -> pstats.Stats:
+        stats = pstats.Stats(stream=stream)
+        stats.add(self.loop_profiler)
+        with self._lock:
+            for worker_stats in self._worker_stats:
+                stats.add(_StatsHolder(worker_stats))
+        return stats
+
+
+def requested(headers, query_params) -> bool:
+    """
+    La petición pide perfilado con el header "X-Profile: 1" o el parámetro "?profile=1".
+    """
+    value = headers.get(REQUEST_HEADER) or query_params.get(QUERY_FLAG) or ""
+    return value.lower() in _TRUE_VALUES
+
+
+def current() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def start(method: str, path: str) -> Optional[Tuple[RequestProfile, Any]]:
+    """
+    Empieza a perfilar la petición en el event loop. Retorna (perfil, token del contexto), o None
+    si ya se está perfilando otra (la petición se atiende igual, sin perfil).
+    """
+    if not _active.acquire(blocking=False):
+        logger.warning(f"Perfilado de {method} {path} omitido: ya hay otra petición perfilándose")
+        return None
+    profile = RequestProfile(method, path)
+    token = _current.set(profile)
+    profile.loop_profiler.enable()
+    return profile, token
+
+
+def stop(profile: RequestProfile, token: Any) -> None:
+    profile.loop_profiler.disable()
+    profile.duration = time.perf_counter() - profile._start
+    _current.reset(token)
+    _active.release()
+
+
+def profiled_call(fn: Callable, *args, **kwargs) -> Tuple[Any, Optional[Dict]]:
+    """
+    Ejecuta fn bajo cProfile en el hilo o proceso de trabajo y retorna (resultado, estadísticas).
+    Si el intérprete no permite otro perfilador activo, se ejecuta sin perfilar.
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return fn(*args, **kwargs), None
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+def build_report(profile: RequestProfile, status: int) -> Tuple[str, pstats.Stats]:
+    """
+    Reporte en texto: etapas, funciones por tiempo acumulado, llamadas de pandas/numpy/pyarrow
+    y árbol de llamadas (funciones llamadas por las más costosas). Incluye todo lo que corrió en el
+    event loop mientras duró la petición, también el trabajo de otras peticiones concurrentes.
+    """
+    stream = io.StringIO()
+    stream.write(f"Petición {profile.method} {profile.path} → {status}\n")
+    stream.write(f"Id: {profile.id}  Fecha: {profile.created}  Duración: {profile.duration:.3f} s\n\n")
+    stream.write("Etapas en trabajadores:\n")
+    for stage in profile.stages:
+        note = "" if stage["profiled"] else " (sin perfil)"
+        stream.write(f"  {stage['stage']:16s} {stage['function']:40s} {stage['seconds']:.3f} s{note}\n")
+    if not profile.stages:
+        stream.write("  (ninguna)\n")
+
+    stats = profile.merged_stats(stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    stream.write("\n=== Funciones con mayor tiempo acumulado ===\n")
+    stats.print_stats(PROFILING_TOP_FUNCTIONS)
+    stream.write("\n=== Llamadas de pandas / numpy / pyarrow ===\n")
+    stats.print_stats(_LIBRARY_RE, PROFILING_TOP_FUNCTIONS)
+    stream.write("\n=== Árbol de llamadas ===\n")
+    stats.print_callees(PROFILING_TOP_FUNCTIONS)
+    return stream.getvalue(), stats
+
+
+def save_report(profile: RequestProfile, status: int) -> None:
+    """
+    Guarda el reporte de texto, las estadísticas crudas (.prof, para snakeviz o pstats) y sus
+    metadatos, y elimina los reportes más antiguos por encima de PROFILING_MAX_REPORTS.
+    """
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    text, stats = build_report(profile, status)
+    base = os.path.join(PROFILING_DIR, profile.id)
+    try:
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(text)
+        stats.dump_stats(f"{base}.prof")
+        # Los metadatos se escriben al final: un reporte listado está completo
+        meta = {
+            "request_id": profile.id,
+            "method": profile.method,
+            "path": profile.path,
+            "status": status,
+            "duration_seconds": profile.duration,
+            "created": profile.created,
+        }
+        tmp_path = f"{base}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, f"{base}.json")
+    except OSError as e:
+        logger.warning(f"No se pudo guardar el perfil {profile.id}: {e}")
+        return
+    logger.info(f"Perfil de {profile.method} {profile.path} guardado como {profile.id}")
+    _prune()
+
+
+def _prune() -> None:
+    reports = list_reports()
+    for meta in reports[PROFILING_MAX_REPORTS:]:
+        for extension in ("json", "txt", "prof"):
+            try:
+                os.remove(os.path.join(PROFILING_DIR, f"{meta['request_id']}.{extension}"))
+            except FileNotFoundError:
+                pass
+
+
+def list_reports() -> List[Dict[str, Any]]:
+    """
+    Metadatos de los reportes guardados, del más reciente al más antiguo.
+    """
+    if not os.path.isdir(PROFILING_DIR):
+        return []
+    reports = []
+    for name in os.listdir(PROFILING_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILING_DIR, name), encoding="utf-8") as f:
+                reports.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    reports.sort(key=lambda meta: meta.get("created", ""), reverse=True)
+    return reports
+
+
+def report_path(request_id: str, extension: str = "txt") -> Optional[str]:
+    """
+    Ruta de un archivo del reporte, o None si no existe o el id no es válido.
+    """
+    if not _REPORT_ID_RE.match(request_id):
+        return None
+    path = os.path.join(PROFILING_DIR, f"{request_id}.{extension}")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,352 @@
+# sketches.py
+# Sketches combinables para resúmenes aproximados de archivos muy grandes: HyperLogLog (valores
+# distintos), t-digest (cuantiles), Misra-Gries (valores más frecuentes) y momentos/nulos exactos.
+# Todos se actualizan por bloques de filas y se combinan con merge(), así los bloques pueden
+# procesarse en paralelo y unirse al final.
+import math
+from typing import Dict, Any, Optional
+import numpy as np
+import pandas as pd
+
+# Constante de la función de escala k1 del t-digest
+_TWO_PI = 2 * math.pi
+
+
+class HyperLogLog:
+    """
+    Estimador de cardinalidad con 2^precision registros (error relativo típico 1.04/√m).
+    """
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def update_hashes(self, hashes: np.ndarray) -> None:
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.intp)
+        rest = (hashes & np.uint64((1 << width) - 1)).astype(np.float64)  # < 2^52: exacto en float64
+        # Posición del primer bit 1 (desde la izquierda) en los `width` bits restantes
+        bit_length = np.frexp(rest)[1]
+        rank = (width - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Rango pequeño: conteo lineal
+            return m * math.log(m / zeros)
+        return float(raw)
+
+
+class TDigest:
+    """
+    Resumen de cuantiles por centroides (t-digest con escala k1): la precisión es mayor en las
+    colas y el número de centroides queda acotado por ~compression/2.
+    """
+
+    def __init__(self, compression: float = 300):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64)
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    @property
+    def total(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: np.ndarray) -> None:
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        values = np.sort(values)
+        self.minimum = min(self.minimum, float(values[0]))
+        self.maximum = max(self.maximum, float(values[-1]))
+        # El bloque ya ordenado se comprime por separado; luego solo se combinan centroides
+        chunk = TDigest(self.compression)
+        chunk._compress_sorted(values, np.ones(len(values)))
+        self._compress(chunk.means, chunk.weights)
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        if len(other.weights):
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+            self._compress(other.means, other.weights)
+        return self
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> None:
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="mergesort")
+        self._compress_sorted(means[order], weights[order])
+
+    def _compress_sorted(self, means: np.ndarray, weights: np.ndarray) -> None:
+        cumulative = np.cumsum(weights)
+        left_q = (cumulative - weights) / cumulative[-1]
+        # Centroides cuyo borde izquierdo cae en la misma unidad de la escala k se fusionan
+        k = self.compression / _TWO_PI * np.arcsin(np.clip(2 * left_q - 1, -1, 1))
+        bucket = np.floor(k - k[0]).astype(np.intp)
+        merged_weights = np.bincount(bucket, weights=weights)
+        merged_sums = np.bincount(bucket, weights=weights * means)
+        keep = merged_weights > 0
+        self.weights = merged_weights[keep]
+        self.means = merged_sums[keep] / self.weights
+
+    def quantile(self, q: float) -> float:
+        if not len(self.weights):
+            return math.nan
+        # Interpolación lineal entre los centros de masa de los centroides (con min/max exactos)
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate([[0.0], centers, [self.total]])
+        ys = np.concatenate([[self.minimum], self.means, [self.maximum]])
+        return float(np.interp(q * self.total, xs, ys))
+
+    def rank_error(self) -> float:
+        """
+        Cota del error en rango (fracción de filas) de un cuantil: media anchura del mayor centroide
+        (los centroides de un solo valor son exactos).
+        """
+        merged = self.weights[self.weights > 1]
+        if not len(merged):
+            return 0.0
+        return float(merged.max() / self.total / 2)
+
+
+class FrequentItems:
+    """
+    Valores más frecuentes con contadores Misra-Gries combinables: cada frecuencia es una cota
+    inferior y subestima la real como mucho en `error`.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.error = 0
+        # Mayor cota inferior vista (por si todos los contadores se anulan, p. ej. valores únicos)
+        self.best: Optional[tuple] = None
+
+    def update_counts(self, values: np.ndarray, counts: np.ndarray) -> None:
+        """
+        Agrega las frecuencias exactas de un bloque (valores distintos y sus conteos).
+        """
+        if not len(counts):
+            return
+        top = int(counts.argmax())
+        self._remember(values[top], int(counts[top]))
+        if len(counts) > self.capacity:
+            # Resumen Misra-Gries del bloque antes de combinar: solo quedan `capacity` contadores
+            cut = len(counts) - self.capacity - 1
+            threshold = int(np.partition(counts, cut)[cut])
+            keep = counts > threshold
+            values, counts = values[keep], counts[keep] - threshold
+            self.error += threshold
+        self._combine(pd.Series(counts, index=values, dtype=np.int64))
+
+    def merge(self, other: "FrequentItems") -> "FrequentItems":
+        if other.best is not None:
+            self._remember(*other.best)
+        self._combine(other.counts)
+        self.error += other.error
+        return self
+
+    def _combine(self, counts: pd.Series) -> None:
+        if counts.empty:
+            return
+        combined = counts if self.counts.empty else self.counts.add(counts, fill_value=0).astype(np.int64)
+        top = combined.idxmax()
+        self._remember(top, int(combined[top]))
+        if len(combined) > self.capacity:
+            threshold = int(combined.nlargest(self.capacity + 1).iloc[-1])
+            combined = combined - threshold
+            combined = combined[combined > 0]
+            self.error += threshold
+        self.counts = combined
+
+    def _remember(self, value: Any, count: int) -> None:
+        if self.best is None or count > self.best[1]:
+            self.best = (value, count)
+
+    def top(self) -> Optional[tuple]:
+        if not self.counts.empty:
+            value = self.counts.idxmax()
+            self._remember(value, int(self.counts[value]))
+        return self.best
+
+
+class Moments:
+    """
+    Conteo, media, varianza, mínimo y máximo exactos, combinables (algoritmo de Chan).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def update(self, values: np.ndarray) -> None:
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        other = Moments()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.minimum, other.maximum = float(values.min()), float(values.max())
+        self.merge(other)
+
+    def merge(self, other: "Moments") -> "Moments":
+        if not other.count:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+
+class NumericSketch:
+    def __init__(self, percentiles: bool, compression: float):
+        self.moments = Moments()
+        self.digest = TDigest(compression) if percentiles else None
+
+    def update(self, series: pd.Series) -> None:
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        self.moments.update(values)
+        if self.digest is not None:
+            self.digest.update(values)
+
+    def merge(self, other: "NumericSketch") -> "NumericSketch":
+        self.moments.merge(other.moments)
+        if self.digest is not None:
+            self.digest.merge(other.digest)
+        return self
+
+    @property
+    def count(self) -> int:
+        return self.moments.count
+
+    def describe(self, labels) -> Dict[str, Any]:
+        moments = self.moments
+        empty = not moments.count
+        stats = {
+            "count": float(moments.count),
+            "mean": math.nan if empty else moments.mean,
+            "std": moments.std(),
+            "min": math.nan if empty else moments.minimum,
+        }
+        if self.digest is not None:
+            stats.update((label, self.digest.quantile(q)) for label, q in labels)
+        stats["max"] = math.nan if empty else moments.maximum
+        return stats
+
+    def errors(self) -> Dict[str, float]:
+        return {"quantile_rank_error": self.digest.rank_error()} if self.digest is not None else {}
+
+
+class DatetimeSketch(NumericSketch):
+    """
+    Fechas como enteros (ticks desde 1970) en la unidad de la columna; se convierten de vuelta al describir.
+    """
+
+    def __init__(self, percentiles: bool, compression: float, dtype):
+        super().__init__(percentiles, compression)
+        self.tz = getattr(dtype, "tz", None)
+        self.unit = dtype.unit if self.tz is not None else np.datetime_data(dtype)[0]
+
+    def update(self, series: pd.Series) -> None:
+        if self.tz is not None:
+            series = series.dt.tz_convert(None)
+        values = series.to_numpy()
+        ticks = values.view(np.int64).astype(np.float64)
+        ticks[np.isnat(values)] = np.nan
+        self.moments.update(ticks)
+        if self.digest is not None:
+            self.digest.update(ticks)
+
+    def describe(self, labels) -> Dict[str, Any]:
+        stats = super().describe(labels)
+        stats.pop("std")
+        stats["count"] = int(stats["count"])
+        for name, tick in stats.items():
+            if name != "count":
+                stats[name] = None if math.isnan(tick) else self._timestamp(tick)
+        return stats
+
+    def _timestamp(self, tick: float) -> pd.Timestamp:
+        timestamp = pd.Timestamp(np.datetime64(int(round(tick)), self.unit))
+        return timestamp.tz_localize("UTC").tz_convert(self.tz) if self.tz is not None else timestamp
+
+
+class CategoricalSketch:
+    """
+    Texto y booleanos: distintos con HyperLogLog y más frecuente con Misra-Gries.
+    Las columnas category se cuentan de forma exacta sobre sus códigos (pocas categorías).
+    """
+
+    def __init__(self, exact: bool, precision: int, capacity: int):
+        self.exact = exact
+        self.count = 0
+        self.frequencies = pd.Series(dtype=np.int64)
+        self.distinct = None if exact else HyperLogLog(precision)
+        self.frequent = None if exact else FrequentItems(capacity)
+
+    def update(self, series: pd.Series) -> None:
+        if self.exact:
+            counts = series.value_counts(dropna=True)
+            self.count += int(counts.sum())
+            self.frequencies = counts if self.frequencies.empty else self.frequencies.add(counts, fill_value=0).astype(np.int64)
+            return
+        # Una sola pasada de hashing por bloque: los valores distintos alimentan ambos sketches
+        codes, uniques = pd.factorize(series.to_numpy(dtype=object))
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        self.count += int(counts.sum())
+        self.distinct.update_hashes(pd.util.hash_array(np.asarray(uniques, dtype=object), categorize=False))
+        self.frequent.update_counts(np.asarray(uniques, dtype=object), counts)
+
+    def merge(self, other: "CategoricalSketch") -> "CategoricalSketch":
+        self.count += other.count
+        if self.exact:
+            self.frequencies = other.frequencies if self.frequencies.empty else self.frequencies.add(other.frequencies, fill_value=0).astype(np.int64)
+        else:
+            self.distinct.merge(other.distinct)
+            self.frequent.merge(other.frequent)
+        return self
+
+    def describe(self, labels) -> Dict[str, Any]:
+        stats = {"count": self.count, "unique": 0, "top": None, "freq": None}
+        if self.exact:
+            present = self.frequencies[self.frequencies > 0]
+            stats["unique"] = int(len(present))
+            top = (present.idxmax(), int(present.max())) if len(present) else None
+        else:
+            # La estimación nunca supera los valores no nulos
+            stats["unique"] = int(min(round(self.distinct.estimate()), self.count))
+            top = self.frequent.top()
+        if top is not None:
+            stats["top"] = top[0].item() if isinstance(top[0], np.generic) else top[0]
+            stats["freq"] = top[1]
+        return stats
+
+    def errors(self) -> Dict[str, float]:
+        if self.exact:
+            return {}
+        return {"unique_relative_error": self.distinct.relative_error, "freq_max_error": float(self.frequent.error)}
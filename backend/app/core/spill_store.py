@@ -0,0 +1,197 @@
+# spill_store.py
+# Persistencia columnar (Arrow IPC) de los DataFrames subidos, compartida entre workers y reinicios
+import os
+import time
+import uuid
+import hashlib
+import logging
+from typing import Dict, Any, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from app.core.ingest import is_derived_column
+
+logger = logging.getLogger(__name__)
+
+
+class ArrowSpillStore:
+    """
+    Guarda cada DataFrame una sola vez como archivo Arrow IPC sin compresión, de modo que
+    cualquier proceso pueda reabrirlo mediante memory mapping en lugar de volver a parsear
+    el CSV/XLSX original.
+
+    Los archivos que no se leen durante `ttl_seconds` se eliminan (0 desactiva el TTL).
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float = 0):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, file_id: str) -> str:
+        # El file_id incluye el nombre original del archivo: se usa un hash como nombre seguro
+        digest = hashlib.sha256(file_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{digest}.arrow")
+
+    def write(self, file_id: str, df: pd.DataFrame) -> bool:
+        """
+        Escribe el DataFrame en disco. Retorna False si Arrow no puede representarlo
+        (por ejemplo columnas object con tipos mezclados); en ese caso solo vive en memoria.
+        """
+        self.purge_expired()
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            logger.warning(f"No se pudo persistir '{file_id}' en formato Arrow: {e}")
+            return False
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"file_id": file_id.encode("utf-8"),
+        })
+        path = self.path_for(file_id)
+        # Escritura atómica: otros workers nunca ven un archivo a medio escribir
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        logger.info(f"Dataset '{file_id}' persistido en {path}")
+        return True
+
+    def read(self, file_id: str) -> Optional[pd.DataFrame]:
+        """
+        Reabre el dataset mediante memory mapping. Retorna None si no existe o expiró.
+        """
+        path = self.path_for(file_id)
+        if not os.path.exists(path):
+            return None
+        if self._is_expired(path):
+            self._remove_path(path)
+            return None
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = ipc.open_file(source).read_all()
+                df = table.to_pandas(split_blocks=True)
+        except (OSError, pa.ArrowInvalid) as e:
+            logger.warning(f"No se pudo leer el dataset persistido '{file_id}': {e}")
+            return None
+        # La fecha de modificación registra el último acceso (para el TTL)
+        os.utime(path, None)
+        return df
+
+    def describe(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Metadatos del archivo persistido sin cargar sus datos.
+        """
+        path = self.path_for(file_id)
+        if not os.path.exists(path) or self._is_expired(path):
+            return None
+        with pa.memory_map(path, "r") as source:
+            reader = ipc.open_file(source)
+            rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+            columns = len([name for name in reader.schema.names if not is_derived_column(name)])
+        stat = os.stat(path)
+        return {
+            "size_bytes": int(stat.st_size),
+            "rows": int(rows),
+            "columns": int(columns),
+            "created_at": stat.st_ctime,
+            "last_access": stat.st_mtime,
+        }
+
+    def write_alias(self, alias_id: str, file_id: str) -> None:
+        """
+        Registra alias_id como otro nombre del dataset file_id, visible para los demás workers.
+        """
+        path = self._alias_path(alias_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(file_id)
+        os.replace(tmp_path, path)
+
+    def read_alias(self, alias_id: str) -> Optional[str]:
+        """
+        file_id al que apunta un alias, o None si no existe o expiró.
+        """
+        path = self._alias_path(alias_id)
+        if not os.path.exists(path):
+            return None
+        if self._is_expired(path):
+            self._remove_path(path)
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                file_id = f.read()
+        except OSError:
+            return None
+        os.utime(path, None)
+        return file_id or None
+
+    def delete_alias(self, alias_id: str) -> bool:
+        return self._remove_path(self._alias_path(alias_id))
+
+    def _alias_path(self, alias_id: str) -> str:
+        return self.path_for(alias_id)[:-len(".arrow")] + ".alias"
+
+    def keep_alive(self, file_id: str, min_interval: float = 0) -> bool:
+        """
+        Comprueba que el dataset siga en disco sin leerlo y registra el acceso (renueva la fecha
+        que usa el TTL) si la última renovación, de cualquier proceso, tiene más de `min_interval`
+        segundos. Retorna False si no existe o expiró.
+        """
+        path = self.path_for(file_id)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        age = time.time() - mtime
+        if self.ttl_seconds and age > self.ttl_seconds:
+            return False
+        if age >= min_interval:
+            try:
+                os.utime(path, None)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def exists(self, file_id: str) -> bool:
+        path = self.path_for(file_id)
+        return os.path.exists(path) and not self._is_expired(path)
+
+    def delete(self, file_id: str) -> bool:
+        return self._remove_path(self.path_for(file_id))
+
+    def purge_expired(self) -> int:
+        """
+        Elimina del disco los datasets que superaron el TTL. Retorna cuántos se borraron.
+        """
+        if not self.ttl_seconds:
+            return 0
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith((".arrow", ".alias")) and self._is_expired(path) and self._remove_path(path):
+                removed += 1
+        if removed:
+            logger.info(f"{removed} datasets persistidos expirados por TTL")
+        return removed
+
+    def _is_expired(self, path: str) -> bool:
+        if not self.ttl_seconds:
+            return False
+        try:
+            return time.time() - os.path.getmtime(path) > self.ttl_seconds
+        except OSError:
+            return False
+
+    @staticmethod
+    def _remove_path(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
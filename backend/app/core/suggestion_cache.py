@@ -0,0 +1,185 @@
+# suggestion_cache.py
+# Caché de sugerencias de la IA indexada por la "huella" del esquema y estadísticas del dataset
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+from app.core.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Únicas estadísticas de describe que build_prompt usa; el resto no cambia el prompt
+PROMPT_STATS = ("count", "unique", "top", "freq", "mean", "std", "min", "max")
+
+
+def _normalize_value(value: Any, precision: int) -> Any:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        # Redondeo a cifras significativas: estadísticas casi idénticas comparten huella
+        return float(f"{float(value):.{precision}g}")
+    return str(value)
+
+
+def summary_fingerprint(summary: Dict[str, Any], precision: int = 3, salt: str = "") -> str:
+    """
+    Hash estable del resumen normalizado: columnas (en orden), dtypes y las estadísticas
+    de describe que usa build_prompt, redondeadas a `precision` cifras significativas, y las
+    cotas de error de un resumen aproximado (build_prompt las menciona).
+    `salt` permite invalidar la caché cuando cambian el modelo o las instrucciones.
+    """
+    columns = list(summary.get("columns", []))
+    dtypes = summary.get("dtypes", {})
+    describe = summary.get("describe", {})
+    approximate = summary.get("approximate") or {}
+    normalized = {
+        "columns": columns,
+        "dtypes": [str(dtypes.get(col, "unknown")) for col in columns],
+        "describe": [
+            [_normalize_value(describe.get(col, {}).get(stat), precision) for stat in PROMPT_STATS]
+            for col in columns
+        ],
+        "approximate": [
+            sorted((stat, _normalize_value(bound, precision)) for stat, bound in (approximate.get(col) or {}).items())
+            for col in columns
+        ],
+        "salt": salt,
+    }
+    payload = json.dumps(normalized, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SuggestionCache:
+    """
+    Dos niveles: LRU en memoria y, opcionalmente, archivos JSON en disco (compartidos entre
+    workers y reinicios). Un acierto en disco se promueve a memoria.
+
+    En disco se guardan como mucho `disk_max_entries` archivos (al escribir se eliminan los más
+    antiguos) y cada uno caduca `ttl_seconds` después de escribirse; 0 desactiva cada límite.
+    """
+
+    def __init__(self, max_entries: int, directory: Optional[str] = None, disk_max_entries: int = 0, ttl_seconds: float = 0):
+        self.memory = LRUCache(max_entries)
+        self.directory = directory or None
+        self.disk_max_entries = disk_max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        suggestions = self.memory.get(fingerprint)
+        if suggestions is not None:
+            return suggestions
+        suggestions = self._read_disk(fingerprint)
+        with self._lock:
+            if suggestions is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self.memory.put(fingerprint, suggestions)
+        return suggestions
+
+    def put(self, fingerprint: str, suggestions: List[Dict[str, Any]]) -> None:
+        self.memory.put(fingerprint, suggestions)
+        if not self.directory:
+            return
+        path = self._path(fingerprint)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(suggestions, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar la caché de sugerencias en disco: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.purge_disk()
+
+    def purge_disk(self) -> int:
+        """
+        Elimina del disco las entradas caducadas y, si se supera `disk_max_entries`, las más
+        antiguas. Retorna cuántas se borraron.
+        """
+        if not self.directory or not (self.ttl_seconds or self.disk_max_entries):
+            return 0
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort()
+        stale = []
+        if self.ttl_seconds:
+            cutoff = time.time() - self.ttl_seconds
+            stale = [path for mtime, path in entries if mtime < cutoff]
+            entries = entries[len(stale):]
+        if self.disk_max_entries and len(entries) > self.disk_max_entries:
+            stale.extend(path for _, path in entries[:len(entries) - self.disk_max_entries])
+        removed = sum(self._remove(path) for path in stale)
+        if removed:
+            with self._lock:
+                self.disk_evictions += removed
+            logger.info(f"{removed} entradas de la caché de sugerencias eliminadas del disco")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        memory = self.memory.stats()
+        with self._lock:
+            hits = memory["hits"] + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": memory["entries"],
+                "max_entries": memory["max_entries"],
+                "memory_hits": memory["hits"],
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "disk_enabled": self.directory is not None,
+                "disk_max_entries": self.disk_max_entries,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, f"{fingerprint}.json")
+
+    def _read_disk(self, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        if not self.directory:
+            return None
+        path = self._path(fingerprint)
+        try:
+            if self.ttl_seconds and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                self._remove(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Entrada de caché de sugerencias ilegible ({fingerprint}): {e}")
+            return None
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
@@ -0,0 +1,111 @@
+# tasks.py
+# Funciones que se ejecutan dentro de los pools de ejecutores (las de procesos deben ser importables y con argumentos serializables)
+import logging
+import time
+from typing import Dict, Any, List, Tuple, Optional
+import pandas as pd
+from fastapi import UploadFile
+from app.core.data_utils import read_file_to_df, read_path_to_df, get_dataframe_summary, aggregate_chart_frame, aggregate_many_for_chart
+from app.core.dataset_store import DatasetStore, dataframe_size_bytes
+from app.core.ingest import prepare_dataframe, compact_dtypes
+from app.core.spill_store import ArrowSpillStore
+from app.config import (
+    DATASET_SPILL_DIR, WORKER_DATASET_CACHE_MB, WORKER_DATASET_CACHE_TTL_SECONDS, AGGREGATE_WORKERS, DTYPE_COMPACTION, CATEGORY_MAX_RATIO, ARROW_STRINGS,
+    SUMMARY_PERCENTILES, SUMMARY_MODE, SUMMARY_APPROX_MIN_ROWS, SKETCH_CHUNK_ROWS
+)
+
+logger = logging.getLogger(__name__)
+
+# Caché propia de cada proceso de agregación; se llena leyendo el almacén persistente compartido
+_worker_store: Optional[DatasetStore] = None
+
+
+def _get_worker_store() -> DatasetStore:
+    global _worker_store
+    if _worker_store is None:
+        # WORKER_DATASET_CACHE_MB es el total de todos los procesos de agregación
+        _worker_store = DatasetStore(
+            max_bytes=int(WORKER_DATASET_CACHE_MB * 1024 * 1024 / max(1, AGGREGATE_WORKERS)),
+            ttl_seconds=WORKER_DATASET_CACHE_TTL_SECONDS,
+            spill=ArrowSpillStore(DATASET_SPILL_DIR)
+        )
+    return _worker_store
+
+
+def _ingest(df: pd.DataFrame, timings: Dict[str, float]) -> Tuple[pd.DataFrame, Dict[str, Any], Dict[str, float]]:
+    """
+    Prepara el DataFrame recién parseado (fechas, claves de periodo, tipos compactos)
+    y calcula su resumen, incluyendo la memoria antes y después de la compactación.
+    Añade a `timings` la duración en segundos de cada etapa (prepare, summary): se miden aquí
+    porque en modo procesos las métricas del proceso de trabajo no llegan al servidor.
+    """
+    start = time.perf_counter()
+    before_bytes = dataframe_size_bytes(df)
+    df = prepare_dataframe(df)
+    if DTYPE_COMPACTION:
+        df = compact_dtypes(df, category_max_ratio=CATEGORY_MAX_RATIO, arrow_strings=ARROW_STRINGS)
+    timings["prepare"] = time.perf_counter() - start
+    start = time.perf_counter()
+    # Archivos muy grandes: resumen aproximado con sketches (con cotas de error) en lugar del exacto
+    approximate = SUMMARY_MODE == "approx" or (SUMMARY_MODE == "auto" and len(df) >= SUMMARY_APPROX_MIN_ROWS)
+    summary = get_dataframe_summary(df, percentiles=SUMMARY_PERCENTILES, approximate=approximate, chunk_rows=SKETCH_CHUNK_ROWS)
+    summary["memory"] = {"before_bytes": before_bytes, "after_bytes": dataframe_size_bytes(df)}
+    timings["summary"] = time.perf_counter() - start
+    logger.info(f"Memoria del dataset: {before_bytes} → {summary['memory']['after_bytes']} bytes")
+    return df, summary, timings
+
+
+def parse_and_summarize(path: str, filename: str, sheet: Optional[str] = None) -> Tuple[pd.DataFrame, Dict[str, Any], Dict[str, float]]:
+    """
+    Parsea el archivo temporal (o una hoja, si es Excel) y calcula su resumen en una sola
+    llamada al proceso, para no enviar el DataFrame entre procesos dos veces.
+    Retorna también la duración de cada etapa (parse, prepare, summary).
+    """
+    start = time.perf_counter()
+    df = read_path_to_df(path, filename, sheet)
+    return _ingest(df, {"parse": time.perf_counter() - start})
+
+
+def parse_and_persist(path: str, filename: str, sheet: Optional[str], file_id: str) -> Tuple[Optional[pd.DataFrame], Dict[str, Any], Dict[str, float]]:
+    """
+    Igual que parse_and_summarize, pero el proceso de trabajo escribe el dataset en el almacén
+    persistente con `file_id` y solo retorna el resumen: el DataFrame no se serializa de vuelta
+    al servidor (las agregaciones lo reabren desde disco). Si Arrow no puede representarlo se
+    retorna el DataFrame para que el servidor lo guarde en memoria.
+    """
+    df, summary, timings = parse_and_summarize(path, filename, sheet)
+    start = time.perf_counter()
+    persisted = ArrowSpillStore(DATASET_SPILL_DIR).write(file_id, df)
+    timings["persist"] = time.perf_counter() - start
+    return (None if persisted else df), summary, timings
+
+
+def read_and_summarize(file: UploadFile, sheet: Optional[str] = None) -> Tuple[pd.DataFrame, Dict[str, Any], Dict[str, float]]:
+    """
+    Variante para pools de hilos: lee directamente el UploadFile sin copiarlo a disco.
+    """
+    start = time.perf_counter()
+    df = read_file_to_df(file, sheet)
+    return _ingest(df, {"parse": time.perf_counter() - start})
+
+
+def aggregate_stored(file_id: str, params: Dict[str, Any]) -> Tuple[pd.DataFrame, list]:
+    """
+    Agrega un dataset persistido. El DataFrame no viaja por el pool: el proceso lo reabre
+    desde el archivo Arrow (memory mapping) y lo mantiene en su caché. Solo vuelve el
+    resultado agregado (pequeño).
+    """
+    df = _get_worker_store().get(file_id)
+    if df is None:
+        raise LookupError(file_id)
+    return aggregate_chart_frame(df, params)
+
+
+def aggregate_many_stored(file_id: str, params_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Igual que aggregate_stored pero para varias gráficas del mismo dataset (ver aggregate_many_for_chart).
+    """
+    df = _get_worker_store().get(file_id)
+    if df is None:
+        raise LookupError(file_id)
+    return aggregate_many_for_chart(df, params_list)
@@ -1,10 +1,23 @@
 # main.py
 # Punto de entrada de la aplicación FastAPI para 'Análisis al Instante'
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.api import endpoints
+from app.core import executors, metrics, profiling
+from app.core.ai import close_llm_client
+from app.config import PROFILING_ENABLED
 
-app = FastAPI(title="Análisis al Instante", description="API para análisis y dashboard automático de datos con IA", version="0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Cerrar los pools de hilos/procesos y el cliente del LLM al apagar el servidor
+    executors.shutdown()
+    await close_llm_client()
+
+app = FastAPI(title="Análisis al Instante", description="API para análisis y dashboard automático de datos con IA", version="0.1", lifespan=lifespan)
 
 # Configuración de CORS (ajusta origins para producción)
 app.add_middleware(
@@ -13,11 +26,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[profiling.RESPONSE_HEADER, endpoints.ENGINE_HEADER, endpoints.UPGRADE_HEADER],
 )
 
 # Inclusión de rutas definidas en endpoints.py
 app.include_router(endpoints.router)
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    # Latencia por plantilla de ruta (/datasets/{file_id}), no por URL concreta
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
+if PROFILING_ENABLED:
+    # Solo se registra si está habilitado: sin él, las peticiones no pasan por este middleware
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        started = profiling.start(request.method, request.url.path) if profiling.requested(request.headers, request.query_params) else None
+        if started is None:
+            return await call_next(request)
+        profile, token = started
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            profiling.stop(profile, token)
+            await executors.run_in_stage("io", profiling.save_report, profile, status)
+        response.headers[profiling.RESPONSE_HEADER] = profile.id
+        return response
+
 @app.get("/")
 async def root():
     return {
@@ -30,6 +80,14 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Métricas en formato de texto de Prometheus: latencia por ruta, duración por etapa
+    (con clases de tamaño del dataset), almacén de datasets, cachés y llamadas al LLM en curso.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/deploy")
 async def root():
     return {
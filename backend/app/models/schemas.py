@@ -12,6 +12,8 @@ class DataFrameSummary(BaseModel):
     dtypes: Dict[str, str]
     describe: Dict[str, Any]
     info: str  # Por simplicidad, en texto plano, pero puede ser mejorado
+    memory: Optional[Dict[str, int]] = None  # Bytes en memoria antes/después de compactar tipos al subir
+    approximate: Optional[Dict[str, Dict[str, float]]] = None  # Cotas de error por columna si el resumen es aproximado
 
 class DataFrameSummaryWithId(DataFrameSummary):
     """
@@ -19,6 +21,22 @@ class DataFrameSummaryWithId(DataFrameSummary):
     """
     file_id: str
     filename: str
+    sheet: Optional[str] = None  # Hoja cargada (solo archivos Excel con hoja elegida)
+
+class SheetInfo(BaseModel):
+    """
+    Hoja de un archivo Excel; filas (sin encabezado) y columnas según la dimensión declarada.
+    """
+    name: str
+    rows: Optional[int] = None
+    columns: Optional[int] = None
+
+class WorkbookSheets(BaseModel):
+    """
+    Hojas de un archivo Excel, en orden.
+    """
+    filename: str
+    sheets: List[SheetInfo]
 
 class ChartParameters(BaseModel):
     """
@@ -30,6 +48,10 @@ class ChartParameters(BaseModel):
     hue: Optional[str] = None  # Opcional para agrupaciones
     agg_func: Optional[str] = None  # opción para suma, promedio, etc.
     chart_type: Optional[str] = None  # tipo de gráfico para casos especiales
+    max_points: Optional[int] = None  # límite de puntos (series con LTTB, scatter con muestreo)
+    tooltip: Optional[List[str]] = None  # columnas extra que se devuelven para los tooltips
+    limit: Optional[int] = None  # top-N de categorías del eje X (el resto va a "Otros"); 0 = sin límite
+    sort: Optional[str] = None  # "desc"/"asc" por valor o "x" por el eje X
 
 class ChartSuggestion(BaseModel):
     """
@@ -53,3 +75,74 @@ class ChartData(BaseModel):
     """
     data: List[Dict[str, Any]]
     columns: List[str] # columnas relevantes para la gráfica
+
+class ChartDataBatchRequest(BaseModel):
+    """
+    Request para obtener los datos de varias gráficas del mismo archivo en una sola llamada.
+    """
+    file_id: str
+    charts: List[ChartParameters]
+
+class ChartDataBatchItem(BaseModel):
+    """
+    Resultado de una gráfica del lote: sus datos o el error que impidió calcularla.
+    """
+    data: List[Dict[str, Any]] = []
+    columns: List[str] = []
+    error: Optional[str] = None
+
+class ChartDataBatch(BaseModel):
+    """
+    Resultados del lote, en el mismo orden que los parámetros recibidos.
+    """
+    results: List[ChartDataBatchItem]
+
+class AnalysisResult(BaseModel):
+    """
+    Resultado de /analyze: el file_id del archivo, las sugerencias y los datos de cada gráfica
+    sugerida (en el mismo orden). El resumen completo solo se incluye si se pide.
+    """
+    file_id: str
+    filename: str
+    sheet: Optional[str] = None
+    summary: Optional[DataFrameSummaryWithId] = None
+    suggestions: List[ChartSuggestion]
+    charts: List[ChartDataBatchItem]
+
+class DatasetEntryStats(BaseModel):
+    """
+    Estadísticas de acceso de un dataset guardado en el servidor.
+    """
+    size_bytes: int
+    rows: int
+    columns: int
+    hits: int
+    created_at: float
+    last_access: float
+    in_memory: bool = True  # False si solo está persistido en disco
+    alias_of: Optional[str] = None  # file_id del dataset original si este es un alias (subida repetida)
+
+class DatasetStoreStats(BaseModel):
+    """
+    Estado global del almacén de datasets (uso de memoria, expulsiones, etc.).
+    """
+    datasets: int
+    total_bytes: int
+    max_bytes: int
+    ttl_seconds: float
+    evictions: int
+    expirations: int
+    persistent: bool = False
+    aliases: int = 0
+    entries: Dict[str, DatasetEntryStats]
+
+class ProfileReportInfo(BaseModel):
+    """
+    Metadatos de un reporte de perfilado guardado (ver app/core/profiling.py).
+    """
+    request_id: str
+    method: str
+    path: str
+    status: int
+    duration_seconds: float
+    created: str
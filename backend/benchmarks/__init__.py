@@ -0,0 +1,2 @@
+# __init__.py
+# Benchmarks reproducibles de las rutas críticas del backend (ver benchmarks/run.py)
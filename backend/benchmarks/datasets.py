@@ -0,0 +1,84 @@
+# datasets.py
+# Generadores de datasets sintéticos para los benchmarks: tamaño y forma configurables,
+# deterministas (misma semilla → mismo archivo) y cacheados en disco entre ejecuciones
+import os
+from typing import Dict
+import numpy as np
+import pandas as pd
+
+# Número de columnas por forma: la mitad aproximada numéricas, el resto categóricas y fechas
+SHAPES = {
+    "narrow": 6,
+    "wide": 60,
+}
+REGIONS = np.array(["Norte", "Sur", "Este", "Oeste", "Centro"])
+PRODUCTS = np.array([f"Producto {i:02d}" for i in range(40)])
+
+
+def parse_size(text: str) -> int:
+    """
+    "1k" → 1000, "2.5m" → 2500000, "500" → 500.
+    """
+    text = text.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    number = text[:-1] if multiplier != 1 else text
+    return int(float(number) * multiplier)
+
+
+def format_size(rows: int) -> str:
+    for suffix, unit in (("m", 1_000_000), ("k", 1_000)):
+        if rows >= unit and rows % unit == 0:
+            return f"{rows // unit}{suffix}"
+    return str(rows)
+
+
+def make_dataset(rows: int, shape: str = "narrow", seed: int = 0) -> pd.DataFrame:
+    """
+    DataFrame sintético con las columnas típicas de una subida:
+    - "region" y "producto": categorías de baja cardinalidad;
+    - "cliente": identificadores de alta cardinalidad;
+    - "fecha": fechas como texto (se convierten al ingerir, igual que en un CSV real);
+    - "ventas" (float con ~1% de nulos) y "unidades" (enteros);
+    - en la forma "wide", columnas extra alternando métricas, enteros y categorías.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Forma '{shape}' no válida. Opciones: {', '.join(SHAPES)}")
+    rng = np.random.default_rng(seed)
+    ventas = rng.gamma(2.0, 50.0, rows).round(2)
+    ventas[rng.random(rows) < 0.01] = np.nan
+    dates = np.datetime64("2019-01-01") + rng.integers(0, 365 * 5, rows).astype("timedelta64[D]")
+    columns: Dict[str, object] = {
+        "region": REGIONS[rng.integers(0, len(REGIONS), rows)],
+        "producto": PRODUCTS[rng.integers(0, len(PRODUCTS), rows)],
+        "cliente": np.char.add("C", rng.integers(0, max(rows // 2, 1), rows).astype(str)),
+        "fecha": np.datetime_as_string(dates, unit="D"),
+        "ventas": ventas,
+        "unidades": rng.integers(1, 100, rows),
+    }
+    for i in range(SHAPES[shape] - len(columns)):
+        kind = i % 3
+        if kind == 0:
+            columns[f"metrica_{i}"] = rng.normal(100.0, 15.0, rows).round(3)
+        elif kind == 1:
+            columns[f"entero_{i}"] = rng.integers(0, 10_000, rows)
+        else:
+            columns[f"categoria_{i}"] = np.char.add("v", rng.integers(0, 25, rows).astype(str))
+    return pd.DataFrame(columns)
+
+
+def dataset_path(data_dir: str, rows: int, shape: str, seed: int = 0, extension: str = "csv") -> str:
+    """
+    Ruta del archivo del dataset; se genera solo si aún no existe.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{shape}_{format_size(rows)}_s{seed}.{extension}")
+    if not os.path.exists(path):
+        df = make_dataset(rows, shape, seed)
+        # Se escribe con otro nombre y se renombra: una ejecución interrumpida no deja un archivo a medias
+        partial = os.path.join(data_dir, f".partial_{os.path.basename(path)}")
+        if extension == "csv":
+            df.to_csv(partial, index=False)
+        else:
+            df.to_excel(partial, index=False, engine="openpyxl")
+        os.replace(partial, path)
+    return path
@@ -0,0 +1,187 @@
+# run.py
+# Benchmarks de las rutas críticas de /upload y /chart-data (sin red ni LLM):
+#   python -m benchmarks.run --sizes 1k,100k --output benchmarks/results/base.json
+#   python -m benchmarks.run --sizes 1k,100k --compare benchmarks/results/base.json --threshold 0.2
+# Se ejecuta desde backend/. Cada caso se mide varias veces (mediana) y una vez más con
+# tracemalloc para el pico de memoria asignada por Python/numpy.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from starlette.datastructures import UploadFile
+
+from app.core.ai import build_prompt
+from app.core.data_utils import read_file_to_df, get_dataframe_summary, aggregate_for_chart, _calculate_boxplot_stats
+from app.core.ingest import prepare_dataframe, compact_dtypes
+from app.core.local_suggestions import suggest_locally
+from benchmarks.datasets import SHAPES, dataset_path, format_size, parse_size
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), ".data")
+# Los Excel grandes tardan minutos en generarse y leerse: solo se miden hasta este número de celdas
+EXCEL_MAX_CELLS = 1_000_000
+
+# Una gráfica por cada rama de aggregate_for_chart
+CHART_CASES = {
+    "rows": {"x_axis": ""},
+    "aggregate": {"x_axis": "region", "y_axis": "ventas", "agg_func": "sum"},
+    "aggregate_mean_hue": {"x_axis": "region", "y_axis": "ventas", "hue": "producto", "agg_func": "mean"},
+    "aggregate_temporal": {"x_axis": "fecha", "y_axis": "ventas", "agg_func": "sum"},
+    "aggregate_high_cardinality": {"x_axis": "cliente", "y_axis": "ventas", "agg_func": "mean", "limit": 20},
+    "line_downsampled": {"x_axis": "fecha", "y_axis": "ventas", "chart_type": "line"},
+    "count": {"x_axis": "producto"},
+    "count_hue": {"x_axis": "producto", "hue": "region"},
+    "count_temporal": {"x_axis": "fecha"},
+    "scatter": {"x_axis": "ventas", "y_axis": "unidades", "chart_type": "scatter"},
+    "box": {"x_axis": "region", "y_axis": "ventas", "chart_type": "box"},
+    "box_temporal": {"x_axis": "fecha", "y_axis": "ventas", "chart_type": "box"},
+}
+
+
+def measure(func: Callable[[], Any], repeat: int, profile_memory: bool = True) -> Dict[str, float]:
+    """
+    Tiempo (mediana y mínimo de `repeat` ejecuciones) y pico de memoria de una función.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    result = {"median_s": statistics.median(timings), "min_s": min(timings)}
+    if profile_memory:
+        # Ejecución aparte: tracemalloc ralentiza el código medido
+        tracemalloc.start()
+        try:
+            func()
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def _read_upload(path: str) -> pd.DataFrame:
+    with open(path, "rb") as handle:
+        return read_file_to_df(UploadFile(file=handle, filename=os.path.basename(path)))
+
+
+def _ingest(raw: pd.DataFrame) -> pd.DataFrame:
+    # Mismo tratamiento que una subida (ver tasks._ingest, sin el resumen); prepare_dataframe
+    # modifica el DataFrame, por eso se trabaja sobre una copia
+    return compact_dtypes(prepare_dataframe(raw.copy()))
+
+
+def run_cases(rows: int, shape: str, data_dir: str, repeat: int, only: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    label = f"{shape}/{format_size(rows)}"
+    csv_path = dataset_path(data_dir, rows, shape)
+    raw = _read_upload(csv_path)
+    df = _ingest(raw)
+    summary = get_dataframe_summary(df)
+
+    cases: Dict[str, Callable[[], Any]] = {
+        "read_file_to_df/csv": lambda: _read_upload(csv_path),
+        "prepare_dataframe": lambda: _ingest(raw),
+        "get_dataframe_summary": lambda: get_dataframe_summary(df),
+        "get_dataframe_summary/no_percentiles": lambda: get_dataframe_summary(df, percentiles=False),
+        "get_dataframe_summary/approximate": lambda: get_dataframe_summary(df, approximate=True),
+        "calculate_boxplot_stats": lambda: _calculate_boxplot_stats(df["ventas"], df["region"]),
+        "build_prompt": lambda: build_prompt(summary),
+        "suggest_locally": lambda: suggest_locally(summary),
+    }
+    if rows * SHAPES[shape] <= EXCEL_MAX_CELLS:
+        xlsx_path = dataset_path(data_dir, rows, shape, extension="xlsx")
+        cases["read_file_to_df/xlsx"] = lambda: _read_upload(xlsx_path)
+    for name, params in CHART_CASES.items():
+        cases[f"aggregate_for_chart/{name}"] = lambda params=params: aggregate_for_chart(df, params)
+
+    results = {}
+    for name, func in cases.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        key = f"{label}/{name}"
+        results[key] = {"rows": rows, "shape": shape, **measure(func, repeat)}
+        print(f"{key:70s} {results[key]['median_s'] * 1000:10.2f} ms {results[key]['peak_mb']:10.1f} MB", flush=True)
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float,
+            min_seconds: float = 0.005) -> List[Dict[str, Any]]:
+    """
+    Casos más lentos (mediana) o con más memoria que el baseline por encima de `threshold`
+    (0.2 = 20%). Los casos de menos de `min_seconds` se ignoran en tiempo: su ruido supera el umbral.
+    """
+    regressions = []
+    for key, result in current.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        time_ratio = result["median_s"] / before["median_s"] if before["median_s"] else 1.0
+        if time_ratio > 1 + threshold and max(result["median_s"], before["median_s"]) >= min_seconds:
+            regressions.append({"case": key, "metric": "median_s", "before": before["median_s"], "after": result["median_s"], "ratio": time_ratio})
+        if before.get("peak_mb") and result.get("peak_mb") is not None:
+            memory_ratio = result["peak_mb"] / before["peak_mb"]
+            if memory_ratio > 1 + threshold and result["peak_mb"] - before["peak_mb"] >= 1:
+                regressions.append({"case": key, "metric": "peak_mb", "before": before["peak_mb"], "after": result["peak_mb"], "ratio": memory_ratio})
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks de /upload y /chart-data (sin LLM)")
+    parser.add_argument("--sizes", default="1k,100k", help="Filas separadas por comas (1k, 100k, 1m, 10m)")
+    parser.add_argument("--shapes", default=",".join(SHAPES), help=f"Formas: {', '.join(SHAPES)}")
+    parser.add_argument("--repeat", type=int, default=5, help="Ejecuciones por caso (se reporta la mediana)")
+    parser.add_argument("--only", default="", help="Solo los casos cuyo nombre contiene alguno de estos textos (separados por comas)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Directorio de los datasets generados")
+    parser.add_argument("--output", help="Guarda los resultados como baseline JSON")
+    parser.add_argument("--compare", help="Baseline JSON con el que comparar")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Regresión tolerada (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    only = [pattern for pattern in args.only.split(",") if pattern]
+    results: Dict[str, Dict[str, Any]] = {}
+    for shape in args.shapes.split(","):
+        for size in args.sizes.split(","):
+            results.update(run_cases(parse_size(size), shape.strip(), args.data_dir, args.repeat, only))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump({"environment": environment(), "results": results}, handle, indent=2)
+        print(f"Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        regressions = compare(results, baseline["results"], args.threshold)
+        missing = sorted(set(results) - set(baseline["results"]))
+        if missing:
+            print(f"{len(missing)} casos sin baseline (no se comparan)")
+        for regression in regressions:
+            print(f"REGRESIÓN {regression['case']} [{regression['metric']}]: "
+                  f"{regression['before']:.4f} → {regression['after']:.4f} (x{regression['ratio']:.2f})")
+        if regressions:
+            return 1
+        print(f"Sin regresiones por encima del {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
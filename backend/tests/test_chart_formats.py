@@ -0,0 +1,111 @@
+# test_chart_formats.py
+# Pruebas de los formatos de /chart-data: el JSON por columnas lleva los mismos valores que los registros
+import io
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.chart_formats import COLUMNAR_JSON, to_columnar_json, to_records
+from app.main import app
+
+
+def _records_from_columnar(payload: dict) -> list:
+    data = payload["data"]
+    return [{col: data[col][i] for col in payload["columns"]} for i in range(payload["rows"])]
+
+
+def _as_text(body: bytes):
+    # Números como texto: compara la representación enviada, no solo el valor tras parsear
+    return json.loads(body, parse_float=str, parse_int=str)
+
+
+def test_columnar_values_match_records_for_every_dtype():
+    frame = pd.DataFrame({
+        "ventas": [123136.71, 0.1 + 0.2, np.nan],
+        "ratio": np.array([0.1, 2.5, np.inf], dtype="float32"),
+        "unidades": np.array([1, -2, 3], dtype="int16"),
+        "grandes": np.array([1, 2, 2 ** 63], dtype="uint64"),
+        "fecha": pd.to_datetime(["2024-01-01", "2024-01-02 10:30:00.5", None], format="mixed"),
+        "fecha_utc": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03"]).tz_localize("UTC"),
+        "region": pd.Categorical(["Norte", "Sur", None]),
+        "nota": ["a", None, "c"],
+        "activo": [True, False, True],
+    })
+    columns = list(frame.columns)
+
+    payload = _as_text(to_columnar_json(frame, columns))
+
+    assert payload["columns"] == columns and int(payload["rows"]) == len(frame)
+    assert payload["data"]["ventas"] == ["123136.71", "0.30000000000000004", None]
+    assert payload["data"]["unidades"] == ["1", "-2", "3"]
+    assert payload["data"]["grandes"][2] == str(2 ** 63)
+    assert payload["data"]["fecha"] == ["2024-01-01T00:00:00", "2024-01-02T10:30:00.500000", None]
+    assert payload["data"]["fecha_utc"][0] == "2024-01-01T00:00:00Z"
+    # Valor a valor igual que los registros; NaN, infinitos y NaT pasan a null
+    for expected, actual in zip(to_records(frame), _records_from_columnar(json.loads(to_columnar_json(frame, columns)))):
+        for col in columns:
+            value = expected[col]
+            if pd.isna(value) or (isinstance(value, float) and math.isinf(value)):
+                assert actual[col] is None, col
+            elif isinstance(value, pd.Timestamp):
+                assert pd.Timestamp(actual[col]) == value, col
+            else:
+                assert actual[col] == value and type(actual[col]) is type(value), col
+
+
+def _csv() -> bytes:
+    rng = np.random.default_rng(7)
+    rows = 500
+    frame = pd.DataFrame({
+        "fecha": pd.date_range("2023-01-01", periods=rows, freq="D").strftime("%Y-%m-%d"),
+        "region": rng.choice(["Norte", "Sur", "Este", "Oeste"], rows),
+        "producto": [f"P{i % 40}" for i in range(rows)],
+        "ventas": np.round(rng.gamma(2.0, 50000.0, rows), 2),
+        "unidades": rng.integers(1, 500, rows),
+        "descuento": np.round(rng.random(rows) / 3, 3),
+    })
+    return frame.to_csv(index=False).encode()
+
+
+CHARTS = [
+    {"x_axis": "region", "y_axis": "ventas", "agg_func": "sum", "chart_type": "bar"},
+    {"x_axis": "region", "y_axis": "ventas", "agg_func": "mean", "chart_type": "bar", "hue": "producto"},
+    {"x_axis": "producto", "y_axis": "ventas", "agg_func": "sum", "chart_type": "bar", "limit": 10},
+    {"x_axis": "fecha", "y_axis": "ventas", "agg_func": "sum", "chart_type": "line"},
+    {"x_axis": "unidades", "y_axis": "ventas", "chart_type": "scatter", "tooltip": ["region", "fecha"]},
+    {"x_axis": "region", "y_axis": "descuento", "chart_type": "box"},
+    {"x_axis": "region", "chart_type": "pie"},
+]
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def file_id(client):
+    response = client.post("/upload", files={"file": ("ventas_formatos.csv", io.BytesIO(_csv()), "text/csv")})
+    assert response.status_code == 200, response.text
+    return response.json()["file_id"]
+
+
+@pytest.mark.parametrize("parameters", CHARTS, ids=lambda p: f"{p['chart_type']}-{p['x_axis']}")
+def test_chart_data_columnar_matches_records(client, file_id, parameters):
+    request = {"file_id": file_id, "parameters": parameters}
+    records = client.post("/chart-data", json=request)
+    columnar = client.post("/chart-data", json=request, headers={"Accept": COLUMNAR_JSON})
+
+    assert records.status_code == columnar.status_code == 200
+    assert columnar.headers["content-type"].startswith(COLUMNAR_JSON)
+    expected = _as_text(records.content)
+    payload = _as_text(columnar.content)
+    assert payload["columns"] == expected["columns"]
+    assert int(payload["rows"]) == len(expected["data"])
+    # Mismo texto por valor: sin ruido binario en los flotantes (123136.710000000006403)
+    assert _records_from_columnar({**payload, "rows": int(payload["rows"])}) == expected["data"]
@@ -0,0 +1,261 @@
+# test_llm_client.py
+# Pruebas del cliente del LLM (límite de concurrencia, reintentos, timeouts y plazo total) contra un servidor chat-completions local
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import endpoints
+from app.core import ai
+from app.main import app
+
+SUGGESTIONS = [
+    {"title": "Ventas por región", "chart_type": "bar", "parameters": {"x_axis": "region", "y_axis": "ventas", "agg_func": "sum"}, "insight": "Comparar regiones"},
+    {"title": "Reparto por región", "chart_type": "pie", "parameters": {"x_axis": "region"}, "insight": "Peso de cada región"},
+]
+
+
+class StubServer:
+    """
+    Servidor /v1/chat/completions mínimo. Cada petición consume la siguiente respuesta de la cola
+    (status, headers, retraso en segundos); con la cola vacía responde 200 sin retraso. Las
+    peticiones con stream=True reciben la respuesta como Server-Sent Events por fragmentos.
+    Registra la hora de llegada de cada petición y el máximo de peticiones simultáneas.
+    """
+
+    def __init__(self):
+        self.responses = deque()
+        self.arrivals = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["content-length"])))
+                with stub._lock:
+                    stub.arrivals.append(time.monotonic())
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                    status, headers, delay = stub.responses.popleft() if stub.responses else (200, {}, 0)
+                try:
+                    time.sleep(delay)
+                    if status == 200 and request.get("stream"):
+                        self._stream()
+                        return
+                    body = json.dumps(stub._body(status)).encode()
+                    self.send_response(status)
+                    for name, value in {**headers, "content-type": "application/json", "content-length": str(len(body))}.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente abandonó la petición (timeout)
+                    pass
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("transfer-encoding", "chunked")
+                self.end_headers()
+                content = json.dumps(SUGGESTIONS)
+                events = [
+                    {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                     "choices": [{"index": 0, "delta": {"content": content[i:i + 16]}, "finish_reason": None}]}
+                    for i in range(0, len(content), 16)
+                ]
+                for event in [*(f"data: {json.dumps(e)}" for e in events), "data: [DONE]"]:
+                    data = f"{event}\n\n".encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    @staticmethod
+    def _body(status: int):
+        if status != 200:
+            return {"error": {"message": f"error {status}", "type": "stub", "code": None}}
+        return {
+            "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(SUGGESTIONS)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubServer()
+    server.start()
+    # ai importa la configuración por nombre: se parchea en su propio módulo
+    monkeypatch.setattr(ai, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(ai, "OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setattr(ai, "LLM_MAX_CONCURRENCY", 8)
+    monkeypatch.setattr(ai, "LLM_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(ai, "LLM_DEADLINE_SECONDS", 10.0)
+    monkeypatch.setattr(ai, "LLM_MAX_RETRIES", 3)
+    monkeypatch.setattr(ai, "LLM_RETRY_BASE_DELAY_SECONDS", 0.01)
+    monkeypatch.setattr(ai, "LLM_RETRY_MAX_DELAY_SECONDS", 2.0)
+    yield server
+    server.stop()
+
+
+def _run(coro):
+    """
+    Ejecuta la corrutina en un event loop nuevo y cierra después el cliente compartido.
+    """
+    async def main():
+        try:
+            return await coro
+        finally:
+            await ai.close_llm_client()
+    return asyncio.run(main())
+
+
+def test_concurrency_is_capped_by_semaphore(stub, monkeypatch):
+    monkeypatch.setattr(ai, "LLM_MAX_CONCURRENCY", 2)
+    stub.responses.extend([(200, {}, 0.2)] * 6)
+    observed = []
+
+    async def main():
+        calls = asyncio.gather(*(ai.get_suggestions_from_llm("prompt") for _ in range(6)))
+        task = asyncio.ensure_future(calls)
+        while not task.done():
+            observed.append(ai.llm_requests_in_flight())
+            await asyncio.sleep(0.01)
+        return await task
+
+    results = _run(main())
+
+    assert [len(r) for r in results] == [2] * 6
+    assert stub.max_active == 2
+    assert max(observed) == 2
+    assert ai.llm_requests_in_flight() == 0
+
+
+def test_retries_429_honouring_retry_after(stub):
+    stub.responses.append((429, {"retry-after": "0.3"}, 0))
+
+    suggestions = _run(ai.get_suggestions_from_llm("prompt"))
+
+    assert suggestions[0]["title"] == SUGGESTIONS[0]["title"]
+    assert len(stub.arrivals) == 2
+    # El backoff propio es de centésimas: la espera viene de Retry-After
+    assert stub.arrivals[1] - stub.arrivals[0] >= 0.3
+
+
+def test_retries_5xx_then_succeeds(stub):
+    stub.responses.extend([(503, {}, 0), (502, {}, 0)])
+
+    suggestions = _run(ai.get_suggestions_from_llm("prompt"))
+
+    assert len(suggestions) == 2
+    assert len(stub.arrivals) == 3
+
+
+def test_gives_up_after_max_retries(stub, monkeypatch):
+    monkeypatch.setattr(ai, "LLM_MAX_RETRIES", 2)
+    stub.responses.extend([(500, {}, 0)] * 5)
+
+    with pytest.raises(Exception, match="Error llamando a OpenAI"):
+        _run(ai.get_suggestions_from_llm("prompt"))
+
+    assert len(stub.arrivals) == 3
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.responses.append((400, {}, 0))
+
+    with pytest.raises(Exception, match="Error llamando a OpenAI"):
+        _run(ai.get_suggestions_from_llm("prompt"))
+
+    assert len(stub.arrivals) == 1
+
+
+def test_per_attempt_timeout_is_retried(stub, monkeypatch):
+    monkeypatch.setattr(ai, "LLM_TIMEOUT_SECONDS", 0.3)
+    stub.responses.append((200, {}, 1.5))
+
+    start = time.monotonic()
+    suggestions = _run(ai.get_suggestions_from_llm("prompt"))
+
+    assert len(suggestions) == 2
+    assert len(stub.arrivals) == 2
+    # Se abandonó el primer intento al vencer su timeout, sin esperar la respuesta lenta
+    assert time.monotonic() - start < 1.5
+
+
+def test_stream_releases_slot_before_client_reads(stub, monkeypatch):
+    monkeypatch.setattr(ai, "LLM_MAX_CONCURRENCY", 1)
+
+    async def main():
+        suggestions = ai.stream_suggestions_from_llm("prompt")
+        first = await suggestions.__anext__()
+        # El cliente aún no lee el resto, pero la respuesta del LLM ya terminó: la plaza queda libre
+        for _ in range(100):
+            if ai.llm_requests_in_flight() == 0:
+                break
+            await asyncio.sleep(0.01)
+        in_flight = ai.llm_requests_in_flight()
+        other = await asyncio.wait_for(ai.get_suggestions_from_llm("prompt"), timeout=2)
+        rest = [sugg async for sugg in suggestions]
+        return first, rest, in_flight, other
+
+    first, rest, in_flight, other = _run(main())
+
+    assert [s["title"] for s in [first, *rest]] == [s["title"] for s in SUGGESTIONS]
+    assert in_flight == 0
+    assert len(other) == 2
+
+
+def test_deadline_returns_504_from_suggest(stub, monkeypatch):
+    monkeypatch.setattr(ai, "LLM_DEADLINE_SECONDS", 0.5)
+    stub.responses.append((200, {}, 3))
+    # Resumen único para no acertar en la caché de sugerencias
+    column = f"ventas_{uuid.uuid4().hex}"
+    summary = {
+        "columns": ["region", column],
+        "dtypes": {"region": "object", column: "int64"},
+        "describe": {column: {"count": 3, "mean": 2.0}},
+        "info": "3 filas",
+    }
+
+    with TestClient(app) as client:
+        start = time.monotonic()
+        response = client.post("/suggest", params={"engine": "llm"}, json=summary)
+
+    assert response.status_code == 504
+    assert "no respondió" in response.json()["detail"]
+    assert time.monotonic() - start < 3
+    assert endpoints.suggestion_cache.get(endpoints.summary_fingerprint(summary)) is None
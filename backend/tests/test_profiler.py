@@ -0,0 +1,107 @@
+# test_profiler.py
+# Pruebas del resumen aproximado: los sketches de bloques combinados (en paralelo) contra el perfil exacto
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core import profiler
+from app.core.profiler import profile_dataframe, sketch_dataframe
+
+ROWS = 60_000
+# Bloques pequeños: muchos sketches que se calculan en hilos y se combinan
+CHUNK_ROWS = 7_000
+QUARTILES = {"25%": 0.25, "50%": 0.5, "75%": 0.75}
+
+
+@pytest.fixture(scope="module")
+def frame():
+    rng = np.random.default_rng(42)
+    ventas = rng.gamma(2.0, 300.0, ROWS)
+    ventas[rng.random(ROWS) < 0.05] = np.nan
+    fechas = pd.Series(pd.Timestamp("2021-01-01") + pd.to_timedelta(rng.integers(0, 3 * 365 * 24, ROWS), unit="h"))
+    fechas[rng.random(ROWS) < 0.02] = pd.NaT
+    # Clientes con distribución de Zipf: hay un valor claramente más frecuente
+    clientes = pd.Series(rng.zipf(1.3, ROWS) % 20_000).map("C{:05d}".format).astype(object)
+    clientes[rng.random(ROWS) < 0.01] = None
+    return pd.DataFrame({
+        "ventas": ventas,
+        "unidades": rng.integers(-50, 5_000, ROWS).astype("int32"),
+        "fecha": fechas,
+        "cliente": clientes,
+        "region": pd.Categorical(rng.choice(["Norte", "Sur", "Este", "Oeste"], ROWS)),
+        "activo": rng.random(ROWS) < 0.7,
+    })
+
+
+@pytest.fixture(scope="module")
+def exact(frame):
+    describe, non_null = profile_dataframe(frame)
+    return describe, non_null
+
+
+@pytest.fixture(scope="module")
+def approx(frame):
+    return sketch_dataframe(frame, chunk_rows=CHUNK_ROWS)
+
+
+def _quantile_bounds(values: np.ndarray, q: float, rank_error: float):
+    # Cualquier valor entre los cuantiles exactos q ± error de rango es una respuesta válida
+    low, high = np.quantile(values, [max(q - rank_error, 0.0), min(q + rank_error, 1.0)])
+    return low, high
+
+
+def test_merged_chunks_are_deterministic(frame, approx, monkeypatch):
+    # Combinar en orden hace que el resultado no dependa de los hilos: igual que en serie
+    monkeypatch.setattr(profiler, "map_in_stage", lambda stage, fn, items: map(fn, items))
+    assert sketch_dataframe(frame, chunk_rows=CHUNK_ROWS) == approx
+
+
+def test_exact_statistics_match_profile(frame, exact, approx):
+    describe, non_null = exact
+    sketch_describe, sketch_non_null, _ = approx
+
+    assert sketch_non_null == non_null
+    for col in ("ventas", "unidades"):
+        for stat in ("count", "mean", "std", "min", "max"):
+            assert sketch_describe[col][stat] == pytest.approx(describe[col][stat], rel=1e-9), (col, stat)
+    for stat in ("count", "min", "max"):
+        assert sketch_describe["fecha"][stat] == describe["fecha"][stat], stat
+    # La media de fechas se acumula en float64 (ticks en ns): redondeo por debajo del microsegundo
+    assert abs(sketch_describe["fecha"]["mean"] - describe["fecha"]["mean"]) < pd.Timedelta(microseconds=1)
+    # Categorías y booleanos se cuentan de forma exacta
+    for col in ("region", "activo"):
+        for stat in ("count", "unique", "top", "freq"):
+            assert sketch_describe[col][stat] == describe[col][stat], (col, stat)
+
+
+def test_quartiles_within_reported_rank_error(frame, approx):
+    sketch_describe, _, errors = approx
+
+    for col in ("ventas", "unidades"):
+        values = frame[col].dropna().to_numpy(dtype=np.float64)
+        rank_error = errors[col]["quantile_rank_error"]
+        assert 0 < rank_error < 0.05
+        for label, q in QUARTILES.items():
+            low, high = _quantile_bounds(values, q, rank_error)
+            assert low <= sketch_describe[col][label] <= high, (col, label)
+
+    ticks = frame["fecha"].dropna().to_numpy().view(np.int64).astype(np.float64)
+    for label, q in QUARTILES.items():
+        low, high = _quantile_bounds(ticks, q, errors["fecha"]["quantile_rank_error"])
+        estimate = sketch_describe["fecha"][label].value
+        assert low - 1 <= estimate <= high + 1, label
+
+
+def test_text_column_within_reported_bounds(frame, exact, approx):
+    describe, _ = exact
+    sketch_describe, _, errors = approx
+    stats, bounds = sketch_describe["cliente"], errors["cliente"]
+    counts = frame["cliente"].value_counts()
+
+    assert stats["count"] == describe["cliente"]["count"]
+    # HyperLogLog: dentro de 3 desviaciones del error relativo típico
+    assert abs(stats["unique"] - describe["cliente"]["unique"]) <= 3 * bounds["unique_relative_error"] * describe["cliente"]["unique"]
+    # Misra-Gries: la frecuencia es una cota inferior del valor informado y subestima la máxima como mucho en el error
+    assert stats["freq"] <= counts[stats["top"]]
+    assert stats["freq"] >= counts.iloc[0] - bounds["freq_max_error"]
+    assert stats["top"] == describe["cliente"]["top"]
@@ -96,8 +96,9 @@ const ChartPreview = ({ chartType, parameters, fileId, description }) => {
     yKey = columns.find(col => col !== xKey && Object.prototype.hasOwnProperty.call(data[0] || {}, col)) || columns[1] || 'count';
   }
 
-  // Limitar datos para mejor visualización
-  const displayData = data.slice(0, 15);
+  // El servidor ya acota los datos (top-N de categorías con "Otros", LTTB en series):
+  // recortarlos aquí perdería la fila "Otros" y deformaría las series reducidas
+  const displayData = data;
   
   // Paleta de colores vibrante con azules, morados y rosados
   const colors = [
@@ -354,22 +355,15 @@ const ChartPreview = ({ chartType, parameters, fileId, description }) => {
     }
 
     case "scatter": {
-      // Tooltip personalizado para scatter que muestra solo los campos más relevantes
+      // Tooltip personalizado para scatter: X, Y y las columnas que el servidor devuelve además
+      // de los ejes (hue y las pedidas en parameters.tooltip); el resto no viene en la respuesta
       const CustomScatterTooltip = ({ active, payload }) => {
         if (active && payload && payload.length) {
           const data = payload[0].payload;
           
-          // Filtrar solo los campos más importantes: X, Y y máximo 2 campos adicionales
-          const priorityFields = [xKey, yKey];
-          const otherFields = Object.keys(data).filter(key => 
-            !priorityFields.includes(key) && 
-            typeof data[key] !== 'object' &&
-            !key.toLowerCase().includes('id') &&
-            !key.toLowerCase().includes('timestamp') &&
-            !key.toLowerCase().includes('date')
-          ).slice(0, 2); // Máximo 2 campos adicionales
-          
-          const fieldsToShow = [...priorityFields, ...otherFields];
+          const fieldsToShow = [xKey, yKey, parameters.hue, ...(parameters.tooltip || [])].filter(
+            (key, index, keys) => key && keys.indexOf(key) === index && Object.prototype.hasOwnProperty.call(data, key)
+          );
           
           return (
             <div style={{
@@ -571,6 +565,81 @@ const ChartPreview = ({ chartType, parameters, fileId, description }) => {
       );
     }
 
+    case "box":
+    case "boxplot": {
+      // Caja de Q1 a Q3 (barra apilada sobre una base transparente), mediana y bigotes como marcas
+      const boxData = displayData.map((row) => ({
+        ...row,
+        base: row.q1,
+        box: row.q3 - row.q1
+      }));
+      const BoxTooltip = ({ active, payload, label }) => {
+        if (active && payload && payload.length) {
+          const row = payload[0].payload;
+          const stats = [
+            ['Máximo', row.max],
+            ['Bigote superior', row.whisker_high],
+            ['Q3', row.q3],
+            ['Mediana', row.median],
+            ['Q1', row.q1],
+            ['Bigote inferior', row.whisker_low],
+            ['Mínimo', row.min],
+            ['Promedio', row.mean],
+          ];
+          return (
+            <div style={{
+              backgroundColor: 'rgba(26, 35, 50, 0.95)',
+              border: '1px solid rgba(255, 255, 255, 0.2)',
+              borderRadius: '8px',
+              padding: '12px',
+              fontSize: '12px',
+              color: '#ffffff',
+              backdropFilter: 'blur(10px)'
+            }}>
+              <div style={{ marginBottom: '8px', fontWeight: 'bold', color: '#64b5f6' }}>{label}</div>
+              {stats.map(([name, value]) => (
+                <div key={name} style={{ marginBottom: '4px' }}>
+                  <strong>{name}:</strong> {formatValue(value, parameters.y_axis || '')}
+                </div>
+              ))}
+              <div><strong>Registros:</strong> {row.count} ({row.outliers} atípicos)</div>
+            </div>
+          );
+        }
+        return null;
+      };
+      return (
+        <Box sx={{ bgcolor: 'rgb(25, 24, 44)', borderRadius: 2, p: 1 }}>
+          {renderDescription()}
+          <ResponsiveContainer width="100%" height={280}>
+            <ComposedChart data={boxData} margin={{ top: 10, right: 10, left: 0, bottom: 20 }}>
+              <CartesianGrid strokeDasharray="3 3" stroke="rgba(255, 255, 255, 0.08)" />
+              <XAxis 
+                dataKey={xKey}
+                angle={-45}
+                textAnchor="end"
+                height={80}
+                tick={{ fontSize: 11, fill: '#e0e0e0' }}
+                stroke="rgba(255, 255, 255, 0.3)"
+              />
+              <YAxis 
+                tick={{ fontSize: 11, fill: '#e0e0e0' }}
+                tickFormatter={(value) => isCurrencyColumn(parameters.y_axis || '') ? `$${value.toLocaleString()}` : value}
+                stroke="rgba(255, 255, 255, 0.3)"
+              />
+              <Tooltip content={<BoxTooltip />} />
+              <Bar dataKey="base" stackId="box" fill="transparent" legendType="none" />
+              <Bar dataKey="box" name="Q1 - Q3" stackId="box" fill={colors[3]} />
+              <Line dataKey="median" name="Mediana" stroke="none" dot={{ fill: colors[4], r: 4 }} />
+              <Line dataKey="whisker_high" name="Bigotes" stroke="none" dot={{ fill: colors[8], r: 3 }} />
+              <Line dataKey="whisker_low" stroke="none" legendType="none" dot={{ fill: colors[8], r: 3 }} />
+              <Legend wrapperStyle={{ fontSize: '12px' }} />
+            </ComposedChart>
+          </ResponsiveContainer>
+        </Box>
+      );
+    }
+
     case "composed":
     case "combo":
     case "mixed": {
@@ -1,27 +1,28 @@
 import { useRef, useState } from "react";
-import { uploadFileAndGetSuggestions } from "../services/api";
+import { listSheets, uploadFileAndGetSuggestions } from "../services/api";
 import { Box, Button, Typography, Paper } from "@mui/material";
 
 /**
  * Componente para subir archivos con drag-and-drop y Material UI.
+ * En archivos Excel con varias hojas deja elegir cuál analizar antes de subirla.
  */
 const FileUploader = ({ setLoading, setSuggestions, setError, setFileId, setFilename }) => {
   const fileInputRef = useRef();
   const [dragActive, setDragActive] = useState(false);
   const [fileName, setFileName] = useState("");
+  // Archivo Excel a la espera de que se elija hoja, y sus hojas ({ name, rows, columns })
+  const [pendingFile, setPendingFile] = useState(null);
+  const [sheets, setSheets] = useState([]);
 
-  // Cuando cambia el input invisible
-  const handleFileChange = async (e) => {
-    const file = e.target.files[0];
-    if (!file) return;
-
-    setFileName(file.name);
+  const uploadFile = async (file, sheet = null) => {
+    setPendingFile(null);
+    setSheets([]);
     setLoading(true);
     setSuggestions([]);
     setError(null);
 
     try {
-      const result = await uploadFileAndGetSuggestions(file);
+      const result = await uploadFileAndGetSuggestions(file, sheet);
       setSuggestions(result.suggestions);
       setFileId(result.fileId);
       setFilename(result.filename);
@@ -32,6 +33,39 @@ const FileUploader = ({ setLoading, setSuggestions, setError, setFileId, setFile
     }
   };
 
+  const handleFile = async (file) => {
+    setFileName(file.name);
+    setPendingFile(null);
+    setSheets([]);
+    if (!file.name.toLowerCase().endsWith(".xlsx")) {
+      await uploadFile(file);
+      return;
+    }
+
+    let workbookSheets = [];
+    try {
+      workbookSheets = await listSheets(file);
+    } catch (error) {
+      // Sin la lista de hojas se sube la primera, como antes
+      console.error("No se pudieron listar las hojas:", error);
+    }
+    if (workbookSheets.length > 1) {
+      setPendingFile(file);
+      setSheets(workbookSheets);
+    } else {
+      await uploadFile(file);
+    }
+  };
+
+  // Cuando cambia el input invisible
+  const handleFileChange = async (e) => {
+    const file = e.target.files[0];
+    // Permite volver a elegir el mismo archivo
+    e.target.value = "";
+    if (!file) return;
+    await handleFile(file);
+  };
+
   // Drag events:
   const handleDragOver = (e) => {
     e.preventDefault();
@@ -45,22 +79,7 @@ const FileUploader = ({ setLoading, setSuggestions, setError, setFileId, setFile
     e.preventDefault();
     setDragActive(false);
     if (e.dataTransfer.files && e.dataTransfer.files.length > 0) {
-      const file = e.dataTransfer.files[0];
-      setFileName(file.name);
-      setLoading(true);
-      setSuggestions([]);
-      setError(null);
-
-      try {
-        const result = await uploadFileAndGetSuggestions(file);
-        setSuggestions(result.suggestions);
-        setFileId(result.fileId);
-        setFilename(result.filename);
-        setLoading(false);
-      } catch (error) {
-        setLoading(false);
-        setError(error.message || "Error desconocido al procesar el archivo");
-      }
+      await handleFile(e.dataTransfer.files[0]);
     }
   };
 
@@ -139,6 +158,28 @@ const FileUploader = ({ setLoading, setSuggestions, setError, setFileId, setFile
             </Typography>
           </Box>
         )}
+        {pendingFile && sheets.length > 1 && (
+          <Box sx={{ mt: 2 }} onClick={(e) => e.stopPropagation()}>
+            <Typography variant="body2" sx={{ mb: 1.5, color: "text.secondary" }}>
+              El archivo tiene varias hojas. Elige cuál analizar:
+            </Typography>
+            <Box sx={{ display: "flex", flexWrap: "wrap", gap: 1, justifyContent: "center" }}>
+              {sheets.map((sheet) => (
+                <Button
+                  key={sheet.name}
+                  variant="outlined"
+                  color="primary"
+                  size="small"
+                  sx={{ textTransform: "none" }}
+                  onClick={() => uploadFile(pendingFile, sheet.name)}
+                >
+                  {sheet.name}
+                  {sheet.rows != null && ` (${sheet.rows.toLocaleString()} filas)`}
+                </Button>
+              ))}
+            </Box>
+          </Box>
+        )}
         <Button
           variant="contained"
           color="primary"
@@ -2,26 +2,44 @@ import axios from 'axios';
 
 const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8000'; // Ajusta si el backend está en otro puerto
 
+// Datos de gráficas que /analyze ya calculó, por fileId y parámetros (ver getChartData)
+let preloadedCharts = new Map();
+
+function chartRequestKey(fileId, parameters) {
+  return `${fileId}:${JSON.stringify(parameters)}`;
+}
+
 /**
- * Sube un archivo, obtiene sugerencias IA del backend.
- * Llama primero a /upload, luego a /suggest.
+ * Sube un archivo y obtiene sugerencias IA del backend en una sola petición a /analyze,
+ * que además calcula los datos de cada gráfica sugerida: las tarjetas del dashboard los
+ * reciben de getChartData sin volver a llamar al servidor.
+ * En archivos Excel, `sheet` elige la hoja (por defecto, la primera).
  */
-export async function uploadFileAndGetSuggestions(file) {
+export async function uploadFileAndGetSuggestions(file, sheet = null) {
   try {
-    // 1. Sube el archivo y obtiene el resumen con file_id
     const formData = new FormData();
     formData.append('file', file);
-    const uploadResp = await axios.post(`${API_BASE}/upload`, formData, {
+    if (sheet) {
+      formData.append('sheet', sheet);
+    }
+    const { data } = await axios.post(`${API_BASE}/analyze`, formData, {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
-    // 2. Envía el resumen a /suggest (sin file_id ni filename)
-    const { file_id, filename, ...summary } = uploadResp.data;
-    const suggestResp = await axios.post(`${API_BASE}/suggest`, summary);
+
+    // Mismos parámetros que pide ChartPreview para cada sugerencia
+    preloadedCharts = new Map();
+    data.suggestions.forEach((suggestion, index) => {
+      const chart = data.charts[index];
+      if (chart && !chart.error) {
+        const parameters = { ...suggestion.parameters, chart_type: suggestion.chart_type };
+        preloadedCharts.set(chartRequestKey(data.file_id, parameters), { data: chart.data, columns: chart.columns });
+      }
+    });
 
     return {
-      suggestions: suggestResp.data,
-      fileId: file_id,
-      filename: filename
+      suggestions: data.suggestions,
+      fileId: data.file_id,
+      filename: data.filename
     };
   } catch (error) {
     console.error('❌ Error completo:', error);
@@ -44,30 +62,76 @@ export async function uploadFileAndGetSuggestions(file) {
 }
 
 /**
- * Obtiene los datos procesados para una gráfica específica.
- * @param {string} fileId - ID único del archivo subido
- * @param {object} parameters - Parámetros de la gráfica (x_axis, y_axis, hue, agg_func)
- * @returns {Promise<{data: Array, columns: Array}>}
+ * Lista las hojas de un archivo Excel sin cargar sus datos: [{ name, rows, columns }].
  */
-export async function getChartData(fileId, parameters) {
+export async function listSheets(file) {
+  const formData = new FormData();
+  formData.append('file', file);
+  const response = await axios.post(`${API_BASE}/sheets`, formData, {
+    headers: { 'Content-Type': 'multipart/form-data' },
+  });
+  return response.data.sheets;
+}
+
+function chartDataErrorMessage(error) {
+  let errorMessage = "Error al obtener datos de la gráfica";
+
+  if (error.response) {
+    const detail = error.response.data?.detail || error.response.data?.message || "Error desconocido del servidor";
+    errorMessage = `Error del servidor: ${detail}`;
+  } else if (error.request) {
+    errorMessage = "No se pudo conectar con el servidor.";
+  } else {
+    errorMessage = `Error: ${error.message}`;
+  }
+
+  return errorMessage;
+}
+
+// Peticiones de gráficas pendientes por fileId: las que se piden en el mismo ciclo
+// (p. ej. todas las tarjetas del dashboard al montarse) se envían juntas a /chart-data/batch
+const pendingChartRequests = new Map();
+
+async function flushChartRequests(fileId) {
+  const queue = pendingChartRequests.get(fileId) || [];
+  pendingChartRequests.delete(fileId);
   try {
-    const response = await axios.post(`${API_BASE}/chart-data`, {
+    const response = await axios.post(`${API_BASE}/chart-data/batch`, {
       file_id: fileId,
-      parameters
+      charts: queue.map((item) => item.parameters)
+    });
+    response.data.results.forEach((result, index) => {
+      const { resolve, reject } = queue[index];
+      if (result.error) {
+        reject(new Error(`Error del servidor: ${result.error}`));
+      } else {
+        resolve({ data: result.data, columns: result.columns });
+      }
     });
-    return response.data;
   } catch (error) {
-    let errorMessage = "Error al obtener datos de la gráfica";
-
-    if (error.response) {
-      const detail = error.response.data?.detail || error.response.data?.message || "Error desconocido del servidor";
-      errorMessage = `Error del servidor: ${detail}`;
-    } else if (error.request) {
-      errorMessage = "No se pudo conectar con el servidor.";
-    } else {
-      errorMessage = `Error: ${error.message}`;
-    }
+    const errorMessage = chartDataErrorMessage(error);
+    queue.forEach(({ reject }) => reject(new Error(errorMessage)));
+  }
+}
 
-    throw new Error(errorMessage);
+/**
+ * Obtiene los datos procesados para una gráfica específica.
+ * Los que ya llegaron con /analyze se usan directamente; las llamadas simultáneas para el
+ * mismo archivo se agrupan en una sola petición.
+ * @param {string} fileId - ID único del archivo subido
+ * @param {object} parameters - Parámetros de la gráfica (x_axis, y_axis, hue, agg_func)
+ * @returns {Promise<{data: Array, columns: Array}>}
+ */
+export function getChartData(fileId, parameters) {
+  const preloaded = preloadedCharts.get(chartRequestKey(fileId, parameters));
+  if (preloaded) {
+    return Promise.resolve(preloaded);
   }
+  return new Promise((resolve, reject) => {
+    if (!pendingChartRequests.has(fileId)) {
+      pendingChartRequests.set(fileId, []);
+      setTimeout(() => flushChartRequests(fileId), 0);
+    }
+    pendingChartRequests.get(fileId).push({ parameters, resolve, reject });
+  });
 }